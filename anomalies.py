@@ -0,0 +1,261 @@
+# Online funnel-integrity checks run on every ingested batch
+#
+#   python anomalies.py --route MXN-USD          # alerts of a route as JSON lines
+#
+# The detector keeps per (region, platform, day) stage counters and, per
+# (region, platform), exponentially weighted baselines of daily created
+# volume and created -> funded conversion. A batch only adds its counts
+# (work proportional to the batch) and then checks the days it touched for:
+#   - stage inversions: a later stage counted more often than the one before
+#   - conversion drops: created -> funded far below its baseline
+#   - volume spikes: created transfers far above their baseline
+# A day is folded into its baseline once a later day of the same series has
+# arrived, and its counters are dropped then: the state holds the baselines
+# and the counters of each series' latest day only, so its size (and the
+# work per batch) does not grow with the history. Events arriving for a day
+# already folded are ignored. State and the alert feed (JSON lines) live next
+# to each route in the store; routes without a store are checked by
+# replaying their cube.
+import argparse
+import json
+import math
+import os
+import sys
+import weakref
+from datetime import datetime, timezone
+
+import pandas as pd
+import streamlit as st
+
+import config
+import cube
+import funnel
+
+STATE_NAME = 'anomalies.json'
+FEED_NAME = 'alerts.jsonl'
+
+# Cells with fewer events in the stages compared are not checked
+MIN_EVENTS = 10
+# Days folded into a baseline before drops and spikes are reported
+WARMUP_DAYS = 7
+
+
+class Detector:
+    """Stage counters and rolling baselines per (region, platform) series."""
+
+    def __init__(self, stage_names=funnel.STAGES, span_days=None, z=None):
+        self.stage_names = list(stage_names)
+        self.alpha = 2 / ((span_days or config.ANOMALY_SPAN_DAYS) + 1)
+        self.z = z or config.ANOMALY_Z
+        # series key -> {day not folded yet: [count per stage]}
+        self.counts = {}
+        # series key -> {'folded': last folded day, metric: [mean, variance, days]}
+        self.baselines = {}
+        # Alerts raised for days not folded yet, so re-checks do not repeat them
+        self.alerted = set()
+
+    @classmethod
+    def from_state(cls, state):
+        detector = cls(state['stage_names'])
+        detector.counts = state['counts']
+        detector.baselines = state['baselines']
+        detector.alerted = set(state['alerted'])
+        return detector
+
+    def state(self):
+        return {
+            'stage_names': self.stage_names,
+            'counts': self.counts,
+            'baselines': self.baselines,
+            'alerted': sorted(self.alerted),
+        }
+
+    def observe(self, cells):
+        """Add cube cells (see cube.count_cells) and return the alerts they raise."""
+        cells = cells[cells['event_name'].isin(self.stage_names)]
+        totals = cells.groupby(['region', 'platform', 'day', 'event_name'], observed=True)['count'].sum()
+        touched = {}
+        for (region, platform, day, stage), count in totals.items():
+            series, day = f'{region}|{platform}', pd.Timestamp(day).date().isoformat()
+            folded = self.baselines.get(series, {}).get('folded')
+            if folded is not None and day <= folded:
+                # Already part of the baselines
+                continue
+            row = self.counts.setdefault(series, {}).setdefault(day, [0] * len(self.stage_names))
+            row[self.stage_names.index(stage)] += int(count)
+            touched.setdefault(series, set()).add(day)
+
+        alerts = []
+        for series in sorted(touched):
+            # Each day is checked against the baselines of the days before it
+            for day in sorted(touched[series]):
+                self._fold(series, day)
+                alerts += self._check(series, day)
+            self._fold(series, max(self.counts[series]))
+        # Folded days are never checked again, so neither are their alerts
+        self.alerted = {key for key in self.alerted if self._counted(key)}
+        return alerts
+
+    def _counted(self, key):
+        _, region, platform, day, _ = key.split('|')
+        return day in self.counts.get(f'{region}|{platform}', {})
+
+    def _fold(self, series, until):
+        """Fold the series' days before `until` into its baselines and drop their counters."""
+        baseline = self.baselines.setdefault(series, {'folded': None, 'volume': [0.0, 0.0, 0], 'conversion': [0.0, 0.0, 0]})
+        counts = self.counts[series]
+        for day in sorted(day for day in counts if day < until):
+            if baseline['folded'] is not None and day <= baseline['folded']:
+                # Left by states saved before counters were dropped
+                del counts[day]
+                continue
+            created, funded = counts.pop(day)[:2]
+            self._update(baseline['volume'], created)
+            if created >= MIN_EVENTS:
+                self._update(baseline['conversion'], funded / created)
+            baseline['folded'] = day
+
+    def _update(self, metric, value):
+        mean, variance, days = metric
+        if days == 0:
+            metric[:] = [float(value), 0.0, 1]
+            return
+        difference = value - mean
+        increment = self.alpha * difference
+        metric[:] = [mean + increment, (1 - self.alpha) * (variance + difference * increment), days + 1]
+
+    def _check(self, series, day):
+        region, platform = series.split('|')
+        counts = self.counts[series][day]
+        baseline = self.baselines.get(series)
+        alerts = []
+
+        def alert(kind, message, **values):
+            key = f'{kind}|{series}|{day}|{values.get("stage", "")}'
+            if key in self.alerted:
+                return
+            self.alerted.add(key)
+            alerts.append({'kind': kind, 'region': region, 'platform': platform, 'day': day, 'message': message, **values})
+
+        for stage in range(1, len(self.stage_names)):
+            before, after = counts[stage - 1], counts[stage]
+            if after > before and after >= MIN_EVENTS:
+                alert(
+                    'stage_inversion', f"{after} '{self.stage_names[stage]}' vs {before} '{self.stage_names[stage - 1]}'",
+                    stage=self.stage_names[stage], value=after, baseline=before,
+                )
+
+        created, funded = counts[:2]
+        if baseline is None or created < MIN_EVENTS:
+            return alerts
+        mean, variance, days = baseline['conversion']
+        if days >= WARMUP_DAYS:
+            conversion = funded / created
+            # Binomial noise of a day with this many created transfers
+            spread = max(math.sqrt(variance), math.sqrt(mean * (1 - mean) / created))
+            if conversion < mean - self.z * spread:
+                alert(
+                    'conversion_drop', f'created -> funded {conversion:.0%} vs baseline {mean:.0%}',
+                    stage=self.stage_names[1], value=round(conversion, 4), baseline=round(mean, 4),
+                )
+        mean, variance, days = baseline['volume']
+        if days >= WARMUP_DAYS:
+            # Poisson noise of the baseline volume
+            spread = max(math.sqrt(variance), math.sqrt(mean))
+            if created > mean + self.z * spread:
+                alert(
+                    'volume_spike', f'{created} created vs baseline {mean:.0f}',
+                    stage=self.stage_names[0], value=created, baseline=round(mean, 1),
+                )
+        return alerts
+
+
+def replay(cells):
+    """Alerts for a whole cube, fed to a fresh detector one day at a time."""
+    detector = Detector()
+    alerts = []
+    for _, day_cells in cells.groupby('day', sort=True):
+        alerts += detector.observe(day_cells)
+    return alerts
+
+
+def _paths(route, store_dir):
+    import ingest
+    directory = ingest.route_dir(route, store_dir)
+    return os.path.join(directory, STATE_NAME), os.path.join(directory, FEED_NAME)
+
+
+def observe_batch(batch, route, store_dir):
+    """Check one ingested batch of a route; appends its alerts to the route's feed."""
+    state_path, feed_path = _paths(route, store_dir)
+    try:
+        with open(state_path) as f:
+            detector = Detector.from_state(json.load(f))
+    except OSError:
+        detector = Detector()
+    alerts = detector.observe(cube.count_cells(batch))
+    detected_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    with open(feed_path, 'a') as f:
+        for entry in alerts:
+            f.write(json.dumps({'route': route, 'detected_at': detected_at, **entry}) + '\n')
+    tmp_path = state_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(detector.state(), f)
+    os.replace(tmp_path, state_path)
+    return alerts
+
+
+def read_feed(route, store_dir=None):
+    import ingest
+    _, feed_path = _paths(route, store_dir or ingest.STORE_DIR)
+    try:
+        with open(feed_path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except OSError:
+        return None
+
+
+# Replays per (shared, cached) dataset, so reruns of the app do not repeat them
+_replays = weakref.WeakKeyDictionary()
+
+
+def route_alerts(route, data):
+    """The route's feed when its events were ingested, else a replay of `data`'s cube."""
+    alerts = read_feed(route)
+    if alerts is None:
+        if data not in _replays:
+            _replays[data] = [{'route': route, **entry} for entry in replay(data.cube)]
+        alerts = _replays[data]
+    return alerts
+
+
+def panel(route, data):
+    """Dashboard panel listing the route's funnel-integrity alerts, newest day first."""
+    alerts = route_alerts(route, data)
+    label = f"Funnel integrity alerts ({len(alerts)})" if alerts else "Funnel integrity alerts (none)"
+    with st.expander(label, expanded=False):
+        if not alerts:
+            st.caption("No stage inversions, conversion drops or volume spikes detected.")
+            return
+        frame = pd.DataFrame(alerts).sort_values(['day', 'kind'], ascending=[False, True])
+        kinds = frame['kind'].value_counts()
+        st.caption(", ".join(f"{count} {kind.replace('_', ' ')}" for kind, count in kinds.items()))
+        st.dataframe(frame[['day', 'kind', 'region', 'platform', 'message']], hide_index=True)
+        st.download_button(
+            "Download alerts (JSON lines)", ''.join(json.dumps(entry) + '\n' for entry in alerts),
+            file_name=f'{route}-alerts.jsonl', mime='application/json', on_click='ignore',
+        )
+
+
+def main():
+    import data_store
+    import filters
+    parser = argparse.ArgumentParser(description="Print a route's funnel-integrity alerts as JSON lines.")
+    parser.add_argument('--route', default=config.DEFAULT_ROUTE)
+    args = parser.parse_args()
+    for entry in route_alerts(args.route, data_store.load_dataset(args.route, selection=filters.Filters())):
+        sys.stdout.write(json.dumps(entry) + '\n')
+
+
+if __name__ == '__main__':
+    main()
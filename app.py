@@ -1,10 +1,19 @@
 import streamlit as st
+import anomalies
+import config
+import data_store
+import filters
+import instrument
 import home
 import individual_analysis
 import comparative_analysis
 import demand_analysis
 import relative_analysis
 import detailed_analysis
+import cohort_analysis
+import timing_analysis
+import refresh
+import warmup
 
 
 
@@ -15,20 +24,62 @@ pages = [
     ("Comparative Analysis", comparative_analysis.display),
     ("Demand Analysis", demand_analysis.display),
     ("Relative Analysis", relative_analysis.display),
-    ("Detailed Analysis", detailed_analysis.display)
+    ("Detailed Analysis", detailed_analysis.display),
+    ("Cohort Analysis", cohort_analysis.display),
+    ("Conversion Timing", timing_analysis.display)
 ]
 
-st.title("Wise internal data analysis for MXN-USD route")
+run = instrument.start_run()
 
-# Create tabs for each page
-tab_names = [page[0] for page in pages]
-tabs = st.tabs(tab_names)
+if config.WARMUP:
+    # Only the first run of a process builds anything
+    with st.spinner("Warming up every route..."):
+        warmup.warm_process()
 
+if config.REFRESH:
+    # Rebuilds run on the refresher's thread; script runs only pick up the published version
+    refresh.start()
 
-# Display content for each tab
-for i, tab in enumerate(tabs):
-    with tab:
-        pages[i][1]()
+# Every page loads only the selected route's events (see data_store.load_dataset)
+routes = data_store.available_routes()
+route = st.sidebar.selectbox(
+    "Route", routes, index=routes.index(config.DEFAULT_ROUTE) if config.DEFAULT_ROUTE in routes else 0, key='route'
+)
+
+# Filters apply to every tab; pages pick them up through data_store.load_dataset
+data = data_store.load_dataset(route, selection=filters.Filters())
+selection = filters.sidebar(data, route)
+if config.REFRESH:
+    refresh.sidebar(route, data)
+
+st.title(f"Wise internal data analysis for {route} route")
+anomalies.panel(route, data)
+
+if data.filtered(selection).cube.empty:
+    st.warning("No events match the selected filters.")
+    st.stop()
+
+if config.NAVIGATION == 'tabs':
+    # Create tabs for each page; every page runs on each rerun
+    tab_names = [page[0] for page in pages]
+    tabs = st.tabs(tab_names)
+
+    # Display content for each tab
+    for i, tab in enumerate(tabs):
+        with tab:
+            instrument.instrumented(pages[i][1], 'display')()
+else:
+    # Only the selected page runs its computations and renders
+    navigation = st.navigation(
+        [
+            st.Page(instrument.instrumented(display_function, 'display'), title=page_name, url_path=page_name.lower().replace(' ', '-'), default=(i == 0))
+            for i, (page_name, display_function) in enumerate(pages)
+        ],
+        position='top'
+    )
+    navigation.run()
+
+instrument.sidebar(run)
 
 
 
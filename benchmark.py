@@ -0,0 +1,250 @@
+# Stage-by-stage benchmark on synthetic events
+#
+#   python benchmark.py --sizes 100K 1M --output bench.json
+#   python benchmark.py --sizes 100K 1M --compare bench-baseline.json
+#   python benchmark.py --compare bench-baseline.json --current bench.json
+#
+# Events come from synthetic.py and are written once per size and seed to
+# data/.cache. Every stage of the app's pipeline is timed on its own: reading
+# the events, deriving the date keys, compacting, building the cube, funnel,
+# sketches and latency histograms, indexing the filters and applying one,
+# then each analysis section twice, with a cold render cache (aggregation
+# plus figure rendering) and a warm one (aggregation only).
+# Each stage keeps the fastest of --repeat runs. `--payloads` also lists the
+# bytes each chart sends to the browser as a PNG and as a Plotly spec (see
+# ROUTE_APP_CHART_BACKEND).
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+import config
+import cube
+import data_store
+import filters
+import funnel
+import ingest
+import latency
+import report
+import sections
+import sketches
+import synthetic
+import timekeys
+from render_cache import cache
+
+SIZES = {'100K': 100_000, '1M': 1_000_000, '10M': 10_000_000, '100M': 100_000_000}
+
+
+def parse_size(text):
+    text = text.upper()
+    if text in SIZES:
+        return SIZES[text]
+    multiplier = {'K': 1_000, 'M': 1_000_000}.get(text[-1], 1)
+    return int(float(text.rstrip('KM')) * multiplier)
+
+
+def size_label(rows):
+    for label, value in SIZES.items():
+        if value == rows:
+            return label
+    return str(rows)
+
+
+def synthetic_path(rows, seed):
+    os.makedirs(data_store.CACHE_DIR, exist_ok=True)
+    path = os.path.join(data_store.CACHE_DIR, f'synthetic-{rows}-{seed}.parquet')
+    if not os.path.exists(path):
+        synthetic.write_parquet(path, rows, seed)
+    return path
+
+
+def timed(fn, repeat=1):
+    """Result of the last call and the fastest wall time over `repeat` calls."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def _recorded_calls(recorder):
+    for name, args, kwargs, children in recorder.calls:
+        yield name, args, kwargs
+        for child in children or []:
+            yield from _recorded_calls(child)
+
+
+def chart_payloads(data):
+    """Bytes of every chart as the PNG the matplotlib backend sends and as the Plotly spec replacing it."""
+    import plotly.io
+    backend = config.CHART_BACKEND
+    payloads = []
+    try:
+        for _, module in report.PAGES:
+            for section in getattr(module, 'SECTIONS', []):
+                config.CHART_BACKEND = 'matplotlib'
+                images = [args[0] for name, args, _ in _recorded_calls(sections.record(section, data)) if name == 'image']
+                config.CHART_BACKEND = 'plotly'
+                figures = [
+                    (kwargs['key'][len('chart-'):], args[0]) for name, args, kwargs in _recorded_calls(sections.record(section, data))
+                    if name == 'plotly_chart' and kwargs.get('key', '').startswith('chart-')
+                ]
+                for image, (chart_id, figure) in zip(images, figures):
+                    # The spec as st.plotly_chart serializes it
+                    spec = plotly.io.to_json(figure, validate=False)
+                    payloads.append({'chart': chart_id, 'png_bytes': len(image), 'plotly_bytes': len(spec.encode())})
+    finally:
+        config.CHART_BACKEND = backend
+    return payloads
+
+
+def run(rows, seed=0, repeat=1, payloads=False):
+    """Seconds per stage for one dataset size."""
+    path = synthetic_path(rows, seed)
+    stages = {}
+
+    df, stages['ingest'] = timed(lambda: ingest.read_batch(path), repeat)
+
+    def derive_dates(frame):
+        days = timekeys.day_keys(frame['dt'])
+        return timekeys.week_keys(days), timekeys.month_keys(days)
+    _, stages['date_keys'] = timed(lambda frame=df: derive_dates(frame), repeat)
+
+    (events, user_ids), stages['compact'] = timed(lambda frame=df: data_store.compact_events(frame), repeat)
+    del df
+    cells, stages['cube'] = timed(lambda: cube.build_cube(events), repeat)
+    index, stages['funnel_index'] = timed(lambda: funnel.FunnelIndex.build(events), repeat)
+    precision = sketches.precision_for_error(config.SKETCH_ERROR)
+    user_sketches, stages['sketches'] = timed(lambda: sketches.UserSketches.build(events, user_ids, precision), repeat)
+
+    data = data_store.Dataset(events, user_ids, cube=cells)
+    data.funnel = index
+    data.sketches = user_sketches
+    data.latency, stages['latency'] = timed(lambda: latency.LatencyHistograms.build(index), repeat)
+    data.filter_index, stages['filter_index'] = timed(lambda: filters.BitmapIndex.build(events), repeat)
+
+    # One region over the first half of the days, as picked in the sidebar
+    days = cells['day']
+    selection = filters.Filters(days=(days.min(), days.min() + (days.max() - days.min()) / 2), region=[cells['region'].cat.categories[0]])
+
+    def apply_filters():
+        view = data_store.FilteredDataset(data, selection)
+        return view.cube, view.funnel, view.sketches
+    _, stages['filter'] = timed(apply_filters, repeat)
+    for _, module in report.PAGES:
+        for section in getattr(module, 'SECTIONS', []):
+            cold = warm = float('inf')
+            for _ in range(repeat):
+                cache.clear()
+                cold = min(cold, timed(lambda: sections.record(section, data))[1])
+                warm = min(warm, timed(lambda: sections.record(section, data))[1])
+            stages[f'{section.__name__}.aggregate'] = warm
+            stages[f'{section.__name__}.render'] = max(cold - warm, 0.0)
+
+    result = {
+        'rows': rows,
+        'size': size_label(rows),
+        'seed': seed,
+        'stages': {name: round(seconds, 6) for name, seconds in stages.items()},
+        'total_seconds': round(sum(stages.values()), 6),
+        # ru_maxrss is reported in kilobytes on Linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    if payloads:
+        result['payloads'] = chart_payloads(data)
+    return result
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=data_store.BASE_DIR
+        ).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': sys.version.split()[0],
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(baseline, current, tolerance=0.10, min_seconds=0.005):
+    """Stages slower than the baseline by more than `tolerance` (and `min_seconds`)."""
+    baseline_runs = {run['rows']: run for run in baseline['results']}
+    rows, regressions = [], []
+    for result in current['results']:
+        before = baseline_runs.get(result['rows'])
+        if before is None:
+            continue
+        for stage, seconds in result['stages'].items():
+            if stage not in before['stages']:
+                continue
+            base = before['stages'][stage]
+            change = (seconds - base) / base if base else 0.0
+            regressed = change > tolerance and seconds - base > min_seconds
+            rows.append((result['size'], stage, base, seconds, change, regressed))
+            if regressed:
+                regressions.append((result['size'], stage))
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time each pipeline stage on synthetic events.')
+    parser.add_argument('--sizes', nargs='+', default=['100K', '1M'], help='row counts, e.g. 100K 1M 10M 100M')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help='runs per stage; the fastest is kept')
+    parser.add_argument('--payloads', action='store_true', help='also compare the bytes each chart sends as a PNG and as a Plotly spec')
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--compare', metavar='BASELINE', help='flag stages slower than this stored result')
+    parser.add_argument('--current', help='compare this stored result instead of running the benchmark')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='allowed slowdown before a stage is flagged')
+    args = parser.parse_args()
+
+    if args.current:
+        with open(args.current) as f:
+            current = json.load(f)
+    else:
+        current = {'environment': environment(), 'results': []}
+        for size in args.sizes:
+            result = run(parse_size(size), args.seed, args.repeat, args.payloads)
+            current['results'].append(result)
+            print(f"{result['size']}: {result['total_seconds']:.2f}s over {len(result['stages'])} stages, peak RSS {result['peak_rss_mb']:,.0f} MB")
+            for stage, seconds in result['stages'].items():
+                print(f'  {stage:<26} {seconds:9.4f}s')
+            for entry in result.get('payloads', []):
+                print(
+                    f"  {entry['chart']:<50} PNG {entry['png_bytes'] / 1024:8.1f} KB  "
+                    f"Plotly {entry['plotly_bytes'] / 1024:7.1f} KB  {entry['png_bytes'] / entry['plotly_bytes']:5.1f}x smaller"
+                )
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(current, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows, regressions = compare(baseline, current, args.tolerance)
+        for size, stage, base, seconds, change, regressed in rows:
+            print(f"{size:>5} {stage:<26} {base:9.4f}s -> {seconds:9.4f}s {change:+7.1%}{'  REGRESSION' if regressed else ''}")
+        if regressions:
+            print(f'{len(regressions)} stage(s) regressed by more than {args.tolerance:.0%}')
+            sys.exit(1)
+        print('no regressions')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,427 @@
+# Chart helpers shared by the analysis pages
+#
+# Each helper takes an already aggregated Series/DataFrame plus display
+# options and writes to `out`: Streamlit itself, a column, or a
+# sections.Recorder. Figures are drawn on standalone matplotlib Figures (never
+# through the pyplot state machine), encoded once, released, and served from
+# the render cache while the aggregate, theme and size stay the same.
+# matplotlib and seaborn are only imported for the first figure actually
+# drawn, so a process serving cached charts never loads them. With
+# ROUTE_APP_CHART_BACKEND=plotly every chart is instead sent as a Plotly spec
+# built from the same aggregate and drawn, interactively, by the browser.
+import functools
+import hashlib
+import io
+import threading
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+import config
+import downsample
+import instrument
+from render_cache import cache
+
+# Matches st.pyplot's own savefig defaults
+SAVEFIG_OPTIONS = {'format': 'png', 'dpi': 200, 'bbox_inches': 'tight'}
+
+# Height in pixels per inch of figsize for Plotly charts, which stretch to the container's width
+PLOTLY_PIXELS_PER_INCH = 72
+
+# Seaborn palettes without a Plotly counterpart, and the Plotly colorscale
+# closest to a matplotlib colormap Plotly does not have
+_SEABORN_PALETTES = {
+    'pastel': ['#a1c9f4', '#ffb482', '#8de5a1', '#ff9f9b', '#d0bbff', '#debb9b', '#fab0e4', '#cfcfcf', '#fffea3', '#b9f2f0'],
+    'muted': ['#4878d0', '#ee854a', '#6acc64', '#d65f5f', '#956cb4', '#8c613c', '#dc7ec0', '#797979', '#d5bb67', '#82c6e2'],
+}
+_COLORSCALE_ALIASES = {'coolwarm': 'RdBu_r'}
+
+
+_theme_lock = threading.Lock()
+_theme_applied = False
+
+
+def apply_theme():
+    """Apply config.CHART_THEME to every figure; runs once per process."""
+    global _theme_applied
+    with _theme_lock:
+        if not _theme_applied:
+            import seaborn as sns
+            sns.set(style=config.CHART_THEME)
+            _theme_applied = True
+
+
+def fingerprint(data):
+    """Stable digest of an aggregate's values, index and column labels."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+    if isinstance(data, pd.DataFrame):
+        digest.update(repr(list(map(str, data.columns))).encode())
+    digest.update(repr((data.index.names, getattr(data, 'name', None))).encode())
+    return digest.hexdigest()
+
+
+def encode(fig):
+    buffer = io.BytesIO()
+    fig.savefig(buffer, **SAVEFIG_OPTIONS)
+    # Drop the artists now instead of waiting for the garbage collector
+    fig.clear()
+    return buffer.getvalue()
+
+
+def render(chart_id, data, draw, figsize, **options):
+    """PNG bytes for a chart, drawn with `draw(fig, data, **options)` on a cache miss."""
+    key = (chart_id, fingerprint(data), repr(sorted(options.items())), config.CHART_THEME, figsize)
+    payload = cache.get(key)
+    instrument.count('cache_hits' if payload is not None else 'cache_misses')
+    if payload is None:
+        from matplotlib.figure import Figure
+        apply_theme()
+        fig = Figure(figsize=figsize)
+        draw(fig, data, **options)
+        payload = encode(fig)
+        cache.put(key, payload)
+    return payload
+
+
+def is_empty(data, draw=None):
+    """True when an aggregate has nothing to draw: no cells or only missing values (or, for pies, zeros)."""
+    values = data.to_numpy()
+    if values.size == 0 or not pd.notna(values).any():
+        return True
+    if draw in (_draw_pie, _draw_pies):
+        # Pies divide by the total, which is zero when every wedge is
+        return not pd.DataFrame(data).select_dtypes('number').fillna(0).to_numpy().any()
+    return False
+
+
+def show(chart_id, data, draw, figsize, out=st, **options):
+    if is_empty(data, draw):
+        # Filters can leave a chart's events out entirely, e.g. a day without any created transfer
+        out.info("No data to chart for the selected filters.")
+        return
+    if config.CHART_BACKEND == 'plotly':
+        out.plotly_chart(figure(chart_id, data, draw, figsize, **options), width='stretch', key=f'chart-{chart_id}')
+        return
+    out.image(render(chart_id, data, draw, figsize, **options), width='stretch')
+
+
+def figure(chart_id, data, draw, figsize, **options):
+    """Plotly figure of the chart `draw` would render with matplotlib, built on a cache miss.
+
+    Cached figures are shared between sessions and must not be modified.
+    """
+    key = (chart_id, fingerprint(data), repr(sorted(options.items())), 'plotly', figsize)
+    fig = cache.get(key)
+    instrument.count('cache_hits' if fig is not None else 'cache_misses')
+    if fig is None:
+        import plotly.io
+        fig = _FIGURES[draw](data, figsize, **options)
+        cache.put(key, fig, size=len(plotly.io.to_json(fig, validate=False)))
+    return fig
+
+
+def _csv_bytes(data):
+    return data.to_csv().encode()
+
+
+def _label(ax, title=None, xlabel=None, ylabel=None, legend_title=None, rotation=None, grid=False):
+    if title is not None:
+        ax.set_title(title)
+    if xlabel is not None:
+        ax.set_xlabel(xlabel)
+    if ylabel is not None:
+        ax.set_ylabel(ylabel)
+    if legend_title is not None:
+        ax.legend(title=legend_title)
+    if rotation is not None:
+        ax.tick_params(axis='x', labelrotation=rotation)
+    if grid:
+        ax.grid(True)
+
+
+def _draw_line(fig, data, color=None, colormap=None, max_xticks=None, **labels):
+    ax = fig.subplots()
+    # pandas warns when both are passed, even as None
+    colors = {'color': color} if color is not None else {'colormap': colormap}
+    data.plot(kind='line', marker='o', ax=ax, **colors)
+    if max_xticks:
+        tick_interval = max(1, len(data.index) // max_xticks)
+        ax.set_xticks(range(0, len(data.index), tick_interval))
+        ax.set_xticklabels(data.index[::tick_interval])
+    _label(ax, **labels)
+    fig.tight_layout()
+
+
+def _draw_bar(fig, data, palette=None, colormap=None, stacked=False, **labels):
+    import seaborn as sns
+    ax = fig.subplots()
+    if palette is not None and isinstance(data, pd.Series):
+        sns.barplot(x=data.index, y=data.values, hue=data.index, palette=palette, legend=False, ax=ax)
+    elif palette is not None:
+        long = data.stack().rename('value').reset_index()
+        x, hue = data.index.name, data.columns.name
+        sns.barplot(data=long, x=x, y='value', hue=hue, errorbar=None, palette=palette, ax=ax)
+    else:
+        data.plot(kind='bar', stacked=stacked, colormap=colormap, ax=ax)
+    _label(ax, **labels)
+    fig.tight_layout()
+
+
+def _draw_pie(fig, data, palette='pastel', startangle=0, title=None):
+    import seaborn as sns
+    ax = fig.subplots()
+    data.plot(kind='pie', autopct='%1.1f%%', colors=sns.color_palette(palette), startangle=startangle, ax=ax)
+    ax.set_ylabel('')
+    if title is not None:
+        ax.set_title(title)
+
+
+def _draw_pies(fig, data, colors=None, title_template='{}'):
+    axes = fig.subplots(1, len(data), squeeze=False)[0]
+    for ax, (name, row) in zip(axes, data.iterrows()):
+        wedges, _, _ = ax.pie(row.values, labels=row.index, autopct='%1.1f%%', startangle=90, colors=colors)
+        ax.axis('equal')
+        ax.set_title(title_template.format(name))
+        for wedge in wedges:
+            wedge.set_edgecolor('white')
+
+
+def _draw_heatmap(fig, data, cmap=None, colorbar_label=None, fmt='.0f', **labels):
+    import seaborn as sns
+    ax = fig.subplots()
+    sns.heatmap(data, cmap=cmap, annot=True, fmt=fmt, cbar_kws={'label': colorbar_label}, ax=ax)
+    _label(ax, **labels)
+    fig.tight_layout()
+
+
+def _draw_forecast(fig, data, colormap=None, max_xticks=None, **labels):
+    import seaborn as sns
+    ax = fig.subplots()
+    series = list(dict.fromkeys(data.columns.get_level_values(0)))
+    colors = sns.color_palette(colormap, len(series))
+    positions = range(len(data.index))
+    for name, color in zip(series, colors):
+        frame = data[name]
+        ax.plot(positions, frame['actual'], marker='o', markersize=3, color=color, label=name)
+        ax.plot(positions, frame['forecast'], linestyle='--', color=color)
+        # Widest interval first, so narrower ones draw on top of it
+        for lower, upper, alpha in sorted(
+            ((column, column.replace('lower', 'upper'), 0.15) for column in frame.columns if column.startswith('lower')), reverse=True,
+        ):
+            ax.fill_between(positions, frame[lower], frame[upper], color=color, alpha=alpha, linewidth=0)
+    if max_xticks:
+        tick_interval = max(1, len(data.index) // max_xticks)
+        ax.set_xticks(range(0, len(data.index), tick_interval))
+        ax.set_xticklabels(data.index[::tick_interval])
+    _label(ax, **labels)
+    fig.tight_layout()
+
+
+def _colors(name, n):
+    """`n` Plotly colors of a seaborn palette or matplotlib colormap name, or None."""
+    import plotly.colors
+    if name is None:
+        return None
+    qualitative = {key.lower(): value for key, value in vars(plotly.colors.qualitative).items() if isinstance(value, list)}
+    palette = _SEABORN_PALETTES.get(name) or qualitative.get(name.lower())
+    if palette is not None:
+        return [palette[i % len(palette)] for i in range(n)]
+    scale = plotly.colors.get_colorscale(_COLORSCALE_ALIASES.get(name, name))
+    # An integer count of 1 divides by zero inside sample_colorscale
+    return plotly.colors.sample_colorscale(scale, n if n > 1 else [0.5])
+
+
+def _rgba(color, alpha):
+    import plotly.colors
+    red, green, blue = plotly.colors.unlabel_rgb(plotly.colors.convert_colors_to_same_type(color, 'rgb')[0][0])
+    return f'rgba({red:.0f}, {green:.0f}, {blue:.0f}, {alpha})'
+
+
+def _values(values):
+    return values.to_numpy(dtype=float, na_value=np.nan)
+
+
+def _x(index):
+    """Trace x arguments and x-axis settings for an index.
+
+    Evenly spaced dates become x0 and dx, so no x array is sent at all;
+    dates given as ISO strings or periods count as dates.
+    """
+    if isinstance(index, pd.PeriodIndex):
+        index = index.to_timestamp()
+    elif pd.api.types.is_string_dtype(index) or pd.api.types.is_object_dtype(index):
+        dates = pd.to_datetime(index, format='%Y-%m-%d', errors='coerce')
+        if len(index) and not dates.isna().any():
+            index = dates
+    if not isinstance(index, pd.DatetimeIndex):
+        return {'x': [str(label) for label in index]}, {'type': 'category'}
+    steps = np.diff(index.as_unit('ms').asi8)
+    if len(steps) > 1 and (steps == steps[0]).all():
+        # dx of a date axis is in milliseconds
+        return {'x0': index[0].isoformat(), 'dx': int(steps[0])}, {'type': 'date'}
+    return {'x': index.strftime('%Y-%m-%d').tolist()}, {'type': 'date'}
+
+
+def _layout(fig, figsize, xaxis=None, title=None, xlabel=None, ylabel=None, legend_title=None, rotation=None, grid=False, max_xticks=None):
+    # Plotly draws gridlines by default; `grid` is only meaningful for matplotlib
+    fig.update_layout(title_text=title, height=int(figsize[1] * PLOTLY_PIXELS_PER_INCH), legend_title_text=legend_title)
+    fig.update_xaxes(title_text=xlabel, tickangle=-rotation if rotation else None, nticks=max_xticks, **(xaxis or {}))
+    fig.update_yaxes(title_text=ylabel)
+    return fig
+
+
+def _line_figure(data, figsize, color=None, colormap=None, **labels):
+    import plotly.graph_objects as go
+    frame = data.to_frame() if isinstance(data, pd.Series) else data
+    x, xaxis = _x(frame.index)
+    # WebGL traces keep long series responsive; markers would only clutter them
+    webgl = len(frame) >= config.WEBGL_MIN_POINTS
+    trace = go.Scattergl if webgl else go.Scatter
+    colors = [color] * len(frame.columns) if color is not None else _colors(colormap, len(frame.columns))
+    fig = go.Figure([
+        trace(y=_values(frame[column]), name=str(column), mode='lines' if webgl else 'lines+markers', line_color=colors and colors[i], **x)
+        for i, column in enumerate(frame.columns)
+    ])
+    fig.update_layout(showlegend=isinstance(data, pd.DataFrame))
+    return _layout(fig, figsize, xaxis, **labels)
+
+
+def _bar_figure(data, figsize, palette=None, colormap=None, stacked=False, **labels):
+    import plotly.graph_objects as go
+    x, xaxis = _x(data.index)
+    if isinstance(data, pd.Series):
+        fig = go.Figure(go.Bar(y=_values(data), marker_color=_colors(palette or colormap, len(data)), showlegend=False, **x))
+    else:
+        colors = _colors(palette or colormap, len(data.columns))
+        fig = go.Figure([
+            go.Bar(y=_values(data[column]), name=str(column), marker_color=colors and colors[i], **x)
+            for i, column in enumerate(data.columns)
+        ])
+        fig.update_layout(barmode='stack' if stacked else 'group')
+    return _layout(fig, figsize, xaxis, **labels)
+
+
+def _pie_trace(labels, values, colors, startangle, **options):
+    import plotly.graph_objects as go
+    # matplotlib starts at 3 o'clock and turns counterclockwise; Plotly starts at 12
+    return go.Pie(
+        labels=[str(label) for label in labels], values=_values(values), marker_colors=colors, sort=False,
+        direction='counterclockwise', rotation=90 - startangle, texttemplate='%{percent:.1%}', **options,
+    )
+
+
+def _pie_figure(data, figsize, palette='pastel', startangle=0, title=None):
+    import plotly.graph_objects as go
+    fig = go.Figure(_pie_trace(data.index, data, _colors(palette, len(data)), startangle))
+    return _layout(fig, figsize, title=title)
+
+
+def _pies_figure(data, figsize, colors=None, title_template='{}'):
+    import plotly.graph_objects as go
+    fig = go.Figure([
+        _pie_trace(
+            data.columns, row, colors, 90, title_text=title_template.format(name), marker_line_color='white',
+            domain={'x': [i / len(data), (i + 1) / len(data)]},
+        )
+        for i, (name, row) in enumerate(data.iterrows())
+    ])
+    return _layout(fig, figsize)
+
+
+def _heatmap_figure(data, figsize, cmap=None, colorbar_label=None, fmt='.0f', **labels):
+    import plotly.graph_objects as go
+    fig = go.Figure(go.Heatmap(
+        z=_values(data), x=[str(column) for column in data.columns], y=[str(label) for label in data.index],
+        colorscale=cmap, colorbar_title_text=colorbar_label, texttemplate=f'%{{z:{fmt}}}',
+    ))
+    # First row on top, as seaborn draws it
+    fig.update_yaxes(type='category', autorange='reversed')
+    return _layout(fig, figsize, {'type': 'category'}, **labels)
+
+
+def _forecast_figure(data, figsize, colormap=None, **labels):
+    import plotly.graph_objects as go
+    series = list(dict.fromkeys(data.columns.get_level_values(0)))
+    x, xaxis = _x(data.index)
+    traces = []
+    for name, color in zip(series, _colors(colormap or 'Plotly', len(series))):
+        frame = data[name]
+        # Widest interval first, so narrower ones draw on top of it
+        for lower, upper in sorted(
+            ((column, column.replace('lower', 'upper')) for column in frame.columns if column.startswith('lower')), reverse=True,
+        ):
+            band = {'mode': 'lines', 'line_width': 0, 'showlegend': False, 'hoverinfo': 'skip', 'legendgroup': name}
+            traces.append(go.Scatter(y=_values(frame[upper]), **band, **x))
+            traces.append(go.Scatter(y=_values(frame[lower]), fill='tonexty', fillcolor=_rgba(color, 0.15), **band, **x))
+        traces.append(go.Scatter(y=_values(frame['actual']), name=name, mode='lines+markers', marker_size=4, line_color=color, legendgroup=name, **x))
+        traces.append(go.Scatter(
+            y=_values(frame['forecast']), name=f'{name} forecast', mode='lines', line={'color': color, 'dash': 'dash'},
+            legendgroup=name, showlegend=False, **x,
+        ))
+    return _layout(go.Figure(traces), figsize, xaxis, **labels)
+
+
+_FIGURES = {
+    _draw_line: _line_figure,
+    _draw_bar: _bar_figure,
+    _draw_pie: _pie_figure,
+    _draw_pies: _pies_figure,
+    _draw_heatmap: _heatmap_figure,
+    _draw_forecast: _forecast_figure,
+}
+
+
+def line(chart_id, data, figsize=(12, 6), max_points=None, export=False, out=st, **options):
+    """Line chart of a Series, or one line per DataFrame column, with point markers.
+
+    Series longer than `max_points` (by default a few pixels per point at the
+    figure's rendered width) are downsampled before drawing; `export` adds a
+    download of the full-resolution data.
+    """
+    if max_points is None and config.CHART_BACKEND == 'plotly':
+        # The browser zooms into the series, so only the payload bounds it
+        max_points = config.MAX_POINTS or config.PLOTLY_MAX_POINTS
+    elif max_points is None:
+        max_points = config.MAX_POINTS or int(figsize[0] * SAVEFIG_OPTIONS['dpi'] / config.PIXELS_PER_POINT)
+    shown = downsample.downsample(data, max_points, config.DOWNSAMPLE_METHOD)
+    show(chart_id, shown, _draw_line, figsize, out, **options)
+    if export and not is_empty(data):
+        out.download_button(
+            f"Download full-resolution data ({len(data):,} points)" if len(shown) < len(data) else "Download data",
+            data=functools.partial(_csv_bytes, data),
+            file_name=f'{chart_id}.csv',
+            mime='text/csv',
+            key=f'export-{chart_id}',
+            on_click='ignore',
+        )
+
+
+def forecast(chart_id, data, figsize=(12, 6), out=st, **options):
+    """Actual values, dashed forecasts and shaded intervals per series.
+
+    `data` has (series, field) columns; fields are `actual`, `forecast` and
+    `lower_<level>`/`upper_<level>` pairs, left empty where they do not apply.
+    """
+    show(chart_id, data, _draw_forecast, figsize, out, **options)
+
+
+def bar(chart_id, data, figsize=(10, 6), out=st, **options):
+    """Bar chart; a DataFrame gives grouped (or `stacked`) bars per column."""
+    show(chart_id, data, _draw_bar, figsize, out, **options)
+
+
+def pie(chart_id, data, figsize=(8, 5), out=st, **options):
+    """Pie chart of a Series with percentage labels."""
+    show(chart_id, data, _draw_pie, figsize, out, **options)
+
+
+def pies(chart_id, data, figsize=(18, 6), out=st, **options):
+    """One pie per DataFrame row, side by side."""
+    show(chart_id, data, _draw_pies, figsize, out, **options)
+
+
+def heatmap(chart_id, data, figsize=(10, 8), out=st, **options):
+    """Annotated heatmap of a DataFrame."""
+    show(chart_id, data, _draw_heatmap, figsize, out, **options)
@@ -0,0 +1,86 @@
+# Import necessary libraries
+import streamlit as st
+
+import charts
+import cohorts
+import data_store
+import sections
+
+def display():
+    # Load the dataset
+    data = data_store.load_dataset()
+
+    # Streamlit layout starts here
+    introduction()
+
+    sections.render_sections(SECTIONS, data)
+
+
+def introduction(out=st):
+    out.title("Cohort Analysis")
+    out.write("""
+    This section groups users into weekly cohorts by the week of their first event and follows each cohort over the following weeks:
+    how many of its users come back, and how many transfers they complete.
+    """)
+
+    out.header("15. Weekly Cohort Retention")
+
+
+def _by_week_start(matrix):
+    # Label cohorts by the Monday they start on
+    matrix.index = matrix.index.start_time.strftime('%Y-%m-%d')
+    return matrix
+
+
+def section_15_1(data, out=st):
+    out.subheader("15.1 Returning Users by Cohort")
+    out.markdown("**Type:** Heatmap")
+    out.markdown("**Description:** Each row is a cohort of users whose first event fell in that week; each column shows the percentage of the cohort active again a given number of weeks later. Week 0 (the whole cohort) is left out.")
+
+    weekly = data.weekly_cohorts()
+    retention = _by_week_start(cohorts.retention(weekly).drop(columns=0))
+    if retention.empty:
+        # A date range within one week has no later weeks to return in
+        out.info("The selected dates cover a single week, so no cohort has a later week to return in.")
+    else:
+        charts.heatmap('15.1-cohort-retention', retention, figsize=(12, 7), cmap='YlGnBu', fmt='.1f', colorbar_label='Returning Users (%)', title='Returning Users by Weekly Cohort', ylabel='Cohort (week starting)', xlabel='Weeks Since First Event', out=out)
+
+    out.markdown("""
+    ##### Insight:
+    - Only a few percent of each cohort come back in a later week, so most users transfer in a single week.
+    - Returns build up slowly, peaking four to six weeks after the first event rather than in the week right after it, which points to a roughly monthly transfer cadence.
+    - The cohorts of January return more in late January and early February, the same period in which transfers rose overall.
+    """)
+
+
+def section_15_2(data, out=st):
+    out.subheader("15.2 Completed Transfers by Cohort")
+    out.markdown("**Type:** Heatmap")
+    out.markdown("**Description:** The number of completed transfers ('Transfer Transferred') made by each cohort in each week since its first event.")
+
+    weekly = data.weekly_cohorts()
+    volume = _by_week_start(weekly['volume'].unstack('weeks_since'))
+    charts.heatmap('15.2-cohort-volume', volume, figsize=(12, 7), cmap='YlOrRd', colorbar_label='Completed Transfers', title='Completed Transfers by Weekly Cohort', ylabel='Cohort (week starting)', xlabel='Weeks Since First Event', out=out)
+
+
+def section_15_3(data, out=st):
+    out.subheader("15.3 Retention by Region and Platform")
+    out.markdown("**Type:** Heatmaps")
+    out.markdown("**Description:** Returning users as a percentage of their cohorts, pooled over all cohorts old enough to reach each week. Users are counted under the region and platform of their first event.")
+
+    col1, col2 = out.columns(2)
+    for col, column in [(col1, 'region'), (col2, 'platform')]:
+        retention = cohorts.pooled_retention(data.weekly_cohorts(column), column).drop(columns=0)
+        if retention.empty:
+            col.info(f"No {column} has a cohort with a later week in the selected dates.")
+            continue
+        charts.heatmap(f'15.3-retention-{column}', retention, figsize=(8, 4), cmap='YlGnBu', fmt='.1f', colorbar_label='Returning Users (%)', title=f'Retention by {column.capitalize()}', ylabel=column.capitalize(), xlabel='Weeks Since First Event', out=col)
+
+    out.markdown("""
+    ##### Insight:
+    - **North America** retains best, with over 4% of users back five to six weeks after their first event, while the **Other** region stays below 2%.
+    - Across platforms, **iOS** users return slightly more often than **Android** and **Web** users.
+    """)
+
+
+SECTIONS = [section_15_1, section_15_2, section_15_3]
@@ -0,0 +1,93 @@
+# Weekly cohort retention over the funnel's user-ordered events
+#
+# A user's cohort is the week of their first event. For every cohort and
+# number of weeks since, the matrix counts the users active again in that
+# week and the completed transfers they made. FunnelIndex already holds the
+# events sorted by (user, time), so cohorts, weeks since and the first event
+# of each (user, week) come from comparisons of neighbouring rows, and every
+# cell is a bincount: no per-user Python and no extra sort.
+import numpy as np
+import pandas as pd
+
+import funnel
+import timekeys
+
+COHORT_DIMENSIONS = funnel.FUNNEL_DIMENSIONS
+
+# Event counted as transfer volume
+VOLUME_EVENT = 'Transfer Transferred'
+
+
+def weekly_cohorts(index, by=None, volume_event=VOLUME_EVENT):
+    """Returning users and transfer volume per cohort week and weeks since.
+
+    `index` is a funnel.FunnelIndex. With `by` (any of region/platform/
+    experience) each user is counted under the values of their first event.
+    Returns a frame indexed by (*by, cohort, weeks_since) with `users` and
+    `volume` columns, holding only cells with activity.
+    """
+    split = [] if by is None else [by] if isinstance(by, str) else list(by)
+    for column in split:
+        if column not in COHORT_DIMENSIONS:
+            raise ValueError(f'Cannot split cohorts by {column!r}')
+    names = split + ['cohort', 'weeks_since']
+    if len(index.users) == 0:
+        return pd.DataFrame({'users': [], 'volume': []}, index=pd.MultiIndex.from_arrays([[]] * len(names), names=names), dtype=np.int64)
+
+    users = index.users
+    weeks = timekeys.week_keys(index.times // 86400)
+    new_user = np.r_[True, users[1:] != users[:-1]]
+    starts = np.flatnonzero(new_user)
+    # Row of the first event of each row's user
+    first = np.repeat(starts, np.diff(np.r_[starts, len(users)]))
+    cohort = weeks[first]
+    first_week = int(cohort.min())
+    n_weeks = int(weeks.max()) - first_week + 1
+
+    # Mixed-radix cell key: split values, then cohort, then weeks since
+    key = np.zeros(len(users), dtype=np.int64)
+    sizes = []
+    for column in split:
+        codes, categories = index.dimensions[column]
+        key = key * len(categories) + codes[first]
+        sizes.append(len(categories))
+    key = (key * n_weeks + (cohort - first_week)) * n_weeks + (weeks - cohort)
+    n_cells = int(np.prod(sizes, dtype=np.int64)) * n_weeks * n_weeks
+
+    # A (user, week) is counted once, at its first event
+    returning = new_user | np.r_[True, weeks[1:] != weeks[:-1]]
+    counts = np.bincount(key[returning], minlength=n_cells)
+    volume_stage = index.stage_names.index(volume_event)
+    volume = np.bincount(key[index.stages == volume_stage], minlength=n_cells)
+
+    cells = np.flatnonzero(counts)
+    ages, rest = cells % n_weeks, cells // n_weeks
+    cohorts, rest = rest % n_weeks + first_week, rest // n_weeks
+    columns = {}
+    for column, size in reversed(list(zip(split, sizes))):
+        columns[column] = pd.Categorical.from_codes(rest % size, index.dimensions[column][1])
+        rest = rest // size
+    columns = [columns[column] for column in split] + [timekeys.to_periods(cohorts, 'W'), ages]
+    result = pd.DataFrame({'users': counts[cells], 'volume': volume[cells]}, index=pd.MultiIndex.from_arrays(columns, names=names))
+    return result.sort_index()
+
+
+def retention(cohorts):
+    """Share of each cohort (in %) active again, as a cohort x weeks-since matrix."""
+    users = cohorts['users'].unstack('weeks_since')
+    return users.div(users[0], axis=0) * 100
+
+
+def pooled_retention(cohorts, by):
+    """Retention (in %) per `by` group and weeks since, pooled over cohorts.
+
+    Each weeks-since column only counts the cohorts old enough to have
+    reached it, so late cohorts do not drag the longer horizons down.
+    """
+    users = cohorts['users'].unstack('weeks_since', fill_value=0)
+    start = users.index.get_level_values('cohort').asi8
+    last = int((cohorts.index.get_level_values('cohort').asi8 + cohorts.index.get_level_values('weeks_since')).max())
+    reached = start[:, None] + users.columns.to_numpy()[None, :] <= last
+    returned = users.where(reached, 0).groupby(level=by, observed=True).sum()
+    sizes = pd.DataFrame(np.where(reached, users[[0]].to_numpy(), 0), index=users.index, columns=users.columns)
+    return returned / sizes.groupby(level=by, observed=True).sum() * 100
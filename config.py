@@ -0,0 +1,101 @@
+# Runtime switches, overridable through environment variables
+import os
+
+
+def _flag(name, default):
+    return os.environ.get(name, default).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+# 'pages' renders only the selected page; 'tabs' renders every page on each rerun
+NAVIGATION = os.environ.get('ROUTE_APP_NAVIGATION', 'pages')
+
+# Wrap each numbered section in st.fragment so it can rerun on its own
+FRAGMENTS = _flag('ROUTE_APP_FRAGMENTS', '1')
+
+# How a page computes its sections: 'serial' runs them one after another, each
+# as a fragment when FRAGMENTS is on; 'threads' runs them concurrently on a
+# shared pool of SECTION_WORKERS threads and replays them in page order as
+# static output, so a widget in any section reruns the whole page
+SECTION_EXECUTION = os.environ.get('ROUTE_APP_SECTION_EXECUTION', 'serial')
+SECTION_WORKERS = int(os.environ.get('ROUTE_APP_SECTION_WORKERS', str(os.cpu_count() or 1)))
+
+# Distinct-user counts: 'exact' scans user ids, 'sketch' merges HyperLogLog registers
+UNIQUE_USERS = os.environ.get('ROUTE_APP_UNIQUE_USERS', 'exact')
+
+# Target relative standard error of the HyperLogLog sketches
+SKETCH_ERROR = float(os.environ.get('ROUTE_APP_SKETCH_ERROR', '0.02'))
+
+# Days after entering the funnel within which later stages still count
+FUNNEL_WINDOW_DAYS = float(os.environ.get('ROUTE_APP_FUNNEL_WINDOW_DAYS', '30'))
+
+# Route (source-target currency pair) shown first; the bundled workbook holds its events
+DEFAULT_ROUTE = os.environ.get('ROUTE_APP_ROUTE', 'MXN-USD')
+
+# Event source: 'workbook' (default route only), 'store' (see ingest.py) or
+# 'auto' (a route's store once it exists)
+DATA_SOURCE = os.environ.get('ROUTE_APP_DATA_SOURCE', 'auto')
+
+# Query engine: 'pandas' (events in memory) or 'duckdb' (SQL over the parquet
+# files, see sql_backend.py; needs the duckdb package)
+BACKEND = os.environ.get('ROUTE_APP_BACKEND', 'pandas')
+
+# Funnel-integrity alerts (see anomalies.py): span in days of the rolling
+# baselines and how many standard deviations from them count as an anomaly
+ANOMALY_SPAN_DAYS = float(os.environ.get('ROUTE_APP_ANOMALY_SPAN_DAYS', '14'))
+ANOMALY_Z = float(os.environ.get('ROUTE_APP_ANOMALY_Z', '3'))
+
+# Demand forecasts (see forecast.py): days ahead and the half-life in days of
+# the weights that favour recent history in every fit
+FORECAST_DAYS = int(os.environ.get('ROUTE_APP_FORECAST_DAYS', '14'))
+FORECAST_HALFLIFE_DAYS = float(os.environ.get('ROUTE_APP_FORECAST_HALFLIFE_DAYS', '14'))
+
+# Publish loaded events as memory-mapped snapshots (see snapshot.py) that every
+# process and session attaches to instead of holding its own copy
+SNAPSHOTS = _flag('ROUTE_APP_SNAPSHOTS', '1')
+
+# Build every route's dataset and aggregates once per process, at the app's
+# first script run (see warmup.py)
+WARMUP = _flag('ROUTE_APP_WARMUP', '0')
+
+# Rebuild the dataset, aggregates and (with PRERENDER) unfiltered charts of
+# recently loaded routes in a background thread when their source changes,
+# checked every REFRESH_SECONDS, and swap each new version in once it is
+# complete (see refresh.py). Prerendered charts share the render cache with
+# the ones sessions are viewing, so prerendering is off by default.
+REFRESH = _flag('ROUTE_APP_REFRESH', '1')
+REFRESH_SECONDS = float(os.environ.get('ROUTE_APP_REFRESH_SECONDS', '30'))
+REFRESH_PRERENDER = _flag('ROUTE_APP_REFRESH_PRERENDER', '0')
+
+# Stream workbooks through openpyxl's read-only mode: 'on', 'off' or 'auto' (by file size)
+STREAMING_XLSX = os.environ.get('ROUTE_APP_STREAMING_XLSX', 'auto')
+STREAMING_XLSX_MIN_BYTES = int(os.environ.get('ROUTE_APP_STREAMING_XLSX_MIN_BYTES', str(50 * 1024 * 1024)))
+XLSX_CHUNK_ROWS = int(os.environ.get('ROUTE_APP_XLSX_CHUNK_ROWS', '50000'))
+
+# Chart rendering: 'matplotlib' draws PNGs on the server, 'plotly' sends each
+# chart as an interactive Plotly spec drawn in the browser; line series of at
+# least WEBGL_MIN_POINTS points use WebGL traces, and series are downsampled to
+# PLOTLY_MAX_POINTS (or MAX_POINTS) instead of the figure's pixel width
+CHART_BACKEND = os.environ.get('ROUTE_APP_CHART_BACKEND', 'matplotlib')
+WEBGL_MIN_POINTS = int(os.environ.get('ROUTE_APP_WEBGL_MIN_POINTS', '1000'))
+PLOTLY_MAX_POINTS = int(os.environ.get('ROUTE_APP_PLOTLY_MAX_POINTS', '50000'))
+
+# Seaborn style applied to every matplotlib chart; part of the render cache key
+CHART_THEME = os.environ.get('ROUTE_APP_CHART_THEME', 'whitegrid')
+
+# Memory cap of the encoded-figure cache shared by all sessions of a process
+RENDER_CACHE_MB = int(os.environ.get('ROUTE_APP_RENDER_CACHE_MB', '64'))
+
+# Time-series downsampling: 'lttb' or 'minmax'; MAX_POINTS=0 derives the cap from
+# the chart's rendered width at PIXELS_PER_POINT
+DOWNSAMPLE_METHOD = os.environ.get('ROUTE_APP_DOWNSAMPLE', 'lttb')
+MAX_POINTS = int(os.environ.get('ROUTE_APP_MAX_POINTS', '0'))
+PIXELS_PER_POINT = int(os.environ.get('ROUTE_APP_PIXELS_PER_POINT', '4'))
+
+# Instrumentation of pages and sections (see instrument.py); tracemalloc adds
+# noticeable overhead, so memory tracking is a separate switch, and it runs
+# sections serially whatever SECTION_EXECUTION says
+INSTRUMENT = _flag('ROUTE_APP_INSTRUMENT', '0')
+INSTRUMENT_MEMORY = _flag('ROUTE_APP_INSTRUMENT_MEMORY', '0')
+# Optional JSON-lines log and Prometheus textfile the measurements go to
+INSTRUMENT_LOG = os.environ.get('ROUTE_APP_INSTRUMENT_LOG', '')
+INSTRUMENT_PROMETHEUS = os.environ.get('ROUTE_APP_INSTRUMENT_PROMETHEUS', '')
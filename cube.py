@@ -0,0 +1,50 @@
+# Precomputed event-count cube that every chart rolls up from
+import pandas as pd
+
+import timekeys
+
+CUBE_DIMENSIONS = ['day', 'region', 'platform', 'experience', 'event_name']
+
+
+def count_cells(df):
+    """Event counts per (day, region, platform, experience, event_name) cell."""
+    day = pd.Series(df['day'] if 'day' in df else timekeys.day_keys(df['dt']), index=df.index, name='day')
+    cells = (
+        df.groupby([day, 'region', 'platform', 'experience', 'event_name'], observed=True)
+        .size()
+        .rename('count')
+        .reset_index()
+    )
+    cells['day'] = timekeys.to_dates(cells['day'])
+    return cells
+
+
+def add_period_keys(cube):
+    days = timekeys.day_keys(cube['day'])
+    cube['month'] = timekeys.to_periods(timekeys.month_keys(days), 'M')
+    cube['week'] = timekeys.to_periods(timekeys.week_keys(days), 'W')
+    return cube
+
+
+def build_cube(df):
+    """Count events once per (day, region, platform, experience, event_name).
+
+    The cube is the only pass over the raw events; charts sum over it, so
+    their cost follows the number of cells rather than the number of events.
+    """
+    return add_period_keys(count_cells(df))
+
+
+def select(cube, **where):
+    """Cube cells matching every column=value (or column=[values]) filter."""
+    for column, value in where.items():
+        if isinstance(value, (list, tuple, set, pd.Index)):
+            cube = cube[cube[column].isin(value)]
+        else:
+            cube = cube[cube[column] == value]
+    return cube
+
+
+def rollup(cube, by, **where):
+    """Event counts grouped by `by`, optionally restricted with `where` filters."""
+    return select(cube, **where).groupby(by, observed=True)['count'].sum()
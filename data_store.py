@@ -0,0 +1,569 @@
+# Shared event-store loader used by every analysis page
+import argparse
+import functools
+import hashlib
+import itertools
+import json
+import os
+import resource
+import threading
+import time
+from collections import OrderedDict
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandas.api.types import union_categoricals
+import streamlit as st
+
+import cohorts
+import config
+import cube
+import filters
+import funnel
+import instrument
+import latency
+import sketches
+import snapshot
+import timekeys
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# File path
+DATA_PATH = os.path.join(BASE_DIR, 'data', 'funnel events regional - Data.xlsx')
+
+# Columnar copies of the workbook live next to it, one parquet file per source
+CACHE_DIR = os.path.join(BASE_DIR, 'data', '.cache')
+
+EVENT_COLUMNS = ['dt', 'event_name', 'user_id', 'region', 'platform', 'experience']
+CATEGORICAL_COLUMNS = ['event_name', 'region', 'platform', 'experience']
+
+
+def file_fingerprint(file_path, with_hash=True):
+    """Size, mtime and (optionally) sha256 of a source file."""
+    stat = os.stat(file_path)
+    fingerprint = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if with_hash:
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        fingerprint['sha256'] = digest.hexdigest()
+    return fingerprint
+
+
+def cache_paths(file_path):
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    return (
+        os.path.join(CACHE_DIR, stem + '.parquet'),
+        os.path.join(CACHE_DIR, stem + '.json'),
+    )
+
+
+def _read_manifest(manifest_path):
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(manifest_path, fingerprint):
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(fingerprint, f)
+    os.replace(tmp_path, manifest_path)
+
+
+def cache_is_fresh(file_path):
+    """True when the columnar cache matches the current source file.
+
+    Size and mtime are checked first; the content hash is only computed when
+    the mtime moved (e.g. the file was copied or touched), in which case an
+    unchanged hash refreshes the manifest instead of forcing a rebuild.
+    """
+    parquet_path, manifest_path = cache_paths(file_path)
+    manifest = _read_manifest(manifest_path)
+    if manifest is None or not os.path.exists(parquet_path):
+        return False
+    current = file_fingerprint(file_path, with_hash=False)
+    if current['size'] != manifest.get('size'):
+        return False
+    if current['mtime_ns'] == manifest.get('mtime_ns'):
+        return True
+    current = file_fingerprint(file_path)
+    if current['sha256'] != manifest.get('sha256'):
+        return False
+    _write_manifest(manifest_path, current)
+    return True
+
+
+def normalize_events(df):
+    df = df[EVENT_COLUMNS].copy()
+    df['dt'] = pd.to_datetime(df['dt'])
+    for column in CATEGORICAL_COLUMNS:
+        df[column] = df[column].astype('category')
+    return df
+
+
+def event_schema():
+    fields = []
+    for column in EVENT_COLUMNS:
+        if column == 'dt':
+            fields.append(pa.field(column, pa.timestamp('us')))
+        elif column in CATEGORICAL_COLUMNS:
+            fields.append(pa.field(column, pa.dictionary(pa.int32(), pa.string())))
+        else:
+            fields.append(pa.field(column, pa.float64()))
+    return pa.schema(fields)
+
+
+def stream_workbook(file_path, parquet_path, chunk_rows=None):
+    """Convert the first sheet to parquet in fixed-size row chunks.
+
+    openpyxl's read-only mode yields one row at a time, and every chunk is
+    written as its own dictionary-encoded row group, so peak memory depends
+    on the chunk size rather than on the sheet size. Returns the number of
+    rows written.
+    """
+    import openpyxl
+    chunk_rows = chunk_rows or config.XLSX_CHUNK_ROWS
+    schema = event_schema()
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [str(name) for name in next(rows)]
+        total = 0
+        with pq.ParquetWriter(parquet_path, schema) as writer:
+            while True:
+                chunk = list(itertools.islice(rows, chunk_rows))
+                if not chunk:
+                    break
+                df = normalize_events(pd.DataFrame.from_records(chunk, columns=header))
+                df['dt'] = df['dt'].astype('datetime64[us]')
+                df['user_id'] = df['user_id'].astype('float64')
+                writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+                total += len(df)
+    finally:
+        workbook.close()
+    return total
+
+
+def use_streaming(file_path):
+    if config.STREAMING_XLSX == 'auto':
+        return os.path.getsize(file_path) >= config.STREAMING_XLSX_MIN_BYTES
+    return config.STREAMING_XLSX == 'on'
+
+
+def write_cache(file_path, streaming=None):
+    """Convert the workbook into its columnar copy; returns the rows written."""
+    parquet_path, manifest_path = cache_paths(file_path)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    fingerprint = file_fingerprint(file_path)
+    tmp_path = parquet_path + '.tmp'
+    if streaming is None:
+        streaming = use_streaming(file_path)
+    if streaming:
+        rows = stream_workbook(file_path, tmp_path)
+    else:
+        df = normalize_events(pd.read_excel(file_path))
+        df.to_parquet(tmp_path, index=False)
+        rows = len(df)
+    os.replace(tmp_path, parquet_path)
+    _write_manifest(manifest_path, fingerprint)
+    return rows
+
+
+def build_cache(file_path):
+    """Parse the workbook once and write its columnar copy."""
+    write_cache(file_path)
+    return read_cache(cache_paths(file_path)[0])
+
+
+def read_cache(parquet_path):
+    df = pd.read_parquet(parquet_path)
+    for column in CATEGORICAL_COLUMNS:
+        # Row groups written chunk by chunk may list categories in any order
+        df[column] = df[column].cat.reorder_categories(sorted(df[column].cat.categories))
+    return df
+
+
+def read_events(file_path=DATA_PATH):
+    """Raw typed events, served from the columnar cache when it is fresh."""
+    if cache_is_fresh(file_path):
+        parquet_path, _ = cache_paths(file_path)
+        return read_cache(parquet_path)
+    return build_cache(file_path)
+
+
+def concat_frames(frames):
+    """Concatenate frames whose categorical columns may have different categories."""
+    frames = [frame for frame in frames if len(frame)]
+    if not frames:
+        return pd.DataFrame()
+    columns = {}
+    for column in frames[0].columns:
+        values = [frame[column] for frame in frames]
+        if isinstance(values[0].dtype, pd.CategoricalDtype):
+            columns[column] = union_categoricals(values, sort_categories=True)
+        else:
+            columns[column] = pd.concat(values, ignore_index=True)
+    return pd.DataFrame(columns)
+
+
+def compact_events(df):
+    """Compact event table plus the user-id lookup its `user` codes index into.
+
+    Categorical columns stay dictionary-encoded, user ids are interned to
+    int32 codes and `day`/`week`/`month` are int32 keys (see timekeys), so no
+    column holds Python objects.
+    """
+    user_ids = df['user_id']
+    if user_ids.dtype.kind == 'f' and not user_ids.hasnans:
+        # Integer ids hash much faster than the float column read from Excel
+        user_ids = user_ids.astype(np.int64)
+    codes, uniques = pd.factorize(user_ids, sort=False)
+    days = timekeys.day_keys(df['dt'])
+    events = pd.DataFrame({
+        'dt': df['dt'].to_numpy(),
+        'event_name': df['event_name'].astype('category'),
+        'user': codes.astype(np.int32 if len(uniques) < 2 ** 31 else np.int64),
+        'region': df['region'].astype('category'),
+        'platform': df['platform'].astype('category'),
+        'experience': df['experience'].astype('category'),
+        'day': days,
+        'week': timekeys.week_keys(days),
+        'month': timekeys.month_keys(days),
+    })
+    return events, np.asarray(uniques)
+
+
+def memory_report(df):
+    """Bytes per row of the previous event frame versus the compact one."""
+    legacy = df.copy()
+    legacy['month'] = legacy['dt'].dt.to_period('M')
+    legacy['week'] = legacy['dt'].dt.to_period('W')
+    legacy['day'] = legacy['dt'].dt.date
+    events, user_ids = compact_events(df)
+    legacy_bytes = legacy.memory_usage(deep=True).sum()
+    compact_bytes = events.memory_usage(deep=True).sum() + user_ids.nbytes
+    rows = max(len(df), 1)
+    return {
+        'rows': len(df),
+        'legacy_bytes_per_row': legacy_bytes / rows,
+        'compact_bytes_per_row': compact_bytes / rows,
+        'reduction': legacy_bytes / max(compact_bytes, 1),
+    }
+
+
+class Dataset:
+    """Typed events together with the aggregates derived from them."""
+
+    route = None
+
+    def __init__(self, events, user_ids, cube=None):
+        self.events = events
+        self.user_ids = user_ids
+        if cube is not None:
+            # Precomputed by the ingestion step
+            self.cube = cube
+
+    @classmethod
+    def from_raw(cls, df, cube=None):
+        events, user_ids = compact_events(df)
+        return cls(events, user_ids, cube=cube)
+
+    @cached_property
+    def cube(self):
+        return cube.build_cube(self.events)
+
+    @cached_property
+    def funnel(self):
+        return funnel.FunnelIndex.build(self.events)
+
+    @cached_property
+    def sketches(self):
+        return sketches.UserSketches.build(self.events, self.user_ids, sketches.precision_for_error(config.SKETCH_ERROR))
+
+    @cached_property
+    def latency(self):
+        return latency.LatencyHistograms.build(self.funnel)
+
+    @cached_property
+    def filter_index(self):
+        return filters.BitmapIndex.build(self.events)
+
+    def unique_users(self, by, **where):
+        return cube.select(self.events, **where).groupby(by, observed=True)['user'].nunique()
+
+    def weekly_cohorts(self, by=None):
+        return cohorts.weekly_cohorts(self.funnel, by)
+
+    def filtered(self, selection):
+        """This dataset restricted to `selection` (a filters.Filters), cached per combination."""
+        if not selection:
+            return self
+        with _views_lock:
+            views = self.__dict__.setdefault('_views', OrderedDict())
+            view = views.get(selection)
+            if view is not None:
+                views.move_to_end(selection)
+                return view
+        view = FilteredDataset(self, selection)
+        with _views_lock:
+            views[selection] = view
+            while len(views) > _CACHED_VIEWS:
+                views.popitem(last=False)
+        return view
+
+
+# Filtered views kept per dataset; a module-level lock keeps datasets picklable
+_CACHED_VIEWS = 8
+_views_lock = threading.Lock()
+
+
+class FilteredDataset(Dataset):
+    """Rows of a dataset selected by filters, sharing the parent's indexes.
+
+    The cube, sketches and latency histograms keep only the cells inside the
+    filters and the funnel keeps only the selected rows of its sorted index,
+    so nothing is re-aggregated from the events; the event frame itself is
+    only sliced when exact distinct users are asked for.
+    """
+
+    def __init__(self, dataset, selection):
+        self.dataset = dataset
+        self.selection = selection
+        self.user_ids = dataset.user_ids
+        self.mask = dataset.filter_index.mask(selection)
+
+    @cached_property
+    def events(self):
+        return self.dataset.events.take(np.flatnonzero(self.mask))
+
+    @cached_property
+    def cube(self):
+        cells = self.dataset.cube
+        cells = cells[self.selection.cell_mask(cells)].reset_index(drop=True)
+        for column in cube.CUBE_DIMENSIONS[1:]:
+            # Charts over categorical axes would still draw the filtered-out values
+            cells[column] = cells[column].cat.remove_unused_categories()
+        return cells
+
+    @cached_property
+    def funnel(self):
+        return self.dataset.funnel.select(self.mask)
+
+    @cached_property
+    def sketches(self):
+        return self.dataset.sketches.select(self.selection.cell_mask(self.dataset.sketches.keys))
+
+    @cached_property
+    def latency(self):
+        return self.dataset.latency.select(self.selection.cell_mask(self.dataset.latency.keys))
+
+    def filtered(self, selection):
+        return self.dataset.filtered(selection)
+
+
+class StoreDataset(Dataset):
+    """Dataset of one route of the ingested store (see ingest.py).
+
+    Its sketches are merged from per-partition ones, so a new batch only
+    sketches the days it touched.
+    """
+
+    def __init__(self, events, user_ids, cube=None, route=None, store_dir=None):
+        super().__init__(events, user_ids, cube=cube)
+        self.route = route
+        self.store_dir = store_dir
+
+    @cached_property
+    def sketches(self):
+        import ingest
+        return ingest.load_sketches(self.route, sketches.precision_for_error(config.SKETCH_ERROR), self.store_dir)
+
+
+def _shared_dataset(name, key, load, make=Dataset):
+    """Dataset of `load()` -> (raw events, cube or None), mapped from the source's snapshot.
+
+    The first process to see a new `key` publishes the snapshot; every other
+    one (and every later load) attaches to it without reading the source.
+    """
+    if not config.SNAPSHOTS:
+        raw, cells = load()
+        events, user_ids = compact_events(raw)
+        return make(events, user_ids, cube=cells)
+    attached = snapshot.attach(name, key)
+    if attached is None:
+        raw, cells = load()
+        events, user_ids = compact_events(raw)
+        cells = cube.build_cube(events) if cells is None else cells
+        snapshot.publish(name, key, events, user_ids, cells)
+        # Another process may have swapped in a newer source meanwhile
+        attached = snapshot.attach(name, key) or (events, user_ids, cells)
+    events, user_ids, cells = attached
+    return make(events, user_ids, cube=cells)
+
+
+# Load data function with caching; size and mtime are part of the cache key so
+# a replaced workbook is picked up without restarting the app. The dataset is
+# shared read-only between sessions instead of being copied per caller.
+@st.cache_resource(max_entries=2)
+def _load_dataset(file_path, size, mtime_ns):
+    instrument.count('data_cache_misses')
+    name = 'workbook-' + hashlib.sha256(os.path.abspath(file_path).encode()).hexdigest()[:12]
+    dataset = _shared_dataset(name, [size, mtime_ns], lambda: (read_events(file_path), None))
+    dataset.cube  # build the aggregates before the dataset is shared
+    return dataset
+
+
+# Keyed by the route's manifest, which changes on every ingested batch. Each
+# entry holds a single route, so selecting one never loads the others. Only
+# new or changed partitions are read, and the cube and sketches are merged
+# from per-partition ones; the event table, its snapshot and the indexes over
+# it (funnel, latency, filter bitmaps) are still rebuilt over the route's
+# whole history, since user codes and per-user funnel order span every day.
+@st.cache_resource(max_entries=4)
+def _load_store_dataset(store_dir, route, size, mtime_ns):
+    import ingest
+    instrument.count('data_cache_misses')
+    name = f'route-{route}-' + hashlib.sha256(os.path.abspath(store_dir).encode()).hexdigest()[:12]
+    make = functools.partial(StoreDataset, route=route, store_dir=store_dir)
+    return _shared_dataset(name, [size, mtime_ns], lambda: ingest.load_store(route, store_dir), make)
+
+
+# DuckDB datasets hold no events, only a connection and query results
+@st.cache_resource(max_entries=4)
+def _load_sql_dataset(paths, hive_partitioned, size, mtime_ns):
+    import sql_backend
+    instrument.count('data_cache_misses')
+    return sql_backend.SqlDataset(paths, hive_partitioned)
+
+
+def available_routes():
+    import ingest
+    routes = set(ingest.list_routes())
+    if config.DATA_SOURCE != 'store' and os.path.exists(DATA_PATH):
+        routes.add(config.DEFAULT_ROUTE)
+    return sorted(routes)
+
+
+def selected_route():
+    """Route picked in the app's selector, or the default outside the app."""
+    return st.session_state.get('route', config.DEFAULT_ROUTE)
+
+
+# Routes loaded most recently, each with the dataset the background refresher
+# published for it (None until it has; see refresh.py). Only these routes are
+# refreshed, and only the PUBLISHED_ROUTES most recent are kept, as with the
+# dataset caches below. A rebuilt version replaces its route's entry with a
+# single assignment.
+PUBLISHED_ROUTES = 4
+_published = OrderedDict()
+_published_lock = threading.Lock()
+
+
+def _use_route(route):
+    """Mark `route` as just loaded; returns its published dataset, or None."""
+    with _published_lock:
+        dataset = _published.pop(route, None)
+        _published[route] = dataset
+        while len(_published) > PUBLISHED_ROUTES:
+            _published.popitem(last=False)
+        return dataset
+
+
+def publish(route, dataset):
+    """Serve `dataset` for `route` from now on; sessions already holding the previous one keep it."""
+    dataset.route = route
+    with _published_lock:
+        _published[route] = dataset
+        while len(_published) > PUBLISHED_ROUTES:
+            _published.popitem(last=False)
+
+
+def published(route):
+    """The route's published dataset, or None."""
+    with _published_lock:
+        return _published.get(route)
+
+
+def recent_routes():
+    """Routes loaded recently enough to be kept current, least recent first."""
+    with _published_lock:
+        return list(_published)
+
+
+def load_dataset(route=None, file_path=DATA_PATH, selection=None):
+    """The route's dataset, narrowed to `selection` or else to the sidebar filters."""
+    with instrument.measure('load_dataset', page=__name__):
+        route = route or selected_route()
+        dataset = _use_route(route) if file_path == DATA_PATH else None
+        if dataset is None:
+            dataset = _select_dataset(route, file_path)
+            # Lets per-route state kept in the store (e.g. forecast fits) be found
+            dataset.route = route
+        return dataset.filtered(filters.selected() if selection is None else selection)
+
+
+def dataset_source(route, file_path=DATA_PATH):
+    """(loader, args) of the route's current dataset: `loader(*args)` returns it.
+
+    The args hold the source's size and mtime, so they change with every new
+    version of the workbook or the route's store.
+    """
+    import ingest
+    manifest = ingest.manifest_path(route)
+    if config.DATA_SOURCE == 'store' or (config.DATA_SOURCE == 'auto' and os.path.exists(manifest)):
+        fingerprint = file_fingerprint(manifest, with_hash=False)
+        if config.BACKEND == 'duckdb':
+            parts = (os.path.join(ingest.route_dir(route), 'date=*', 'part-*.parquet'),)
+            return _load_sql_dataset, (parts, True, fingerprint['size'], fingerprint['mtime_ns'])
+        return _load_store_dataset, (ingest.STORE_DIR, route, fingerprint['size'], fingerprint['mtime_ns'])
+    if route != config.DEFAULT_ROUTE:
+        raise ValueError(f'No stored events for route {route}; ingest them with ingest.py --route {route}')
+    fingerprint = file_fingerprint(file_path, with_hash=False)
+    if config.BACKEND == 'duckdb':
+        return _load_workbook_sql_dataset, (file_path, fingerprint['size'], fingerprint['mtime_ns'])
+    return _load_dataset, (file_path, fingerprint['size'], fingerprint['mtime_ns'])
+
+
+def _load_workbook_sql_dataset(file_path, size, mtime_ns):
+    if not cache_is_fresh(file_path):
+        write_cache(file_path)
+    return _load_sql_dataset((cache_paths(file_path)[0],), False, size, mtime_ns)
+
+
+def _select_dataset(route, file_path):
+    loader, args = dataset_source(route, file_path)
+    return loader(*args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert a workbook into the columnar cache and report throughput.')
+    parser.add_argument('file', nargs='?', default=DATA_PATH)
+    parser.add_argument('--streaming', choices=['on', 'off'], default='on')
+    parser.add_argument('--chunk-rows', type=int, default=config.XLSX_CHUNK_ROWS)
+    parser.add_argument('--memory-report', action='store_true', help='also compare bytes per row of the in-memory event frames')
+    args = parser.parse_args()
+
+    config.XLSX_CHUNK_ROWS = args.chunk_rows
+    start = time.perf_counter()
+    rows = write_cache(args.file, streaming=args.streaming == 'on')
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is reported in kilobytes on Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f'{rows:,} rows in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s), peak RSS {peak_mb:,.0f} MB')
+    if args.memory_report:
+        report = memory_report(read_cache(cache_paths(args.file)[0]))
+        print(
+            f"in memory: {report['legacy_bytes_per_row']:.0f} bytes/row before, "
+            f"{report['compact_bytes_per_row']:.0f} bytes/row compact ({report['reduction']:.1f}x smaller)"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -1,100 +1,68 @@
 # Import necessary libraries
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+
+import charts
+import config
+import cube
+import data_store
+import forecast
+import sections
 
 def display():
-    sns.set(style="whitegrid")
+    # Load the dataset
+    data = data_store.load_dataset()
 
-    # Load data function with caching
-    @st.cache_data
-    def load_data(file_path):
-        df = pd.read_excel(file_path)
-        df['dt'] = pd.to_datetime(df['dt'])
-        df['month'] = df['dt'].dt.to_period('M')
-        df['week'] = df['dt'].dt.to_period('W')
-        df['day'] = df['dt'].dt.date
-        return df
+    # Streamlit layout starts here
+    introduction()
 
-    # File path
-    file_path = 'data/Wise funnel events regional - Data.xlsx'
+    sections.render_sections(SECTIONS, data)
 
-    # Load the dataset
-    df = load_data(file_path)
 
-    st.title("Regional Demand Analysis")
-    st.write("This section analyzes the demand for transfers by time intervals: weekly, monthly, and daily, focusing on the behavior of new and existing users.")
+def introduction(out=st):
+    out.title("Regional Demand Analysis")
+    out.write("This section analyzes the demand for transfers by time intervals: weekly, monthly, and daily, focusing on the behavior of new and existing users.")
 
     # Weekly, Monthly, and Daily Demand Analysis
-    st.header("11. Weekly, Monthly, and Daily Demand Analysis")
+    out.header("11. Weekly, Monthly, and Daily Demand Analysis")
+
 
+def section_11_1(data, out=st):
     # Monthly Demand Analysis: Heatmap
-    st.subheader("11.1 Monthly Demand Analysis")
-    st.markdown("**Type:** Heatmap")
-    st.markdown("**Description:** The heatmap below displays the monthly demand for transfers, broken down by region. Darker shades indicate higher demand.")
-
-    monthly_heatmap = df[df['event_name'] == 'Transfer Created'].groupby(['month', 'region']).size().unstack().fillna(0)
-    fig, ax = plt.subplots(figsize=(10, 8))
-    sns.heatmap(monthly_heatmap, cmap='YlGnBu', annot=True, fmt='.0f', cbar_kws={'label': 'Number of Transfers'}, ax=ax)
-    plt.title('Monthly Demand for Transfers by Region')
-    plt.ylabel('Month')
-    plt.xlabel('Region')
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    st.pyplot(fig)
+    out.subheader("11.1 Monthly Demand Analysis")
+    out.markdown("**Type:** Heatmap")
+    out.markdown("**Description:** The heatmap below displays the monthly demand for transfers, broken down by region. Darker shades indicate higher demand.")
 
+    monthly_heatmap = cube.rollup(data.cube, ['month', 'region'], event_name='Transfer Created').unstack().fillna(0)
+    charts.heatmap('11.1-monthly-demand', monthly_heatmap, figsize=(10, 8), cmap='YlGnBu', colorbar_label='Number of Transfers', title='Monthly Demand for Transfers by Region', ylabel='Month', xlabel='Region', rotation=45, out=out)
+
+
+def section_11_2(data, out=st):
     # Weekly Demand Analysis: Double Bar Charts
-    st.subheader("11.2 Weekly Demand Analysis")
-    st.markdown("**Type:** Double Bar Chart")
-    st.markdown("**Description:** This bar chart shows the weekly demand for transfers, categorized by regions.")
+    out.subheader("11.2 Weekly Demand Analysis")
+    out.markdown("**Type:** Double Bar Chart")
+    out.markdown("**Description:** This bar chart shows the weekly demand for transfers, categorized by regions.")
 
     # Group by week and region to calculate transfer counts
-    demand_weekly_bar_region = df[df['event_name'] == 'Transfer Created'].groupby(['week', 'region']).size().reset_index(name='transfers')
+    demand_weekly_bar_region = cube.rollup(data.cube, ['week', 'region'], event_name='Transfer Created').unstack()
 
     # Create the bar chart
-    fig, ax = plt.subplots(figsize=(12, 6))
-    sns.barplot(
-        data=demand_weekly_bar_region,
-        x='week', y='transfers', hue='region',
-        errorbar=None, palette='viridis', ax=ax
-    )
-    plt.title('Weekly Demand for Transfers by Region')
-    plt.ylabel('Number of Transfers')
-    plt.xlabel('Week')
-    plt.xticks(rotation=45)
-    plt.legend(title='Region')
-    plt.tight_layout()
-    st.pyplot(fig)
+    charts.bar('11.2-weekly-demand', demand_weekly_bar_region, figsize=(12, 6), palette='viridis', title='Weekly Demand for Transfers by Region', ylabel='Number of Transfers', xlabel='Week', rotation=45, legend_title='Region', out=out)
+
 
+def section_11_3(data, out=st):
     # Daily Demand Analysis: Stacked Area Chart
-    st.subheader("11.3 Daily Demand Analysis")
-    st.markdown("**Type:** Line Chart")
-    st.markdown("**Description:** This line chart shows the daily demand for transfers, broken down by region.")
+    out.subheader("11.3 Daily Demand Analysis")
+    out.markdown("**Type:** Line Chart")
+    out.markdown("**Description:** This line chart shows the daily demand for transfers, broken down by region.")
 
-    daily_demand = df[df['event_name'] == 'Transfer Created'].groupby(['day', 'region']).size().unstack(fill_value=0)
+    daily_demand = cube.rollup(data.cube, ['day', 'region'], event_name='Transfer Created').unstack(fill_value=0)
     daily_demand.index = daily_demand.index.astype(str)
 
-    fig, ax = plt.subplots(figsize=(12, 6))
-    daily_demand.plot(kind='line', colormap='viridis', marker='o', ax=ax)
-    plt.title('Daily Demand for Transfers by Region')
-    plt.ylabel('Number of Transfers')
-    plt.xlabel('Day')
-    tick_interval = max(1, len(daily_demand.index) // 10)
-    plt.xticks(
-        ticks=range(0, len(daily_demand.index), tick_interval),
-        labels=daily_demand.index[::tick_interval],
-        rotation=45
-    )
-    plt.legend(title='Region')
-    plt.tight_layout()
-    st.pyplot(fig)
+    charts.line('11.3-daily-demand', daily_demand, figsize=(12, 6), colormap='viridis', title='Daily Demand for Transfers by Region', ylabel='Number of Transfers', xlabel='Day', max_xticks=10, rotation=45, legend_title='Region', export=True, out=out)
 
     # Insight for all three charts
-    st.markdown("""
+    out.markdown("""
     ##### Insight:
     - In the initial period, the demand for transfers in all three regions—**Europe**, **North America**, and **Other**—was relatively low. This can be attributed to the newly launched route, which had not yet reached significant adoption. The early stages of product or service launches often show low engagement as users are still becoming acquainted with the platform.
 
@@ -104,3 +72,45 @@ def display():
 
     - **Conclusion:** The overall trend suggests that Europe is showing positive growth in transfer demand, particularly in February, while North America and Other regions may need further attention to address potential barriers to sustained engagement. Targeted marketing, customer support, or product improvements in these regions could help reverse the downward trend and drive higher adoption in the upcoming months.
     """)
+
+
+def section_11_4(data, out=st):
+    # Demand Forecast: Line Chart with Prediction Intervals
+    out.subheader("11.4 Demand Forecast")
+    out.markdown("**Type:** Line Chart with Prediction Intervals")
+    out.markdown(
+        f"**Description:** Daily demand per region for the next {config.FORECAST_DAYS} days (dashed), from a trend and "
+        f"day-of-week model weighted toward recent days (half-life of {config.FORECAST_HALFLIFE_DAYS:g} days). "
+        "Shaded bands are 80% and 95% prediction intervals."
+    )
+
+    history = cube.rollup(data.cube, ['day', 'region'], event_name=forecast.DEMAND_EVENT).unstack(fill_value=0)
+    predicted = forecast.demand_model(data, 'region').forecast().set_index(['day', 'region']).unstack('region')
+    predicted = predicted.swaplevel(axis=1)
+    history = history.tail(4 * config.FORECAST_DAYS)
+    history.columns = pd.MultiIndex.from_product([history.columns.astype(str), ['actual']])
+    combined = pd.concat([history, predicted], axis=1).sort_index(axis=1, level=0, sort_remaining=False)
+    combined.index = combined.index.strftime('%Y-%m-%d')
+
+    charts.forecast('11.4-demand-forecast', combined, figsize=(12, 6), colormap='viridis', title='Daily Demand Forecast by Region', ylabel='Number of Transfers', xlabel='Day', max_xticks=10, rotation=45, legend_title='Region', out=out)
+
+    # Every (region, platform, experience) series comes from the same batch fit
+    series = forecast.demand_model(data).forecast()
+    keys = forecast.SERIES_DIMENSIONS
+    recent = cube.rollup(data.cube, ['day'] + keys, event_name=forecast.DEMAND_EVENT).reset_index()
+    recent = recent[recent['day'] > recent['day'].max() - pd.Timedelta(days=config.FORECAST_DAYS)]
+    summary = pd.DataFrame({
+        f'Last {config.FORECAST_DAYS} days': recent.groupby(keys, observed=True)['count'].sum(),
+        f'Next {config.FORECAST_DAYS} days (forecast)': series.groupby(keys)['forecast'].sum().round(),
+    }).fillna(0)
+    summary['Change (%)'] = (summary.iloc[:, 1] / summary.iloc[:, 0].where(summary.iloc[:, 0] > 0) - 1).mul(100).round(1)
+    summary.index = summary.index.map(' / '.join)
+    out.markdown(f"**Forecast per region, platform and experience** ({len(series) // config.FORECAST_DAYS} series):")
+    out.dataframe(summary.sort_values(summary.columns[1], ascending=False))
+    out.download_button(
+        "Download daily forecasts with intervals", data=series.to_csv(index=False).encode(),
+        file_name='11.4-demand-forecast.csv', mime='text/csv', key='export-11.4-demand-forecast', on_click='ignore',
+    )
+
+
+SECTIONS = [section_11_1, section_11_2, section_11_3, section_11_4]
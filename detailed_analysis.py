@@ -1,45 +1,40 @@
 # Import necessary libraries
 import streamlit as st
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+
+import data_store
+import funnel
+import sections
 
 def display():
-    sns.set(style="whitegrid")
+    # Load the dataset
+    data = data_store.load_dataset()
 
-    # Load data function with caching
-    @st.cache_data
-    def load_data(file_path):
-        df = pd.read_excel(file_path)
-        df['dt'] = pd.to_datetime(df['dt'])
-        df['month'] = df['dt'].dt.to_period('M')
-        df['week'] = df['dt'].dt.to_period('W')
-        df['day'] = df['dt'].dt.date
-        return df
+    # Streamlit layout starts here
+    introduction()
 
-    # File path
-    file_path = 'data/Wise funnel events regional - Data.xlsx'
+    sections.render_sections(SECTIONS, data)
 
-    # Load the dataset
-    df = load_data(file_path)
 
-    # Streamlit layout starts here
-    st.title("Detailed Transfer Analysis")
-    st.write("""
+def introduction(out=st):
+    out.title("Detailed Transfer Analysis")
+    out.write("""
     This section visualizes the transfer funnels for each region. The funnel plots display the transition of users through different events, such as 
-    'Transfer Created', 'Transfer Transferred', etc., in terms of raw counts and percentages.
+    'Transfer Created', 'Transfer Transferred', etc., in terms of user counts and percentages of the users who created a transfer.
     """)
 
-    st.header("13. Region Wise Transfer Funnels")
-    region_funnel = df.groupby(['region', 'event_name']).size().unstack(fill_value=0)
+
+def section_13(data, out=st):
+    # Plotly loads with the first chart that needs it
+    import plotly.express as px
+
+    out.header("13. Region Wise Transfer Funnels")
+    region_funnel = data.funnel.conversion('region')
+    region_funnel_percentages = funnel.stage_percentages(region_funnel)
     for idx, region in enumerate(region_funnel.index):
-        st.subheader(f"13.{idx + 1} {region}: Transfer Funnel for {region}")
-        st.write(f"**Region: {region}** - The funnel plot below represents the number of users transitioning through different events.")
+        out.subheader(f"13.{idx + 1} {region}: Transfer Funnel for {region}")
+        out.write(f"**Region: {region}** - The funnel plot below represents the number of users transitioning through different events.")
         region_data = region_funnel.loc[region]
-        region_funnel_percentage = (region_data / region_data.sum()) * 100
+        region_funnel_percentage = region_funnel_percentages.loc[region]
 
         fig = px.funnel(
             y=region_data.index, 
@@ -52,25 +47,28 @@ def display():
             for x, y, percent in zip(region_data.values, region_data.index, region_funnel_percentage.values)
         ]
         fig.update_traces(hovertemplate=hover_text)
-        st.plotly_chart(fig, use_container_width=True)
+        out.plotly_chart(fig, use_container_width=True)
     
-    st.markdown("""
+    out.markdown("""
     ##### Insight:
     - Europe and Other regions have high 'Transfer Created' counts but much lower 'Transfer Funded' and 'Transfer Transferred' counts, suggesting possible issues like partner bank delays or technical problems.
-    - In Europe, the 'Transfer Transferred' count is unexpectedly higher than 'Transfer Funded', which may point to data discrepancies or misconfiguration in event tracking.
+    - Counted per user and in order, Europe's real gap is between 'Transfer Created' and 'Transfer Funded': only about a quarter of the users who create a transfer fund it, while almost every user who funds one completes it.
     """)
 
+
+def section_14(data, out=st):
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
     # Region-Platform Funnel Analysis
-    st.header("14. Region-Platform Funnel Analysis")
-    st.write("""
+    out.header("14. Region-Platform Funnel Analysis")
+    out.write("""
     This section visualizes funnel charts for each region-platform combination. 
     The subplots provide insights into user transitions across events based on their region and platform. 
     Each subplot represents a specific region-platform combination.
     """)
-    platform_region_funnel = df.groupby(['region', 'platform', 'event_name']).size().unstack(fill_value=0)
-    platform_region_funnel_percentage = (
-        platform_region_funnel.div(platform_region_funnel.sum(axis=1), axis=0) * 100
-    ).round(2)
+    platform_region_funnel = data.funnel.conversion(['region', 'platform'])
+    platform_region_funnel_percentage = funnel.stage_percentages(platform_region_funnel).round(2)
 
     regions = ['NorthAm', 'Europe', 'Other']
     platforms = ['iOS', 'Android', 'Web']
@@ -84,9 +82,11 @@ def display():
     )
     for i, region in enumerate(regions):
         for j, platform in enumerate(platforms):
+            if (region, platform) not in platform_region_funnel.index:
+                # Filtered out in the sidebar
+                continue
             region_platform_data = platform_region_funnel.loc[(region, platform)]
-            total_count = region_platform_data.sum()
-            percentages = (region_platform_data / total_count) * 100
+            percentages = platform_region_funnel_percentage.loc[(region, platform)]
 
             hover_data = [
                 f"Event Name = {event}<br>Count = {count}<br>Percentage = {percentage:.2f}%"
@@ -110,10 +110,13 @@ def display():
         title_x=0.5, 
         title_y=0.95 
     )
-    st.plotly_chart(fig, use_container_width=True)
+    out.plotly_chart(fig, use_container_width=True)
 
-    st.markdown("""
+    out.markdown("""
     ##### Insight:
     - In North America, both iOS and Android platforms perform well, but the Web platform is underperforming, particularly in the 'Transfer Funded' stage.
-    - In Europe, across all platforms, the 'Transfer Transferred' count exceeds 'Transfer Funded', which may indicate issues with event tracking or a data anomaly.
-    """)
\ No newline at end of file
+    - The raw event counts show more 'Transfer Transferred' than 'Transfer Funded' events in Europe on every platform. Following each user through the stages in order removes that inversion, which points to duplicated or out-of-order tracking events rather than transfers skipping the funding step.
+    """)
+
+
+SECTIONS = [section_13, section_14]
@@ -0,0 +1,76 @@
+# Point reduction for long time-series charts
+import numpy as np
+import pandas as pd
+
+
+def _positions(index):
+    if isinstance(index, pd.DatetimeIndex):
+        return index.asi8.astype(np.float64)
+    return np.arange(len(index), dtype=np.float64)
+
+
+def lttb(x, y, n_out):
+    """Indices kept by Largest-Triangle-Three-Buckets.
+
+    Keeps the first and last points and, from each of the `n_out - 2`
+    buckets in between, the point forming the largest triangle with the
+    previously kept point and the average of the next bucket.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    y = np.nan_to_num(np.asarray(y, dtype=np.float64))
+    every = (n - 2) / (n_out - 2)
+    kept = np.empty(n_out, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        kept[i + 1] = a
+    return kept
+
+
+def min_max(y, n_out):
+    """Indices of the minimum and maximum of each of `n_out // 2` equal buckets."""
+    n = len(y)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+    y = np.nan_to_num(np.asarray(y, dtype=np.float64))
+    edges = np.linspace(0, n, n_out // 2 + 1).astype(np.int64)
+    kept = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end > start:
+            kept.extend((start + int(np.argmin(y[start:end])), start + int(np.argmax(y[start:end]))))
+    return np.unique(kept)
+
+
+def downsample(data, max_points, method='lttb'):
+    """Series or DataFrame reduced to at most `max_points` rows.
+
+    For a DataFrame each column picks its points from an equal share of the
+    budget, and the rows kept for any column are kept for all of them, so the
+    columns stay aligned on one index.
+    """
+    if max_points is None or len(data) <= max_points:
+        return data
+    x = _positions(data.index)
+    frame = data.to_frame() if isinstance(data, pd.Series) else data
+    budget = max_points // max(len(frame.columns), 1)
+    if budget < 3:
+        # Too many columns to give each a shape of its own
+        return data.iloc[np.unique(np.linspace(0, len(data) - 1, max_points).round().astype(np.int64))]
+    if method == 'lttb':
+        kept = [lttb(x, frame[column].to_numpy(), budget) for column in frame.columns]
+    else:
+        kept = [min_max(frame[column].to_numpy(), budget) for column in frame.columns]
+    rows = np.unique(np.concatenate(kept))
+    return data.iloc[rows]
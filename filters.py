@@ -0,0 +1,163 @@
+# Global dashboard filters resolved through precomputed row indexes
+#
+# The sidebar narrows every tab to a date range and to chosen regions,
+# platforms and experience levels. A dataset indexes its events once: one
+# packed bitmap per region/platform/experience value and the row ids grouped
+# by day. A filter combination then resolves to a row selection with a few
+# bitwise ORs and ANDs instead of re-masking the event frame, and the filtered
+# view built on it (data_store.FilteredDataset) is cached and shared by every
+# section of every tab.
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+import timekeys
+
+FILTER_DIMENSIONS = ['region', 'platform', 'experience']
+
+
+class Filters:
+    """An inclusive date range and the chosen values per dimension.
+
+    A missing range or an empty value list leaves that part unrestricted;
+    `Filters()` selects everything.
+    """
+
+    def __init__(self, days=None, **values):
+        unknown = set(values) - set(FILTER_DIMENSIONS)
+        if unknown:
+            raise ValueError(f'Cannot filter on {sorted(unknown)}')
+        self.days = None if days is None else tuple(pd.Timestamp(day).date() for day in days)
+        self.values = {column: tuple(sorted(values[column])) for column in FILTER_DIMENSIONS if values.get(column)}
+
+    @property
+    def key(self):
+        return (self.days, tuple(self.values.items()))
+
+    def __bool__(self):
+        return self.days is not None or bool(self.values)
+
+    def __eq__(self, other):
+        return isinstance(other, Filters) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return f'Filters(days={self.days!r}, {", ".join(f"{k}={v!r}" for k, v in self.values.items())})'
+
+    def day_range(self):
+        """First and last day key of the range."""
+        return tuple(int(np.datetime64(day, 'D').astype(np.int64)) for day in self.days)
+
+    def cell_mask(self, cells):
+        """Boolean mask of the cube cells (or sketch buckets) inside the filters."""
+        mask = np.ones(len(cells), dtype=bool)
+        if self.days is not None:
+            first, last = self.day_range()
+            days = timekeys.day_keys(cells['day'])
+            mask &= (days >= first) & (days <= last)
+        for column, values in self.values.items():
+            mask &= cells[column].isin(values).to_numpy()
+        return mask
+
+    def sql(self, hive_partitioned=False):
+        """The filters as a SQL condition over the event columns (see sql_backend)."""
+        clauses = []
+        if self.days is not None:
+            first, last = (f"'{day.isoformat()}'" for day in self.days)
+            clauses.append(f'CAST(dt AS DATE) BETWEEN {first} AND {last}')
+            if hive_partitioned:
+                # Lets DuckDB skip whole date partitions
+                clauses.append(f'date BETWEEN {first} AND {last}')
+        for column, values in self.values.items():
+            literals = ', '.join("'" + str(value).replace("'", "''") + "'" for value in values)
+            clauses.append(f'{column} IN ({literals})')
+        return ' AND '.join(clauses)
+
+
+class BitmapIndex:
+    """Packed row bitmaps per dimension value, and row ids grouped by day."""
+
+    def __init__(self, n_rows, bitmaps, first_day, day_offsets, day_rows):
+        self.n_rows = n_rows
+        self.bitmaps = bitmaps
+        self.first_day = first_day
+        self.day_offsets = day_offsets
+        self.day_rows = day_rows
+
+    @classmethod
+    def build(cls, events):
+        bitmaps = {}
+        for column in FILTER_DIMENSIONS:
+            values = pd.Categorical(events[column])
+            bitmaps[column] = {value: np.packbits(values.codes == code) for code, value in enumerate(values.categories)}
+
+        days = events['day'].to_numpy()
+        first_day = int(days.min()) if len(days) else 0
+        offsets = days.astype(np.int64) - first_day
+        span = int(offsets.max()) + 1 if len(days) else 0
+        if span <= np.iinfo(np.uint16).max:
+            # numpy's stable sort is a radix sort for 16-bit keys
+            offsets = offsets.astype(np.uint16)
+        day_rows = np.argsort(offsets, kind='stable').astype(np.int32 if len(days) < 2 ** 31 else np.int64)
+        day_offsets = np.r_[0, np.cumsum(np.bincount(offsets, minlength=span))]
+        return cls(len(events), bitmaps, first_day, day_offsets, day_rows)
+
+    def select(self, filters):
+        """Packed bitmap of the rows matching `filters`."""
+        selected = None
+        if filters.days is not None:
+            first, last = self._day_slice(*filters.day_range())
+            rows = self.day_rows[self.day_offsets[first]:self.day_offsets[last]]
+            mask = np.zeros(self.n_rows, dtype=bool)
+            mask[rows] = True
+            selected = np.packbits(mask)
+        for column, values in filters.values.items():
+            column_bits = np.zeros((self.n_rows + 7) // 8, dtype=np.uint8)
+            for value in values:
+                if value in self.bitmaps[column]:
+                    np.bitwise_or(column_bits, self.bitmaps[column][value], out=column_bits)
+            selected = column_bits if selected is None else np.bitwise_and(selected, column_bits, out=selected)
+        if selected is None:
+            selected = np.packbits(np.ones(self.n_rows, dtype=bool))
+        return selected
+
+    def _day_slice(self, first, last):
+        """Slice bounds into `day_offsets` for an inclusive range of day keys."""
+        n_days = len(self.day_offsets) - 1
+        first = min(max(first - self.first_day, 0), n_days)
+        last = min(max(last - self.first_day + 1, first), n_days)
+        return first, last
+
+    def mask(self, filters):
+        """Boolean mask over the events for `filters`."""
+        return np.unpackbits(self.select(filters), count=self.n_rows).view(bool)
+
+
+def selected():
+    """Filters chosen in the app's sidebar, or none outside the app."""
+    if not st.runtime.exists():
+        return Filters()
+    return st.session_state.get('filters', Filters())
+
+
+def sidebar(data, route):
+    """Filter widgets for one route's dataset; stores and returns the chosen Filters."""
+    cells = data.cube
+    days = cells['day']
+    # Widget keys include the route, whose days and values differ
+    with st.sidebar.expander("Filters", expanded=False):
+        picked = st.date_input(
+            "Dates", value=(days.min().date(), days.max().date()),
+            min_value=days.min().date(), max_value=days.max().date(), key=f'filter-days-{route}',
+        )
+        values = {
+            column: st.multiselect(column.capitalize(), sorted(cells[column].unique()), placeholder="All", key=f'filter-{column}-{route}')
+            for column in FILTER_DIMENSIONS
+        }
+    # The date input holds a single day while the second end is being picked
+    full_range = tuple(picked) == (days.min().date(), days.max().date())
+    chosen = Filters(None if full_range or len(picked) < 2 else picked, **values)
+    st.session_state['filters'] = chosen
+    return chosen
@@ -0,0 +1,254 @@
+# Batch demand forecasts for every daily Transfer Created series at once
+#
+# Every (region, platform, experience) series gets the same model: level,
+# linear trend and day-of-week effects, fitted by exponentially weighted least
+# squares so recent days weigh most. All series share one design matrix, so
+# the fit is kept as sufficient statistics: the weighted X'X (shared), X'y and
+# y'y per series. New days decay and extend them with one matrix product over
+# the (series x new days) array, and solving for every series is a single
+# solve against the shared X'X; no per-series loop and no pass over old days.
+# A route's store keeps its fitted statistics next to the events, so an
+# ingested batch only folds in the days it adds.
+#
+#   python forecast.py --route MXN-USD           # fit every series and time it
+import argparse
+import os
+import time
+import weakref
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+import config
+import timekeys
+
+SERIES_DIMENSIONS = ['region', 'platform', 'experience']
+DEMAND_EVENT = 'Transfer Created'
+STATE_NAME = 'forecast.npz'
+
+# Two-sided prediction intervals, by coverage
+LEVELS = (0.8, 0.95)
+
+
+def design(days, first_day):
+    """Rows of [1, days since first_day, Tuesday..Sunday indicators]."""
+    days = np.asarray(days, dtype=np.int64)
+    # Day key 0 (1970-01-01) was a Thursday; Monday is the baseline
+    weekday = (days + 3) % 7
+    x = np.zeros((len(days), 8))
+    x[:, 0] = 1
+    x[:, 1] = days - first_day
+    x[np.arange(len(days))[weekday > 0], 1 + weekday[weekday > 0]] = 1
+    return x
+
+
+def daily_series(cells, by=SERIES_DIMENSIONS, event_name=DEMAND_EVENT):
+    """Daily counts of `event_name` per `by` group as (keys, first day key, series x days array)."""
+    by = [by] if isinstance(by, str) else list(by)
+    cells = cells[cells['event_name'] == event_name]
+    if cells.empty:
+        return pd.DataFrame(columns=by), 0, np.zeros((0, 0))
+    days = timekeys.day_keys(cells['day']).astype(np.int64)
+    first_day = int(days.min())
+    n_days = int(days.max()) - first_day + 1
+    groups = cells.groupby(by, observed=True, sort=True)
+    codes = groups.ngroup().to_numpy()
+    values = np.bincount(codes * n_days + days - first_day, weights=cells['count'].to_numpy(), minlength=groups.ngroups * n_days)
+    # String keys, so fits saved by the store line up with fresh ones
+    keys = groups.size().index.to_frame(index=False).astype(str)
+    return keys, first_day, values.reshape(groups.ngroups, n_days)
+
+
+class DemandModel:
+    """Weighted least-squares statistics of many daily series sharing one calendar."""
+
+    def __init__(self, keys, first_day, halflife_days=None):
+        self.keys = keys.reset_index(drop=True)
+        self.first_day = first_day
+        self.last_day = first_day - 1
+        self.halflife_days = halflife_days or config.FORECAST_HALFLIFE_DAYS
+        self.decay = 0.5 ** (1 / self.halflife_days)
+        p = design([first_day], first_day).shape[1]
+        # Shared: sum of w x x', sum of w^2 x x', sum of w, sum of w^2
+        self.xx = np.zeros((p, p))
+        self.xx2 = np.zeros((p, p))
+        self.w = 0.0
+        self.w2 = 0.0
+        # Per series: sum of w y x and sum of w y^2
+        self.xy = np.zeros((len(self.keys), p))
+        self.yy = np.zeros(len(self.keys))
+
+    @classmethod
+    def fit(cls, cells, by=SERIES_DIMENSIONS, halflife_days=None):
+        keys, first_day, values = daily_series(cells, by)
+        model = cls(keys, first_day, halflife_days)
+        model.update(keys, first_day, values)
+        return model
+
+    def update(self, keys, first_day, values):
+        """Fold in the days of `values` after the last folded day; returns how many."""
+        if first_day > self.last_day + 1:
+            # Days without any events count as zeros
+            values = np.hstack([np.zeros((len(values), first_day - self.last_day - 1)), values])
+            first_day = self.last_day + 1
+        new = values[:, self.last_day + 1 - first_day:]
+        if new.shape[1] == 0:
+            return 0
+        rows = self._rows(keys)
+        y = np.zeros((len(self.keys), new.shape[1]))
+        y[rows] = new
+
+        days = np.arange(self.last_day + 1, self.last_day + 1 + new.shape[1])
+        x = design(days, self.first_day)
+        weights = self.decay ** (days[-1] - days).astype(np.float64)
+        old = self.decay ** len(days)
+        self.xx = old * self.xx + (x * weights[:, None]).T @ x
+        self.xx2 = old ** 2 * self.xx2 + (x * weights[:, None] ** 2).T @ x
+        self.w = old * self.w + weights.sum()
+        self.w2 = old ** 2 * self.w2 + (weights ** 2).sum()
+        self.xy = old * self.xy + (y * weights) @ x
+        self.yy = old * self.yy + (y ** 2) @ weights
+        self.last_day = int(days[-1])
+        return len(days)
+
+    def _rows(self, keys):
+        """Row of each of `keys`; series seen for the first time had zero counts so far."""
+        known = pd.MultiIndex.from_frame(self.keys)
+        incoming = pd.MultiIndex.from_frame(keys[list(self.keys.columns)])
+        added = incoming[known.get_indexer(incoming) < 0]
+        if len(added):
+            self.keys = pd.concat([self.keys, added.to_frame(index=False)], ignore_index=True)
+            self.xy = np.vstack([self.xy, np.zeros((len(added), self.xy.shape[1]))])
+            self.yy = np.r_[self.yy, np.zeros(len(added))]
+            known = pd.MultiIndex.from_frame(self.keys)
+        return known.get_indexer(incoming)
+
+    def coefficients(self):
+        """Coefficients per series (one row each) and the residual variance per series."""
+        inverse = np.linalg.pinv(self.xx)
+        beta = self.xy @ inverse
+        p = self.xx.shape[0]
+        # Effective number of days behind the weighted fit
+        n = self.w ** 2 / self.w2 if self.w2 else 0.0
+        residual = np.maximum(self.yy - np.einsum('ij,ij->i', beta, self.xy), 0)
+        variance = residual / self.w * n / (n - p) if n > p else np.full(len(beta), np.nan)
+        return beta, variance
+
+    def forecast(self, horizon=None, levels=LEVELS):
+        """Forecasts for the days after the last folded one, with prediction intervals.
+
+        Returns a frame with one row per (series, day): the series keys, `day`,
+        `forecast` and a `lower_<level>`/`upper_<level>` pair per interval level.
+        Counts cannot go below zero, so neither do forecasts and bounds.
+        """
+        horizon = horizon or config.FORECAST_DAYS
+        beta, variance = self.coefficients()
+        days = np.arange(self.last_day + 1, self.last_day + 1 + horizon)
+        x = design(days, self.first_day)
+        inverse = np.linalg.pinv(self.xx)
+        # Sandwich variance of the weighted fit, shared by every series
+        spread = np.einsum('ij,jk,ik->i', x @ inverse, self.xx2, x @ inverse)
+        mean = beta @ x.T
+        sd = np.sqrt(variance[:, None] * (1 + spread[None, :]))
+        frame = self.keys.loc[self.keys.index.repeat(horizon)].reset_index(drop=True)
+        frame['day'] = timekeys.to_dates(np.tile(days, len(self.keys)))
+        frame['forecast'] = np.maximum(mean, 0).ravel()
+        for level in levels:
+            z = NormalDist().inv_cdf(0.5 + level / 2)
+            frame[f'lower_{level:g}'] = np.maximum(mean - z * sd, 0).ravel()
+            frame[f'upper_{level:g}'] = np.maximum(mean + z * sd, 0).ravel()
+        return frame
+
+    def save(self, path):
+        tmp_path = path + '.tmp.npz'
+        keys = {f'key_{column}': np.asarray(self.keys[column], dtype=str) for column in self.keys.columns}
+        np.savez(
+            tmp_path, days=[self.first_day, self.last_day], halflife_days=self.halflife_days,
+            xx=self.xx, xx2=self.xx2, w=[self.w, self.w2], xy=self.xy, yy=self.yy, **keys,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as state:
+            keys = pd.DataFrame({name[4:]: state[name] for name in state.files if name.startswith('key_')})
+            model = cls(keys, int(state['days'][0]), float(state['halflife_days']))
+            model.last_day = int(state['days'][1])
+            model.xx, model.xx2, model.xy, model.yy = state['xx'], state['xx2'], state['xy'], state['yy']
+            model.w, model.w2 = (float(value) for value in state['w'])
+        return model
+
+
+def _path(route, store_dir=None):
+    import ingest
+    return os.path.join(ingest.route_dir(route, store_dir or ingest.STORE_DIR), STATE_NAME)
+
+
+def update_route(route, store_dir, cells):
+    """Extend a route's stored fit with the days of `cells` (the batch's partition cubes).
+
+    A batch reaching back into days already folded in, or a changed
+    half-life, refits from the route's full cube instead.
+    """
+    import ingest
+    path = _path(route, store_dir)
+    keys, first_day, values = daily_series(cells)
+    try:
+        model = DemandModel.load(path)
+    except (OSError, ValueError):
+        model = None
+    if model is None or first_day <= model.last_day or model.halflife_days != config.FORECAST_HALFLIFE_DAYS:
+        model = DemandModel.fit(ingest.load_cells(route, store_dir))
+    elif len(keys):
+        model.update(keys, first_day, values)
+    model.save(path)
+    return model
+
+
+def _stored_model(route, cells):
+    """The route store's fit when it covers exactly the days of `cells`."""
+    try:
+        model = DemandModel.load(_path(route))
+    except (OSError, ValueError):
+        return None
+    days = timekeys.day_keys(cells.loc[cells['event_name'] == DEMAND_EVENT, 'day'])
+    if not len(days) or (model.first_day, model.last_day) != (days.min(), days.max()):
+        return None
+    return model if model.halflife_days == config.FORECAST_HALFLIFE_DAYS else None
+
+
+# Fits per (shared, cached) dataset, so reruns of the app do not repeat them
+_models = weakref.WeakKeyDictionary()
+
+
+def demand_model(data, by=SERIES_DIMENSIONS):
+    """Fitted DemandModel of a dataset's series, reusing its route store's fit when current."""
+    by = [by] if isinstance(by, str) else list(by)
+    models = _models.setdefault(data, {})
+    if tuple(by) not in models:
+        model = None
+        if data.route is not None and by == SERIES_DIMENSIONS and not getattr(data, 'selection', None):
+            model = _stored_model(data.route, data.cube)
+        models[tuple(by)] = model or DemandModel.fit(data.cube, by)
+    return models[tuple(by)]
+
+
+def main():
+    import data_store
+    import filters
+    parser = argparse.ArgumentParser(description="Fit every daily demand series of a route and time the batch fit.")
+    parser.add_argument('--route', default=config.DEFAULT_ROUTE)
+    parser.add_argument('--horizon', type=int, default=None)
+    args = parser.parse_args()
+    cells = data_store.load_dataset(args.route, selection=filters.Filters()).cube
+    start = time.perf_counter()
+    model = DemandModel.fit(cells)
+    fitted = time.perf_counter() - start
+    forecasts = model.forecast(args.horizon)
+    print(forecasts.to_string(index=False))
+    print(f"{len(model.keys)} series over {model.last_day - model.first_day + 1} days fitted in {fitted * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
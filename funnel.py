@@ -0,0 +1,141 @@
+# Ordered, user-level conversion funnel over the event table
+import numpy as np
+import pandas as pd
+
+import config
+
+STAGES = ['Transfer Created', 'Transfer Funded', 'Transfer Transferred']
+FUNNEL_DIMENSIONS = ['region', 'platform', 'experience']
+
+_NEVER = np.iinfo(np.int64).max
+
+
+def _first_per_user(users, mask):
+    """Positions of the first row per user among rows where `mask` holds.
+
+    `users` must be sorted, so the first masked row of a user is also the
+    earliest one.
+    """
+    rows = np.flatnonzero(mask)
+    if len(rows) == 0:
+        return rows
+    keep = np.empty(len(rows), dtype=bool)
+    keep[0] = True
+    np.not_equal(users[rows[1:]], users[rows[:-1]], out=keep[1:])
+    return rows[keep]
+
+
+class FunnelIndex:
+    """Events sorted once by (user, time, stage) for funnel queries.
+
+    A user enters the funnel at their first stage-one event and reaches each
+    later stage at the first matching event that is no earlier than the
+    previous stage and within the conversion window of entry.
+    """
+
+    def __init__(self, users, times, stages, dimensions, n_users, stage_names, rows):
+        self.users = users
+        self.times = times
+        self.stages = stages
+        self.dimensions = dimensions
+        self.n_users = n_users
+        self.stage_names = stage_names
+        # Position of each sorted event in the original frame
+        self.rows = rows
+
+    @classmethod
+    def build(cls, df, stage_names=STAGES):
+        users = df['user'].to_numpy()
+        n_users = int(users.max()) + 1 if len(users) else 0
+        times = df['dt'].to_numpy().astype('datetime64[s]').astype(np.int64)
+        stages = pd.Categorical(df['event_name'], categories=stage_names).codes.astype(np.int8)
+
+        n_stages = len(stage_names)
+        span = int(times.max() - times.min()) + 1 if len(times) else 1
+        if n_users * span * n_stages < _NEVER:
+            # One combined integer key sorts faster than a three-way lexsort.
+            # The sort is stable so that, among a user's simultaneous entry
+            # events, the first one in file order decides their region etc.
+            key = (users.astype(np.int64) * span + (times - times.min())) * n_stages + stages
+            order = np.argsort(key, kind='stable')
+        else:
+            order = np.lexsort((stages, times, users))
+
+        dimensions = {}
+        for column in FUNNEL_DIMENSIONS:
+            values = pd.Categorical(df[column])
+            dimensions[column] = (values.codes[order], values.categories)
+        rows = order.astype(np.int32 if len(order) < 2 ** 31 else np.int64)
+        return cls(users[order], times[order], stages[order], dimensions, n_users, list(stage_names), rows)
+
+    def select(self, mask):
+        """Index over only the events where `mask` (in original row order) holds.
+
+        Keeping a subset of the sorted events leaves them sorted, so no
+        re-sort is needed.
+        """
+        # Gathering by position is several times faster than boolean indexing
+        keep = np.flatnonzero(mask[self.rows])
+        dimensions = {column: (codes.take(keep), categories) for column, (codes, categories) in self.dimensions.items()}
+        return FunnelIndex(
+            self.users.take(keep), self.times.take(keep), self.stages.take(keep), dimensions, self.n_users,
+            self.stage_names, self.rows.take(keep),
+        )
+
+    def reached(self, window_days=None):
+        """Per-user time each stage was reached (`_NEVER` when it was not) and entry rows."""
+        if window_days is None:
+            window_days = config.FUNNEL_WINDOW_DAYS
+        window = int(window_days * 86400)
+
+        entry_rows = _first_per_user(self.users, self.stages == 0)
+        entry = np.full(self.n_users, _NEVER, dtype=np.int64)
+        entry[self.users[entry_rows]] = self.times[entry_rows]
+        deadline = np.where(entry == _NEVER, -1, entry + window)
+
+        reached = [entry]
+        previous = entry
+        for stage in range(1, len(self.stage_names)):
+            mask = (
+                (self.stages == stage)
+                & (self.times >= previous[self.users])
+                & (self.times <= deadline[self.users])
+            )
+            rows = _first_per_user(self.users, mask)
+            current = np.full(self.n_users, _NEVER, dtype=np.int64)
+            current[self.users[rows]] = self.times[rows]
+            reached.append(current)
+            previous = current
+        return reached, entry_rows
+
+    def conversion(self, by=None, window_days=None):
+        """Users reaching each stage, split by any of region/platform/experience.
+
+        A user's split values are taken from the event where they entered the
+        funnel. Returns a Series (no split) or a DataFrame with one column per
+        stage.
+        """
+        reached, entry_rows = self.reached(window_days)
+        entered = self.users[entry_rows]
+        counts = {
+            name: (reached_at[entered] != _NEVER)
+            for name, reached_at in zip(self.stage_names, reached)
+        }
+        if by is None:
+            return pd.Series({name: int(hit.sum()) for name, hit in counts.items()})
+
+        by = [by] if isinstance(by, str) else list(by)
+        frame = pd.DataFrame({
+            column: pd.Categorical.from_codes(self.dimensions[column][0][entry_rows], self.dimensions[column][1])
+            for column in by
+        })
+        for name, hit in counts.items():
+            frame[name] = hit
+        return frame.groupby(by, observed=True)[self.stage_names].sum()
+
+
+def stage_percentages(funnel):
+    """Each stage as a percentage of the users who entered the funnel."""
+    if isinstance(funnel, pd.DataFrame):
+        return funnel.div(funnel.iloc[:, 0], axis=0) * 100
+    return funnel / funnel.iloc[0] * 100
@@ -1,10 +1,14 @@
 import streamlit as st
 
 def display():
-    st.title("User Activity and Event Analysis")
-    st.subheader("Overview")
+    introduction()
 
-    st.markdown("""
+
+def introduction(out=st):
+    out.title("User Activity and Event Analysis")
+    out.subheader("Overview")
+
+    out.markdown("""
     This dashboard provides an in-depth analysis of user activities and events related to regional transfers at Wise. The dataset contains detailed records to help uncover insights about trends, user behaviors, platform preferences, and regional variations.
 
     ### Dataset Description
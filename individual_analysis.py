@@ -1,69 +1,64 @@
 # Import necessary libraries
 import streamlit as st
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import plotly.express as px
+
+import charts
+import config
+import cube
+import data_store
+import sections
 
 def display():
-    sns.set(style="whitegrid")
+    # Load the dataset
+    data = data_store.load_dataset()
 
-    # Load data function with caching
-    @st.cache_data
-    def load_data(file_path):
-        df = pd.read_excel(file_path)
-        df['dt'] = pd.to_datetime(df['dt'])
-        df['month'] = df['dt'].dt.to_period('M')
-        df['week'] = df['dt'].dt.to_period('W')
-        df['day'] = df['dt'].dt.date
-        return df
+    # Streamlit layout starts here
+    introduction()
 
-    # File path
-    file_path = 'data/Wise funnel events regional - Data.xlsx'
+    sections.render_sections(SECTIONS, data)
 
-    # Load the dataset
-    df = load_data(file_path)
 
-    # Streamlit layout starts here
-    st.title("Individual Analysis of Key User Attributes")
-    st.write("The following plots contain the individual analysis for all the columns present in the dataset.")
+def introduction(out=st):
+    out.title("Individual Analysis of Key User Attributes")
+    out.write("The following plots contain the individual analysis for all the columns present in the dataset.")
+
+
+def section_1(data, out=st):
+    # Plotly loads with the first chart that needs it
+    import plotly.express as px
 
     # Event Breakdown
-    st.header("1. Event Breakdown")
-    st.markdown("**Type:** Funnel Chart")
-    st.markdown("**Description:** This chart illustrates the total amount of transfers associated with each key event: Transfer Created, Transfer Funded, and Transfer Transferred.")
-    transition_counts = df['event_name'].value_counts()
-    labels = transition_counts.index.tolist()
-    values = transition_counts.values.tolist()
+    out.header("1. Event Breakdown")
+    out.markdown("**Type:** Funnel Chart")
+    out.markdown(f"**Description:** This chart illustrates the number of users reaching each key event in order: Transfer Created, then Transfer Funded, then Transfer Transferred, within {config.FUNNEL_WINDOW_DAYS:g} days of creating a transfer.")
+    stage_users = data.funnel.conversion()
+    labels = stage_users.index.tolist()
+    values = stage_users.values.tolist()
     fig = px.funnel(
         y=labels,
         x=values,
         color_discrete_sequence=px.colors.sequential.Sunset
     )
-    st.plotly_chart(fig)
-    st.markdown("""
+    out.plotly_chart(fig)
+    out.markdown("""
         ##### Insight:
         - The most frequent event is **Transfer Created**, indicating that initiating transfers is the primary activity among users.
         - However, the relatively lower occurrences of **Transfer Funded** and **Transfer Transferred** suggest a significant drop-off in the transfer process.
         - This highlights a potential opportunity to investigate why many transfers are created but do not progress to completion. Addressing this gap could improve overall user satisfaction and business outcomes.
     """)
 
+
+def section_2(data, out=st):
     # Transfers Distribution Over Month
-    st.header("2. Transfer Distribution")
-    st.markdown("**Description:** This section explores the distribution of transfers over time, analyzed by month, week, and day. These visualizations provide insights into how the transfer activity evolves and fluctuates over different time intervals.")
+    out.header("2. Transfer Distribution")
+    out.markdown("**Description:** This section explores the distribution of transfers over time, analyzed by month, week, and day. These visualizations provide insights into how the transfer activity evolves and fluctuates over different time intervals.")
 
     # By Month
-    st.subheader("2.1. By Month")
-    st.markdown("**Type:** Line Chart")
-    st.markdown("**Description:** This chart visualizes the monthly trends in the number of transfers, providing an aggregated view of how activity evolves over time.")
-    monthly_counts = df.groupby('month')['event_name'].count()
-    fig, ax = plt.subplots(figsize=(12, 5))
-    monthly_counts.plot(kind='line', marker='o', title='Transfers Distribution by Month', color='teal', ax=ax)
-    plt.xlabel('Month')
-    plt.ylabel('Number of Transfers')
-    plt.grid(True)
-    st.pyplot(fig)
-    st.markdown("""
+    out.subheader("2.1. By Month")
+    out.markdown("**Type:** Line Chart")
+    out.markdown("**Description:** This chart visualizes the monthly trends in the number of transfers, providing an aggregated view of how activity evolves over time.")
+    monthly_counts = cube.rollup(data.cube, 'month')
+    charts.line('2.1-monthly-transfers', monthly_counts, figsize=(12, 5), title='Transfers Distribution by Month', color='teal', xlabel='Month', ylabel='Number of Transfers', grid=True, out=out)
+    out.markdown("""
         ##### Insight:
         - The data is available only for **January** and **February**.
         - In **January**, the number of transfers was around **30,000**, while in **February** it increased to approximately **40,000**.
@@ -71,17 +66,12 @@ def display():
     """)
 
     # By Week
-    st.subheader("2.2. By Week")
-    st.markdown("**Type:** Line Chart")
-    st.markdown("**Description:** This chart visualizes the weekly trends in the number of transfers, highlighting fluctuations and patterns in user activity throughout the weeks.")
-    weekly_counts = df.groupby('week')['event_name'].count()
-    fig, ax = plt.subplots(figsize=(12, 5))
-    weekly_counts.plot(kind='line', marker='o', title='Transfers Distribution by Week', color='orange', ax=ax)
-    plt.xlabel('Week')
-    plt.ylabel('Number of Transfers')
-    plt.grid(True)
-    st.pyplot(fig)
-    st.markdown("""
+    out.subheader("2.2. By Week")
+    out.markdown("**Type:** Line Chart")
+    out.markdown("**Description:** This chart visualizes the weekly trends in the number of transfers, highlighting fluctuations and patterns in user activity throughout the weeks.")
+    weekly_counts = cube.rollup(data.cube, 'week')
+    charts.line('2.2-weekly-transfers', weekly_counts, figsize=(12, 5), title='Transfers Distribution by Week', color='orange', xlabel='Week', ylabel='Number of Transfers', grid=True, out=out)
+    out.markdown("""
         ##### Insight:
         - **Weekly fluctuations** can be seen in the chart, with some weeks having more transfers than others.
         - The **peak weeks** indicate high user activity, while **dip weeks** may suggest lower engagement or external factors affecting transfer volume.
@@ -89,33 +79,27 @@ def display():
     """)
 
     # By Day
-    st.subheader("2.3. By Day")
-    st.markdown("**Type:** Line Chart")
-    st.markdown("**Description:** This chart provides a daily breakdown of transfer events, showing how user activity varies from day to day.")
-    daily_counts = df.groupby('day')['event_name'].count()
-    fig, ax = plt.subplots(figsize=(12, 5))
-    daily_counts.plot(kind='line', marker='o', title='Transfers Distribution by Day', color='purple', ax=ax)
-    plt.xlabel('Day')
-    plt.ylabel('Number of Transfers')
-    plt.grid(True)
-    st.pyplot(fig)
-    st.markdown("""
+    out.subheader("2.3. By Day")
+    out.markdown("**Type:** Line Chart")
+    out.markdown("**Description:** This chart provides a daily breakdown of transfer events, showing how user activity varies from day to day.")
+    daily_counts = cube.rollup(data.cube, 'day')
+    charts.line('2.3-daily-transfers', daily_counts, figsize=(12, 5), title='Transfers Distribution by Day', color='purple', xlabel='Day', ylabel='Number of Transfers', grid=True, export=True, out=out)
+    out.markdown("""
         ##### Insight:
         - This chart shows the **daily trends** in transfers, highlighting specific days with **higher or lower activity**.
         - Certain days may show spikes in transfer activity, which could correlate with user behavior, promotions, or external factors (e.g., weekends or holidays).
         - Analyzing these trends helps identify specific days where user activity is concentrated, allowing for targeted strategies or operational adjustments.
     """)
 
+
+def section_3(data, out=st):
     # Region Distribution
-    st.header("3. Region Distribution")
-    st.markdown("**Type:** Pie Chart")
-    st.markdown("**Description:** This chart illustrates the distribution of events across various regions, providing a visual representation of where the majority of user activity is concentrated.")
-    region_counts = df['region'].value_counts()
-    fig, ax = plt.subplots(figsize=(8, 5))
-    region_counts.plot(kind='pie', autopct='%1.1f%%', colors=sns.color_palette('pastel'), ax=ax)
-    plt.ylabel('')
-    st.pyplot(fig)
-    st.markdown("""
+    out.header("3. Region Distribution")
+    out.markdown("**Type:** Pie Chart")
+    out.markdown("**Description:** This chart illustrates the distribution of events across various regions, providing a visual representation of where the majority of user activity is concentrated.")
+    region_counts = cube.rollup(data.cube, 'region').sort_values(ascending=False)
+    charts.pie('3-region-distribution', region_counts, figsize=(8, 5), palette='pastel', out=out)
+    out.markdown("""
         ##### Insight:
         - The distribution of transfers across three regions is as follows:
             - **Other**: 38.2%
@@ -125,38 +109,35 @@ def display():
         - Europe follows closely behind, while North America accounts for a smaller share of the total transfer activity.
     """)
 
+
+def section_4(data, out=st):
     # Platform Distribution
-    st.header("4. Platform Distribution")
-    st.markdown("**Type:** Bar Chart")
-    st.markdown("**Description:** This chart displays the distribution of platforms used for transfers, offering a detailed look at how users engage with the platform across different devices.")
-    platform_counts = df['platform'].value_counts()
-    fig, ax = plt.subplots(figsize=(8, 5))
-    sns.barplot(x=platform_counts.index, y=platform_counts.values, palette='viridis', ax=ax)
-    plt.title('Platform Distribution')
-    plt.xlabel('Platform')
-    plt.ylabel('Number of Transfers')
-    st.pyplot(fig)
-    st.markdown("""
+    out.header("4. Platform Distribution")
+    out.markdown("**Type:** Bar Chart")
+    out.markdown("**Description:** This chart displays the distribution of platforms used for transfers, offering a detailed look at how users engage with the platform across different devices.")
+    platform_counts = cube.rollup(data.cube, 'platform').sort_values(ascending=False)
+    charts.bar('4-platform-distribution', platform_counts, figsize=(8, 5), palette='viridis', title='Platform Distribution', xlabel='Platform', ylabel='Number of Transfers', out=out)
+    out.markdown("""
         ##### Insight:
         - **Android** leads with the highest number of transfers, with approximately **26,000** transfers made from this platform.
         - **iOS** follows with around **24,000** transfers, while the **Web** platform accounts for around **18,000** transfers.
         - This suggests that mobile platforms (Android and iOS) are the preferred choice for users, with web usage trailing behind.
     """)
 
+
+def section_5(data, out=st):
     # User Experience Distribution
-    st.header("5. User Experience Distribution")
-    st.markdown("**Type:** Bar Chart")
-    st.markdown("**Description:** This chart provides a clear view of the distribution of user experience categories, showcasing the breakdown of users based on their experience level with the platform. ")
-    experience_counts = df['experience'].value_counts()
-    fig, ax = plt.subplots(figsize=(8, 5))
-    sns.barplot(x=experience_counts.index, y=experience_counts.values, palette='muted', ax=ax)
-    plt.title('User Experience Distribution')
-    plt.xlabel('Experience')
-    plt.ylabel('Count')
-    st.pyplot(fig)
-    st.markdown("""
+    out.header("5. User Experience Distribution")
+    out.markdown("**Type:** Bar Chart")
+    out.markdown("**Description:** This chart provides a clear view of the distribution of user experience categories, showcasing the breakdown of users based on their experience level with the platform. ")
+    experience_counts = cube.rollup(data.cube, 'experience').sort_values(ascending=False)
+    charts.bar('5-experience-distribution', experience_counts, figsize=(8, 5), palette='muted', title='User Experience Distribution', xlabel='Experience', ylabel='Count', out=out)
+    out.markdown("""
         ##### Insight:
         - The distribution of user experiences shows a mix of **new** and **existing** users.
         - Understanding the breakdown between new users and those with more experience can provide insights into onboarding effectiveness, user retention, and overall satisfaction with the platform.
         - Strategies aimed at improving the experience for both groups may be beneficial.
-    """)
\ No newline at end of file
+    """)
+
+
+SECTIONS = [section_1, section_2, section_3, section_4, section_5]
@@ -0,0 +1,293 @@
+# Incremental ingestion of daily event drops into a route- and date-partitioned store
+#
+#   python ingest.py --route MXN-USD drops/2024-03-02.csv drops/2024-03-03.parquet
+#   python ingest.py --precompute --workers 8
+#
+# Every route (a source-target currency pair) has its own directory with its
+# own manifest, so a route is loaded without touching any other. Each batch is
+# split by event date and written as one parquet part per partition, named
+# after the batch's content hash. Only the partitions a batch touches get their
+# cube recomputed, and the manifest records every batch so re-ingesting the
+# same file is a no-op. A process reloading a route reads and sketches only
+# new or changed partitions, but still rebuilds the route's event table and
+# the indexes over it from every partition (see data_store.StoreDataset).
+# Each new batch is also checked for funnel-integrity anomalies (see
+# anomalies.py) and folded into the route's demand forecasts (see
+# forecast.py). `--precompute` rebuilds the per-route aggregates in parallel
+# worker processes.
+import argparse
+import functools
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import pandas as pd
+
+import anomalies
+import config
+import cube
+import data_store
+import forecast
+import sketches
+
+STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'store')
+MANIFEST_NAME = 'manifest.json'
+CUBE_NAME = 'cube.parquet'
+
+ROUTE_PATTERN = re.compile(r'^[A-Za-z0-9]+(-[A-Za-z0-9]+)*$')
+
+
+def route_dir(route, store_dir=STORE_DIR):
+    if not ROUTE_PATTERN.match(route):
+        raise ValueError(f'Invalid route name: {route!r}')
+    return os.path.join(store_dir, f'route={route}')
+
+
+def list_routes(store_dir=STORE_DIR):
+    """Routes with at least one ingested batch."""
+    if not os.path.isdir(store_dir):
+        return []
+    return sorted(
+        name.split('=', 1)[1] for name in os.listdir(store_dir)
+        if name.startswith('route=') and os.path.exists(os.path.join(store_dir, name, MANIFEST_NAME))
+    )
+
+
+def manifest_path(route, store_dir=STORE_DIR):
+    return os.path.join(route_dir(route, store_dir), MANIFEST_NAME)
+
+
+def read_manifest(route, store_dir=STORE_DIR):
+    try:
+        with open(manifest_path(route, store_dir)) as f:
+            return json.load(f)
+    except OSError:
+        return {'batches': {}, 'partitions': {}}
+
+
+def write_manifest(manifest, route, store_dir=STORE_DIR):
+    path = manifest_path(route, store_dir)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def partition_dir(date, route, store_dir=STORE_DIR):
+    return os.path.join(route_dir(route, store_dir), f'date={date}')
+
+
+def read_batch(file_path):
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == '.csv':
+        df = pd.read_csv(file_path)
+    elif extension == '.parquet':
+        df = pd.read_parquet(file_path)
+    elif extension in ('.xlsx', '.xls'):
+        df = pd.read_excel(file_path)
+    else:
+        raise ValueError(f'Unsupported event file: {file_path}')
+    return data_store.normalize_events(df)
+
+
+def _write_parquet(df, path):
+    tmp_path = path + '.tmp'
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def read_partition(date, route, store_dir=STORE_DIR):
+    directory = partition_dir(date, route, store_dir)
+    parts = sorted(name for name in os.listdir(directory) if name.startswith('part-'))
+    return data_store.concat_frames([pd.read_parquet(os.path.join(directory, name)) for name in parts])
+
+
+def _partitions_signature(manifest):
+    """Digest of the partition list; the route cube is valid only for this exact list."""
+    return hashlib.sha256(json.dumps(manifest['partitions'], sort_keys=True).encode()).hexdigest()
+
+
+def ingest_file(file_path, route=None, store_dir=STORE_DIR):
+    """Append one event drop to a route; returns the partitions it touched."""
+    route = route or config.DEFAULT_ROUTE
+    os.makedirs(route_dir(route, store_dir), exist_ok=True)
+    manifest = read_manifest(route, store_dir)
+    digest = data_store.file_fingerprint(file_path)['sha256']
+    if digest in manifest['batches']:
+        return []
+
+    batch = read_batch(file_path)
+    part_name = f'part-{digest[:16]}.parquet'
+    dates = batch['dt'].dt.strftime('%Y-%m-%d')
+    touched = sorted(dates.unique())
+    touched_cells = []
+    for date in touched:
+        directory = partition_dir(date, route, store_dir)
+        os.makedirs(directory, exist_ok=True)
+        _write_parquet(batch[dates == date].reset_index(drop=True), os.path.join(directory, part_name))
+
+        # Recount only this day; every other partition keeps its cube
+        events = read_partition(date, route, store_dir)
+        touched_cells.append(cube.count_cells(events))
+        _write_parquet(touched_cells[-1], os.path.join(directory, CUBE_NAME))
+        partition = manifest['partitions'].setdefault(date, {'parts': [], 'rows': 0})
+        if part_name not in partition['parts']:
+            partition['parts'].append(part_name)
+        partition['rows'] = len(events)
+
+    manifest['batches'][digest] = {
+        'source': os.path.abspath(file_path),
+        'rows': len(batch),
+        'partitions': touched,
+        'ingested_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    }
+    write_manifest(manifest, route, store_dir)
+    # Only this batch's counts go through the detector
+    anomalies.observe_batch(batch, route, store_dir)
+    forecast.update_route(route, store_dir, data_store.concat_frames(touched_cells))
+    return touched
+
+
+def precompute_route(route, store_dir=STORE_DIR):
+    """Recount every partition cube of a route and write the route-wide cube."""
+    start = time.perf_counter()
+    manifest = read_manifest(route, store_dir)
+    cells = []
+    for date in sorted(manifest['partitions']):
+        partition_cells = cube.count_cells(read_partition(date, route, store_dir))
+        _write_parquet(partition_cells, os.path.join(partition_dir(date, route, store_dir), CUBE_NAME))
+        cells.append(partition_cells)
+    _write_parquet(data_store.concat_frames(cells), os.path.join(route_dir(route, store_dir), CUBE_NAME))
+    manifest['cube'] = _partitions_signature(manifest)
+    write_manifest(manifest, route, store_dir)
+    return {
+        'route': route,
+        'partitions': len(manifest['partitions']),
+        'rows': sum(entry['rows'] for entry in manifest['partitions'].values()),
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def precompute(routes=None, store_dir=STORE_DIR, workers=None):
+    """Precompute every route (or `routes`) in a pool of worker processes."""
+    routes = routes or list_routes(store_dir)
+    with ProcessPoolExecutor(workers) as pool:
+        return list(pool.map(functools.partial(precompute_route, store_dir=store_dir), routes))
+
+
+# Partition frames and sketches already built by this process, keyed by
+# partition directory and its manifest entry, so a reload only reads and
+# sketches partitions that changed. Only the most recently loaded routes are
+# kept.
+_CACHED_ROUTES = 4
+_partition_cache = OrderedDict()
+_partition_lock = threading.Lock()
+
+
+def _cached_partition(kind, date, entry, route, store_dir):
+    directory = partition_dir(date, route, store_dir)
+    with _partition_lock:
+        cached = _partition_cache.get(route, {}).get((kind, directory))
+    if cached is not None and cached[0] == tuple(entry['parts']):
+        return cached[1]
+    return None
+
+
+def _cache_partition(kind, date, entry, route, store_dir, value):
+    directory = partition_dir(date, route, store_dir)
+    with _partition_lock:
+        _partition_cache.setdefault(route, {})[(kind, directory)] = (tuple(entry['parts']), value)
+        _partition_cache.move_to_end(route)
+        while len(_partition_cache) > _CACHED_ROUTES:
+            _partition_cache.popitem(last=False)
+    return value
+
+
+def _load_partition(date, entry, route, store_dir):
+    events = _cached_partition('events', date, entry, route, store_dir)
+    if events is None:
+        events = _cache_partition('events', date, entry, route, store_dir, read_partition(date, route, store_dir))
+    return events
+
+
+def _load_cells(route, manifest, store_dir):
+    """The precomputed route cube when it covers every partition, else the partition cubes."""
+    path = os.path.join(route_dir(route, store_dir), CUBE_NAME)
+    if manifest.get('cube') == _partitions_signature(manifest) and os.path.exists(path):
+        return pd.read_parquet(path)
+    return data_store.concat_frames([
+        pd.read_parquet(os.path.join(partition_dir(date, route, store_dir), CUBE_NAME))
+        for date in sorted(manifest['partitions'])
+    ])
+
+
+def load_cells(route, store_dir=STORE_DIR):
+    """Cube of one route, without reading its events."""
+    return cube.add_period_keys(_load_cells(route, read_manifest(route, store_dir), store_dir))
+
+
+def load_store(route, store_dir=STORE_DIR):
+    """Events and cube of one route, reading only new or changed partitions."""
+    manifest = read_manifest(route, store_dir)
+    events = [_load_partition(date, entry, route, store_dir) for date, entry in sorted(manifest['partitions'].items())]
+    return data_store.concat_frames(events), cube.add_period_keys(_load_cells(route, manifest, store_dir))
+
+
+def load_sketches(route, precision, store_dir=STORE_DIR):
+    """Distinct-user sketches of one route, sketching only new or changed partitions.
+
+    Every sketch bucket is a single day, so the partitions' sketches are
+    disjoint and the route's are just their concatenation.
+    """
+    kind = f'sketches-{precision}'
+    partitions = sorted(read_manifest(route, store_dir)['partitions'].items())
+    parts = {date: _cached_partition(kind, date, entry, route, store_dir) for date, entry in partitions}
+    missing = [(date, entry) for date, entry in partitions if parts[date] is None]
+    if missing:
+        # One pass over every changed partition, split back into days
+        events, user_ids = data_store.compact_events(data_store.concat_frames(
+            [_load_partition(date, entry, route, store_dir) for date, entry in missing]
+        ))
+        built = sketches.UserSketches.build(events, user_ids, precision)
+        days = built.keys['day'].dt.strftime('%Y-%m-%d').to_numpy()
+        for date, entry in missing:
+            parts[date] = _cache_partition(kind, date, entry, route, store_dir, built.select(days == date))
+    return sketches.UserSketches.concat([parts[date] for date, _ in partitions])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingest daily event drops (CSV, Parquet or Excel) into the partitioned store.')
+    parser.add_argument('files', nargs='*')
+    parser.add_argument('--route', default=config.DEFAULT_ROUTE, help='route the files belong to, e.g. MXN-USD')
+    parser.add_argument('--store', default=STORE_DIR)
+    parser.add_argument('--precompute', action='store_true', help='rebuild the aggregates of every route (or of --route when files are given)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes for --precompute (default: one per CPU)')
+    args = parser.parse_args()
+    if not args.files and not args.precompute:
+        parser.error('give event files to ingest and/or --precompute')
+
+    for file_path in args.files:
+        start = time.perf_counter()
+        touched = ingest_file(file_path, args.route, args.store)
+        elapsed = time.perf_counter() - start
+        if touched:
+            print(f'{args.route} {file_path}: {len(touched)} partition(s) updated in {elapsed:.2f}s ({touched[0]} .. {touched[-1]})')
+        else:
+            print(f'{args.route} {file_path}: already ingested, skipped')
+
+    if args.precompute:
+        start = time.perf_counter()
+        results = precompute([args.route] if args.files else None, args.store, args.workers)
+        for result in results:
+            print(f"{result['route']}: {result['partitions']} partition(s), {result['rows']:,} rows in {result['seconds']:.2f}s")
+        print(f'{len(results)} route(s) precomputed in {time.perf_counter() - start:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
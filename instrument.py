@@ -0,0 +1,227 @@
+# Timing and memory instrumentation for pages and sections
+#
+# Enabled with ROUTE_APP_INSTRUMENT=1. Every page display() and numbered
+# section is then measured: wall time, CPU time of the running thread, peak
+# traced memory above the starting point (ROUTE_APP_INSTRUMENT_MEMORY,
+# tracemalloc; its peak is process-wide, so sections then run serially and
+# concurrent sessions still blur each other's peaks), render-cache hits and
+# misses, dataset cache misses and the bytes of figures sent to the browser.
+# Measurements are shown in a debug sidebar, appended to a JSON-lines log
+# and/or written as a Prometheus textfile. While disabled, `instrumented`
+# returns the function unchanged and `measure`/`count` return immediately.
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+
+import streamlit as st
+
+import config
+
+# Measurement currently open in this context, and the list collecting this
+# script run's measurements; both follow sections onto the thread pool
+_current = contextvars.ContextVar('instrument_current', default=None)
+_run = contextvars.ContextVar('instrument_run', default=None)
+
+_lock = threading.Lock()
+# Recent measurements of every session, newest last
+recent = deque(maxlen=1000)
+# Running totals per (page, name) for the Prometheus export
+_totals = defaultdict(lambda: defaultdict(float))
+
+_disabled = contextlib.nullcontext()
+
+COUNTERS = ['cache_hits', 'cache_misses', 'data_cache_misses', 'payload_bytes']
+
+
+class Measurement:
+    def __init__(self, name, page):
+        self.name = name
+        self.page = page
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.memory_peak_bytes = None
+        self._child_peak = 0
+
+    def __enter__(self):
+        self._parent = _current.get()
+        self._token = _current.set(self)
+        if config.INSTRUMENT_MEMORY:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            self._memory_start, self._outer_peak = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+        self.started_at = datetime.now(timezone.utc)
+        self._wall = time.perf_counter()
+        self._cpu = time.thread_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall_seconds = time.perf_counter() - self._wall
+        self.cpu_seconds = time.thread_time() - self._cpu
+        if config.INSTRUMENT_MEMORY and tracemalloc.is_tracing():
+            peak = max(tracemalloc.get_traced_memory()[1], self._child_peak)
+            self.memory_peak_bytes = max(peak - self._memory_start, 0)
+            if self._parent is not None:
+                # reset_peak() above hid the parent's own peak from it
+                self._parent._child_peak = max(self._parent._child_peak, peak, self._outer_peak)
+        _current.reset(self._token)
+        if self._parent is not None:
+            # The parent may be a page whose sections finish on several threads
+            with _lock:
+                for key, value in self.counters.items():
+                    self._parent.counters[key] += value
+        _record(self)
+        return False
+
+    def wrap(self, out):
+        return _Output(out, self)
+
+    def as_dict(self):
+        return {
+            'page': self.page,
+            'name': self.name,
+            'started_at': self.started_at.isoformat(timespec='milliseconds'),
+            'wall_seconds': round(self.wall_seconds, 6),
+            'cpu_seconds': round(self.cpu_seconds, 6),
+            'memory_peak_bytes': self.memory_peak_bytes,
+            **self.counters,
+        }
+
+
+class _Output:
+    """Forwards to a Streamlit container, counting the bytes of figures sent through it."""
+
+    def __init__(self, out, measurement):
+        self._out = out
+        self._measurement = measurement
+
+    def __getattr__(self, name):
+        target = getattr(self._out, name)
+        if name == 'image':
+            def image(payload, *args, **kwargs):
+                if isinstance(payload, bytes):
+                    self._measurement.counters['payload_bytes'] += len(payload)
+                return target(payload, *args, **kwargs)
+            return image
+        if name == 'plotly_chart':
+            def plotly_chart(fig, *args, **kwargs):
+                self._measurement.counters['payload_bytes'] += len(fig.to_json())
+                return target(fig, *args, **kwargs)
+            return plotly_chart
+        if name == 'columns':
+            return lambda *args, **kwargs: [_Output(column, self._measurement) for column in target(*args, **kwargs)]
+        return target
+
+
+def _record(measurement):
+    entry = measurement.as_dict()
+    run = _run.get()
+    if run is not None:
+        run.append(entry)
+    with _lock:
+        recent.append(entry)
+        totals = _totals[(entry['page'], entry['name'])]
+        totals['calls'] += 1
+        for key in ['wall_seconds', 'cpu_seconds'] + COUNTERS:
+            totals[key] += entry[key]
+        if entry['memory_peak_bytes'] is not None:
+            totals['memory_peak_bytes'] = max(totals['memory_peak_bytes'], entry['memory_peak_bytes'])
+        if config.INSTRUMENT_LOG:
+            with open(config.INSTRUMENT_LOG, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+    if config.INSTRUMENT_PROMETHEUS and measurement._parent is None:
+        write_prometheus(config.INSTRUMENT_PROMETHEUS)
+
+
+def measure(name, page=None):
+    """Context manager measuring its body; a shared no-op while disabled."""
+    if not config.INSTRUMENT:
+        return _disabled
+    return Measurement(name, page)
+
+
+def count(counter, amount=1):
+    """Add to a counter of the innermost open measurement, if any."""
+    measurement = _current.get()
+    if measurement is not None:
+        measurement.counters[counter] += amount
+
+
+def instrumented(fn, name=None):
+    """`fn` measured on every call; `fn` itself while instrumentation is off.
+
+    A function taking an `out` argument gets it wrapped so the figures it
+    sends are counted.
+    """
+    if not config.INSTRUMENT:
+        return fn
+    takes_out = 'out' in inspect.signature(fn).parameters
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with Measurement(name or fn.__name__, fn.__module__) as measurement:
+            if takes_out:
+                kwargs['out'] = measurement.wrap(kwargs.get('out', st))
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def start_run():
+    """Collect the measurements of the current script run; returns their list."""
+    run = []
+    _run.set(run)
+    return run
+
+
+def prometheus():
+    """Totals since start-up in the Prometheus text exposition format."""
+    metrics = [
+        ('wall_seconds', 'counter', 'Wall time spent in the page or section'),
+        ('cpu_seconds', 'counter', 'CPU time of the thread running the page or section'),
+        ('cache_hits', 'counter', 'Render-cache hits'),
+        ('cache_misses', 'counter', 'Render-cache misses'),
+        ('data_cache_misses', 'counter', 'Dataset loads that missed the cache'),
+        ('payload_bytes', 'counter', 'Bytes of figures sent to the browser'),
+        ('memory_peak_bytes', 'gauge', 'Largest traced-memory peak above the starting point'),
+        ('calls', 'counter', 'Measured calls'),
+    ]
+    with _lock:
+        totals = {key: dict(values) for key, values in _totals.items()}
+    lines = []
+    for metric, kind, help_text in metrics:
+        name = f'route_app_{metric}' + ('_total' if kind == 'counter' else '')
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        for (page, section), values in sorted(totals.items(), key=lambda item: tuple(map(str, item[0]))):
+            lines.append(f'{name}{{page="{page}",name="{section}"}} {round(values.get(metric, 0), 6)!r}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path):
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(prometheus())
+    os.replace(tmp_path, path)
+
+
+def sidebar(run):
+    """Debug sidebar listing this run's measurements, slowest first."""
+    if not config.INSTRUMENT:
+        return
+    with st.sidebar.expander("Performance", expanded=True):
+        if not run:
+            st.caption("Nothing measured in this run.")
+            return
+        rows = sorted(run, key=lambda entry: entry['wall_seconds'], reverse=True)
+        st.dataframe(
+            [{key: entry[key] for key in ['page', 'name', 'wall_seconds', 'cpu_seconds', 'memory_peak_bytes'] + COUNTERS} for entry in rows],
+            hide_index=True,
+        )
+        st.download_button("Download JSON", json.dumps(run, indent=2), file_name='measurements.json', mime='application/json', on_click='ignore')
+        st.download_button("Download Prometheus metrics", prometheus(), file_name='metrics.prom', mime='text/plain', on_click='ignore')
@@ -0,0 +1,162 @@
+# Time between funnel stages, kept as mergeable latency histograms
+#
+# Every event of a stage is matched to the same user's nearest following
+# event of the next stage (a forward merge_asof by user). The matching runs on
+# the FunnelIndex rows, already sorted by (user, time, stage): the next-stage
+# event that follows a row is found with one searchsorted over row positions.
+# Latencies are counted into fixed log-spaced bins per (day, region, platform,
+# experience, transition) bucket of the earlier event, so histograms and
+# percentiles for any filter come from summing stored bins, never from the
+# events.
+import numpy as np
+import pandas as pd
+
+import config
+import cube
+import funnel
+import timekeys
+
+HISTOGRAM_DIMENSIONS = ['day', 'region', 'platform', 'experience', 'transition']
+
+# Readable ranges the charts group the bins into, by upper edge in seconds
+DISPLAY_BUCKETS = {
+    '< 1 min': 60,
+    '1-10 min': 600,
+    '10-60 min': 3600,
+    '1-6 h': 6 * 3600,
+    '6-24 h': 86400,
+    '1-3 days': 3 * 86400,
+    '3-7 days': 7 * 86400,
+    '> 7 days': np.inf,
+}
+
+# Lower bin edges in whole seconds: ten per decade up to ~115 days, plus the
+# display edges so display buckets are exact sums of bins
+EDGES = np.unique(np.r_[
+    0,
+    np.round(10 ** (np.arange(0, 71) / 10)),
+    [edge for edge in DISPLAY_BUCKETS.values() if np.isfinite(edge)],
+]).astype(np.int64)
+
+
+def transitions(stage_names=funnel.STAGES):
+    return [f'{before} -> {after}' for before, after in zip(stage_names, stage_names[1:])]
+
+
+def bin_index(seconds):
+    return np.searchsorted(EDGES, seconds, side='right') - 1
+
+
+class LatencyHistograms:
+    """One row of latency-bin counts per bucket of the earlier event.
+
+    Counts add up, so any set of days, regions, platforms, experiences or
+    transitions merges by summing rows.
+    """
+
+    def __init__(self, keys, counts):
+        self.keys = keys
+        self.counts = counts
+
+    @classmethod
+    def build(cls, index, window_days=None):
+        """Histograms from a funnel.FunnelIndex; matches later than the window are dropped."""
+        if window_days is None:
+            window_days = config.FUNNEL_WINDOW_DAYS
+        window = int(window_days * 86400)
+        names = transitions(index.stage_names)
+
+        first_day = int(index.times.min()) // 86400 if len(index.times) else 0
+        n_days = int(index.times.max()) // 86400 - first_day + 1 if len(index.times) else 0
+        n_cells = n_days * len(names)
+        for column in HISTOGRAM_DIMENSIONS[1:-1]:
+            n_cells *= len(index.dimensions[column][1])
+        cells, bins = [], []
+        for stage in range(1, len(index.stage_names)):
+            before = np.flatnonzero(index.stages == stage - 1)
+            after = np.flatnonzero(index.stages == stage)
+            # The first next-stage row sorting after each earlier row; equal
+            # times sort by stage, so a simultaneous event still follows
+            nearest = np.searchsorted(after, before, side='right')
+            found = nearest < len(after)
+            before, following = before[found], after[nearest[found]]
+            seconds = index.times[following] - index.times[before]
+            matched = (index.users[following] == index.users[before]) & (seconds <= window)
+            before, seconds = before[matched], seconds[matched]
+
+            key = index.times[before] // 86400 - first_day
+            for column in HISTOGRAM_DIMENSIONS[1:-1]:
+                codes, categories = index.dimensions[column]
+                key = key * len(categories) + codes[before]
+            cells.append(key * len(names) + (stage - 1))
+            bins.append(bin_index(seconds))
+        cells = np.concatenate(cells) if cells else np.empty(0, dtype=np.int64)
+        bins = np.concatenate(bins) if bins else np.empty(0, dtype=np.int64)
+
+        # Bucket keys are dense enough to count into a full table directly
+        counts = np.bincount(cells * len(EDGES) + bins, minlength=n_cells * len(EDGES)).reshape(n_cells, len(EDGES))
+        unique = np.flatnonzero(counts.any(axis=1))
+        counts = counts[unique].astype(np.int32)
+
+        # Decode the bucket keys back into columns
+        columns, rest = {}, unique
+        columns['transition'] = pd.Categorical.from_codes(rest % len(names), names)
+        rest = rest // len(names)
+        for column in reversed(HISTOGRAM_DIMENSIONS[1:-1]):
+            categories = index.dimensions[column][1]
+            columns[column] = pd.Categorical.from_codes(rest % len(categories), categories)
+            rest = rest // len(categories)
+        columns['day'] = timekeys.to_dates(rest + first_day)
+        keys = cube.add_period_keys(pd.DataFrame({column: columns[column] for column in HISTOGRAM_DIMENSIONS}))
+        return cls(keys, counts)
+
+    def select(self, mask):
+        """Histograms of only the buckets where `mask` holds."""
+        return LatencyHistograms(self.keys[mask].reset_index(drop=True), self.counts[mask])
+
+    def histogram(self, by=None, **where):
+        """Counts per bin (columns are lower edges in seconds), grouped by `by`."""
+        selected = cube.select(self.keys, **where)
+        counts = self.counts[selected.index.to_numpy()]
+        if by is None:
+            return pd.Series(counts.sum(axis=0), index=pd.Index(EDGES, name='seconds'), name='count')
+        groups = selected.groupby(by, observed=True, sort=True)
+        codes = groups.ngroup().to_numpy()
+        merged = np.zeros((groups.ngroups, len(EDGES)), dtype=np.int64)
+        np.add.at(merged, codes, counts)
+        return pd.DataFrame(merged, index=groups.size().index, columns=pd.Index(EDGES, name='seconds'))
+
+    def display_buckets(self, by=None, **where):
+        """Counts per DISPLAY_BUCKETS range."""
+        histogram = self.histogram(by, **where)
+        labels = pd.cut(EDGES, [-1] + [edge - 1 if np.isfinite(edge) else edge for edge in DISPLAY_BUCKETS.values()], labels=list(DISPLAY_BUCKETS))
+        if by is None:
+            return histogram.groupby(labels, observed=False).sum()
+        return histogram.T.groupby(labels, observed=False).sum().T
+
+    def percentiles(self, by=None, quantiles=(0.5, 0.9, 0.99), **where):
+        """Latency percentiles in seconds, interpolated within the bins."""
+        histogram = self.histogram(by, **where)
+        counts = np.atleast_2d(histogram.to_numpy())
+        values = np.column_stack([_quantile(counts, q) for q in quantiles])
+        columns = [f'p{round(q * 100):g}' for q in quantiles]
+        if by is None:
+            return pd.Series(values[0], index=columns)
+        return pd.DataFrame(values, index=histogram.index, columns=columns)
+
+
+def _quantile(counts, q):
+    """Quantile `q` of each row of bin counts; geometric interpolation inside a bin."""
+    totals = counts.sum(axis=1)
+    cumulative = counts.cumsum(axis=1)
+    target = q * totals
+    bins = np.minimum((cumulative < target[:, None]).sum(axis=1), len(EDGES) - 1)
+    rows = np.arange(len(counts))
+    below = np.where(bins > 0, cumulative[rows, np.maximum(bins - 1, 0)], 0)
+    inside = counts[rows, bins]
+    fraction = np.where(inside > 0, (target - below) / np.maximum(inside, 1), 0.0)
+    lower = EDGES[bins].astype(np.float64)
+    upper = np.r_[EDGES[1:], EDGES[-1] * 10 ** 0.1][bins].astype(np.float64)
+    # Latencies are whole seconds, so the first bin only holds zeros
+    value = np.where(lower > 0, lower * (upper / np.maximum(lower, 1)) ** fraction, 0.0)
+    return np.where(totals > 0, value, np.nan)
@@ -0,0 +1,199 @@
+# Background double-buffered refresh of every route's dataset
+#
+#   python refresh.py --once                      # rebuild every changed route and time it
+#
+# One daemon thread per server process checks the source (the workbook, or
+# the store manifest) of every route sessions loaded recently (see
+# data_store.recent_routes) every ROUTE_APP_REFRESH_SECONDS. Routes nobody
+# opens are never loaded. When a source's size or mtime changed, the new
+# version is built next to the one being served: events are loaded (or
+# attached from their snapshot, see snapshot.py), the aggregates, forecasts
+# and alerts are built and, with ROUTE_APP_REFRESH_PRERENDER, every page's
+# unfiltered charts are drawn into the render cache. Only then is the dataset
+# handed to data_store.publish(), a single reference swap: script runs
+# started before it keep the version they got, later ones get the new one,
+# and none waits for a build. A failed build leaves the previous version in
+# place and is retried at the next check.
+import argparse
+import logging
+import threading
+import time
+import weakref
+from datetime import datetime
+
+import streamlit as st
+
+import config
+import data_store
+import sections
+import warmup
+
+logger = logging.getLogger(__name__)
+
+# Build details of every dataset the refresher published
+_versions = weakref.WeakKeyDictionary()
+
+
+class Refresher:
+    """Rebuilds and publishes routes whose source changed, off the request path."""
+
+    def __init__(self, interval=None, prerender=None):
+        self.interval = interval or config.REFRESH_SECONDS
+        self.prerender = config.REFRESH_PRERENDER if prerender is None else prerender
+        # route -> loader args of its published dataset, and of a build in progress
+        self.published = {}
+        self.building = {}
+        self.errors = {}
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='route-refresher', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        """Check the sources now instead of at the next interval."""
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self.refresh_all()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def refresh_all(self, routes=None):
+        """Refresh the recently loaded routes (or `routes`); returns the routes rebuilt."""
+        rebuilt = []
+        for route in data_store.recent_routes() if routes is None else routes:
+            try:
+                if self.refresh(route):
+                    rebuilt.append(route)
+            except Exception as error:
+                logger.exception('Refreshing route %s failed; still serving its previous version', route)
+                self.errors[route] = f'{type(error).__name__}: {error}'
+        return rebuilt
+
+    def refresh(self, route):
+        """Build and publish the route's dataset if its source changed; returns whether it did."""
+        loader, args = data_store.dataset_source(route)
+        # A route dropped from the published ones is rebuilt when it is loaded again
+        if self.published.get(route) == args and data_store.published(route) is not None:
+            return False
+        started = time.time()
+        self.building[route] = started
+        try:
+            dataset = loader(*args)
+            dataset.route = route
+            warmup.build_aggregates(route, dataset)
+            if self.prerender:
+                _prerender(dataset)
+            _versions[dataset] = {
+                'published_at': time.time(),
+                'seconds': time.time() - started,
+                # Every loader's last argument is its source's mtime
+                'source_mtime': args[-1] / 1e9,
+            }
+            data_store.publish(route, dataset)
+            self.published[route] = args
+            self.errors.pop(route, None)
+        finally:
+            self.building.pop(route, None)
+        return True
+
+
+def _prerender(data):
+    """Draw every page's sections for the unfiltered dataset into the render cache."""
+    import report
+    for _, module in report.PAGES:
+        for section in getattr(module, 'SECTIONS', []):
+            try:
+                sections.record(section, data)
+            except Exception:
+                logger.exception('Prerendering %s failed', section.__name__)
+
+
+_refresher = None
+_refresher_lock = threading.Lock()
+
+
+def start():
+    """The process's refresher, started at the first call."""
+    global _refresher
+    with _refresher_lock:
+        if _refresher is None:
+            _refresher = Refresher()
+            _refresher.start()
+        return _refresher
+
+
+def _age(seconds):
+    if seconds < 90:
+        return f'{seconds:.0f} s'
+    if seconds < 90 * 60:
+        return f'{seconds / 60:.0f} min'
+    return f'{seconds / 3600:.1f} h'
+
+
+def status(route, data):
+    """One line on the age of the snapshot `data` comes from and on any newer one."""
+    version = _versions.get(getattr(data, 'dataset', data))
+    if version is None:
+        text = 'Data loaded directly from the source; background refresh pending'
+    else:
+        source = datetime.fromtimestamp(version['source_mtime']).strftime('%Y-%m-%d %H:%M')
+        text = (
+            f"Data snapshot {_age(time.time() - version['published_at'])} old "
+            f"(source as of {source}, built in {version['seconds']:.1f} s)"
+        )
+    refresher = _refresher
+    if refresher is None:
+        return text
+    if route in refresher.building:
+        text += f' · rebuilding for {_age(time.time() - refresher.building[route])}'
+    elif data_store.published(route) not in (None, getattr(data, 'dataset', data)):
+        text += ' · a newer snapshot loads with your next interaction'
+    if route in refresher.errors:
+        text += f' · last refresh failed ({refresher.errors[route]})'
+    return text
+
+
+def sidebar(route, data):
+    """Sidebar caption with the snapshot's age, updated every minute while the page is open."""
+    if _refresher is not None and data_store.published(route) is None:
+        # A route loaded for the first time is picked up now, not at the next check
+        _refresher.wake()
+    with st.sidebar:
+        _caption(route, data)
+
+
+@st.fragment(run_every=60)
+def _caption(route, data):
+    st.caption(status(route, data))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild every route whose source changed, as the background refresher does.')
+    parser.add_argument('--once', action='store_true', help='one pass, then exit (default: keep checking)')
+    parser.add_argument('--route', action='append', help='route to rebuild (default: every route)')
+    parser.add_argument('--prerender', action='store_true', help='also draw every page\'s charts')
+    args = parser.parse_args()
+    # st.cache_resource warns about the missing script context outside a server
+    from streamlit import logger as st_logger
+    st_logger.set_log_level('error')
+    refresher = Refresher(prerender=args.prerender)
+    while True:
+        start_time = time.perf_counter()
+        rebuilt = refresher.refresh_all(args.route or data_store.available_routes())
+        for route in rebuilt:
+            print(f'{route}: published, {status(route, data_store.published(route))}')
+        for route, error in refresher.errors.items():
+            print(f'{route}: {error}')
+        if args.once:
+            print(f'{len(rebuilt)} route(s) rebuilt in {time.perf_counter() - start_time:.2f}s')
+            return
+        time.sleep(refresher.interval)
+
+
+if __name__ == '__main__':
+    main()
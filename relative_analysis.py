@@ -1,115 +1,92 @@
 # Import necessary libraries
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+
+import charts
+import cube
+import data_store
+import sections
+import sketches
 
 def display():
-    sns.set(style="whitegrid")
+    # Load the dataset
+    data = data_store.load_dataset()
 
-    # Load data function with caching
-    @st.cache_data
-    def load_data(file_path):
-        df = pd.read_excel(file_path)
-        df['dt'] = pd.to_datetime(df['dt'])
-        df['month'] = df['dt'].dt.to_period('M')
-        df['week'] = df['dt'].dt.to_period('W')
-        df['day'] = df['dt'].dt.date
-        return df
+    # Streamlit layout starts here
+    introduction()
 
-    # File path
-    file_path = 'data/Wise funnel events regional - Data.xlsx'
+    sections.render_sections(SECTIONS, data)
 
-    # Load the dataset
-    df = load_data(file_path)
 
-    # Streamlit layout starts here
-    st.title("Relative Analysis")
-    st.write("This section focuses on comparing different regions and platforms to gain insights into the performance and behavior of users in terms of transfers. ")
+def introduction(out=st):
+    out.title("Relative Analysis")
+    out.write("This section focuses on comparing different regions and platforms to gain insights into the performance and behavior of users in terms of transfers. ")
 
     # Heading 14: Relative Metrics
-    st.header("12. Relative Metrics")
+    out.header("12. Relative Metrics")
+
 
+def section_12_1(data, out=st):
     # (a) Transfer Created vs. Transfer Transferred Ratios by Region
-    st.subheader("12.1 Transfer Created vs. Transfer Transferred Ratios by Region")
-    st.write("""
+    out.subheader("12.1 Transfer Created vs. Transfer Transferred Ratios by Region")
+    out.write("""
     This pie chart compares the percentage of users who created transfers to those who completed transfers (transferred) in each region. The data shows the relative ratio, providing insight into the completion rate for each region.
     """)
 
-    transfer_created = df[df['event_name'] == 'Transfer Created'].groupby('region')['user_id'].count()
-    transfer_transferred = df[df['event_name'] == 'Transfer Transferred'].groupby('region')['user_id'].count()
+    transfer_created = cube.rollup(data.cube, 'region', event_name='Transfer Created')
+    transfer_transferred = cube.rollup(data.cube, 'region', event_name='Transfer Transferred')
     relative_ratios = (transfer_transferred / transfer_created * 100).fillna(0)
 
-    regions = relative_ratios.index
-    completed_transfers = relative_ratios.values
-    created_transfers = 100 - completed_transfers  
-
-    fig, axes = plt.subplots(1, 3, figsize=(18, 6))
-
-    for i, region in enumerate(regions):
-        sizes = [completed_transfers[i], created_transfers[i]]
-        labels = ['Completed Transfers', 'Created Transfers']
-        colors = ['#66b3ff', '#ff9a98']  
-        
-        wedges, texts, autotexts = axes[i].pie(
-            sizes, labels=labels, autopct='%1.1f%%', startangle=90, colors=colors,
-        )
-        
-        axes[i].axis('equal')
-        axes[i].set_title(f'Ratio of Transfers in {region}')
-        
-        for w in wedges:
-            w.set_edgecolor('white')
-    st.pyplot(fig)
-
-    st.markdown("""
+    transfer_ratios = pd.DataFrame({
+        'Completed Transfers': relative_ratios,
+        'Created Transfers': 100 - relative_ratios,
+    })
+    colors = ['#66b3ff', '#ff9a98']
+    charts.pies('12.1-transfer-ratios', transfer_ratios, figsize=(18, 6), colors=colors, title_template='Ratio of Transfers in {}', out=out)
+
+    out.markdown("""
     ##### Insight:
     - The European and Other regions have less than 25% completed transfer ratios compared to created transfers. This indicates significant issues, possibly related to server issues or partner bank conversion delays.
     - North America also faces a lower completion rate of 32%, though the number of transfers is relatively lower, suggesting that this region may also need further attention in improving transfer completion.
     """)
 
+
+def section_12_2(data, out=st):
     # (b) Platform Preferences per Region (Relative Percentages)
-    st.subheader("12.2 Platform Preferences per Region (Relative Percentages)")
-    st.write("""
+    out.subheader("12.2 Platform Preferences per Region (Relative Percentages)")
+    out.write("""
     This bar chart displays the platform preferences for each region as relative percentages. 
     It helps in understanding platform popularity in different regions.
     """)
 
-    platform_region_counts = pd.crosstab(df['platform'], df['region'], normalize='columns') * 100
+    platform_region_counts = cube.rollup(data.cube, ['platform', 'region']).unstack(fill_value=0)
+    platform_region_counts = platform_region_counts / platform_region_counts.sum() * 100
 
-    fig, ax = plt.subplots(figsize=(10, 6))
-    platform_region_counts.plot(kind='bar', colormap='viridis', figsize=(10, 6), ax=ax)
-    plt.title('Platform Preferences by Region (Relative)')
-    plt.ylabel('Percentage')
-    plt.xlabel('Platform')
-    plt.legend(title='Region')
-    plt.xticks(rotation=45)
-    st.pyplot(fig)
+    charts.bar('12.2-platform-preferences', platform_region_counts, figsize=(10, 6), colormap='viridis', title='Platform Preferences by Region (Relative)', ylabel='Percentage', xlabel='Platform', legend_title='Region', rotation=45, out=out)
 
-    st.markdown("""
+    out.markdown("""
     ##### Insight:
     - In the Other region, approximately 50% of transfers are made from Android, indicating that Android support should be improved in these areas.
     - In both North America and Europe, iOS holds more than 40% of the share, suggesting that continued development on iOS platforms is crucial in these regions.
     """)
 
+
+def section_12_3(data, out=st):
     # (c) Regional Demand Share
-    st.subheader("12.3 Regional Demand Share")
-    st.write("""
+    out.subheader("12.3 Regional Demand Share")
+    out.write("""
     The pie chart below illustrates the share of demand for transfers across different regions, based on the number of users who created a transfer.
     """)
 
-    regional_demand_share = df[df['event_name'] == 'Transfer Created'].groupby('region')['user_id'].nunique()
+    regional_demand_share = sketches.unique_users(data, 'region', event_name='Transfer Created')
 
-    fig, ax = plt.subplots(figsize=(8, 5))
-    regional_demand_share.plot(kind='pie', autopct='%1.1f%%', colors=sns.color_palette('pastel'), title='Regional Demand Share', ax=ax)
-    plt.ylabel('') 
-    st.pyplot(fig)
+    charts.pie('12.3-regional-demand-share', regional_demand_share, figsize=(8, 5), palette='pastel', title='Regional Demand Share', out=out)
 
-    st.markdown("""
+    out.markdown("""
     ##### Insight:
     - Europe and Other regions have a higher share of demand, each accounting for around 38% of the total demand. This indicates that services in these regions should be enhanced to meet growing user demand.
     - Despite the MXN-USD route being North American, its demand share is only about 23%, which suggests that more research is needed to understand the factors contributing to this lower demand.
-    """)
\ No newline at end of file
+    """)
+
+
+SECTIONS = [section_12_1, section_12_2, section_12_3]
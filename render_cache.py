@@ -0,0 +1,58 @@
+# Process-wide LRU cache of encoded chart images and Plotly figures
+import threading
+from collections import OrderedDict
+
+import config
+
+
+class RenderCache:
+    """Encoded figures keyed by chart, data fingerprint, theme and size.
+
+    Entries are evicted least-recently-used first once the stored bytes
+    exceed `max_bytes`. Payloads other than bytes are stored with the `size`
+    they are given.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, payload, size=None):
+        size = len(payload) if size is None else size
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (payload, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'hits': self.hits, 'misses': self.misses}
+
+
+cache = RenderCache(config.RENDER_CACHE_MB * 1024 * 1024)
@@ -0,0 +1,183 @@
+# Headless report: every analysis page rendered to a static HTML bundle
+#
+#   python report.py --route MXN-USD --output reports/nightly --workers 4
+#
+# Sections write into a sections.Recorder instead of Streamlit and run in a
+# process pool, one task per section. The recorded calls are then turned into
+# index.html with the charts as PNG files and the chart exports as CSV files
+# next to it. Per-section wall times are printed and saved as timings.json.
+import argparse
+import html
+import json
+import os
+import textwrap
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import markdown
+from streamlit import logger as st_logger
+
+import cohort_analysis
+import comparative_analysis
+import config
+import data_store
+import demand_analysis
+import detailed_analysis
+import home
+import individual_analysis
+import relative_analysis
+import sections
+import timing_analysis
+
+PAGES = [
+    ("Home", home),
+    ("Individual Analysis", individual_analysis),
+    ("Comparative Analysis", comparative_analysis),
+    ("Demand Analysis", demand_analysis),
+    ("Relative Analysis", relative_analysis),
+    ("Detailed Analysis", detailed_analysis),
+    ("Cohort Analysis", cohort_analysis),
+    ("Conversion Timing", timing_analysis),
+]
+
+STYLE = """
+body { font-family: sans-serif; max-width: 1200px; margin: 2em auto; padding: 0 1em; line-height: 1.5; }
+img { max-width: 100%; }
+.columns { display: flex; gap: 1em; }
+.columns > div { flex: 1; min-width: 0; }
+nav a { margin-right: 1em; }
+"""
+
+# Dataset shared by the sections run in this process
+_data = None
+
+
+def _init_worker(data):
+    global _data
+    _data = data
+
+
+def run_section(section):
+    """Recorded output of one section and its wall time in seconds."""
+    start = time.perf_counter()
+    out = sections.record(section, _data)
+    return out, time.perf_counter() - start
+
+
+class HtmlWriter:
+    """Turns recorded Streamlit calls into HTML, saving binary payloads as files."""
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.assets = 0
+        self.plotly_loaded = False
+        os.makedirs(os.path.join(output_dir, 'assets'), exist_ok=True)
+
+    def _save(self, payload, extension):
+        self.assets += 1
+        name = os.path.join('assets', f'{self.assets:03d}.{extension}')
+        with open(os.path.join(self.output_dir, name), 'wb') as f:
+            f.write(payload)
+        return name
+
+    def render(self, recorder):
+        return '\n'.join(self._render_call(*call) for call in recorder.calls)
+
+    def _render_call(self, name, args, kwargs, children):
+        if name in ('title', 'header', 'subheader'):
+            level = {'title': 1, 'header': 2, 'subheader': 3}[name]
+            return f'<h{level}>{html.escape(args[0])}</h{level}>'
+        if name in ('markdown', 'write'):
+            if isinstance(args[0], str):
+                return markdown.markdown(textwrap.dedent(args[0]).strip())
+            return f'<pre>{html.escape(str(args[0]))}</pre>'
+        if name == 'image':
+            return f'<img src="{self._save(args[0], "png")}">'
+        if name == 'dataframe':
+            return args[0].to_html(border=0)
+        if name == 'plotly_chart':
+            include = 'cdn' if not self.plotly_loaded else False
+            self.plotly_loaded = True
+            return args[0].to_html(full_html=False, include_plotlyjs=include)
+        if name == 'download_button':
+            data = kwargs['data']
+            data = data() if callable(data) else data
+            data = data.encode() if isinstance(data, str) else data
+            path = self._save(data, kwargs.get('file_name', 'download').rsplit('.', 1)[-1])
+            return f'<p><a href="{path}" download="{html.escape(kwargs.get("file_name", ""))}">{html.escape(args[0])}</a></p>'
+        if name == 'columns':
+            inner = ''.join(f'<div>{self.render(child)}</div>' for child in children)
+            return f'<div class="columns">{inner}</div>'
+        return f'<!-- {name} is not rendered in the static report -->'
+
+
+def build_report(output_dir, route=None, workers=None):
+    """Render every page of one route into `output_dir`; returns the per-section timings."""
+    route = route or config.DEFAULT_ROUTE
+    data = data_store.load_dataset(route)
+    tasks = [(title, section) for title, module in PAGES for section in getattr(module, 'SECTIONS', [])]
+
+    start = time.perf_counter()
+    if workers == 1:
+        _init_worker(data)
+        results = [run_section(section) for _, section in tasks]
+    else:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(data,)) as pool:
+            results = list(pool.map(run_section, [section for _, section in tasks]))
+    elapsed = time.perf_counter() - start
+
+    writer = HtmlWriter(output_dir)
+    recorded = dict(zip([section for _, section in tasks], results))
+    body, nav = [], []
+    for page_index, (title, module) in enumerate(PAGES):
+        anchor = f'page-{page_index}'
+        nav.append(f'<a href="#{anchor}">{html.escape(title)}</a>')
+        intro = sections.Recorder()
+        module.introduction(intro)
+        body.append(f'<section id="{anchor}">{writer.render(intro)}')
+        for section in getattr(module, 'SECTIONS', []):
+            body.append(writer.render(recorded[section][0]))
+        body.append('</section><hr>')
+
+    with open(os.path.join(output_dir, 'index.html'), 'w') as f:
+        f.write(
+            '<!DOCTYPE html>\n<html><head><meta charset="utf-8">'
+            f'<title>{html.escape(route)} route analysis report</title><style>{STYLE}</style></head>\n'
+            f'<body><h1>Wise internal data analysis for {html.escape(route)} route</h1>\n<nav>{" ".join(nav)}</nav>\n' + '\n'.join(body) + '\n</body></html>\n'
+        )
+
+    timings = {
+        'sections': [
+            {'page': title, 'section': section.__name__, 'seconds': round(seconds, 4)}
+            for (title, section), (_, seconds) in zip(tasks, results)
+        ],
+        'route': route,
+        'wall_seconds': round(elapsed, 4),
+        'workers': workers or os.cpu_count(),
+    }
+    with open(os.path.join(output_dir, 'timings.json'), 'w') as f:
+        json.dump(timings, f, indent=2)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render all analysis pages to a static HTML/PNG report without a Streamlit server.')
+    parser.add_argument('--output', default=os.path.join(data_store.BASE_DIR, 'report'))
+    parser.add_argument('--route', default=config.DEFAULT_ROUTE)
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU; 1 runs serially)')
+    args = parser.parse_args()
+
+    # st.cache_resource warns about the missing script context outside a server
+    st_logger.set_log_level('error')
+    timings = build_report(args.output, args.route, args.workers)
+    for entry in timings['sections']:
+        print(f"{entry['page']:<22} {entry['section']:<14} {entry['seconds']:7.2f}s")
+    serial = sum(entry['seconds'] for entry in timings['sections'])
+    print(
+        f"{len(timings['sections'])} sections in {timings['wall_seconds']:.2f}s on {timings['workers']} worker(s) "
+        f"({serial:.2f}s of section time); report written to {os.path.join(args.output, 'index.html')}"
+    )
+
+
+if __name__ == '__main__':
+    main()
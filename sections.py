@@ -0,0 +1,90 @@
+# Helpers for running the numbered sections of a page
+#
+# A section is a function `section(data, out=st)` that writes everything it
+# shows through `out`, so the same code renders into the app, into a column,
+# or into a Recorder that is replayed later (concurrent pages, headless report).
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+import config
+import instrument
+
+# One pool for every session of the process, created on first use
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _section_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(config.SECTION_WORKERS, thread_name_prefix='section')
+        return _pool
+
+
+def record(section, *args):
+    """Run a section against a Recorder instead of the page."""
+    out = Recorder()
+    section(*args, out=out)
+    return out
+
+
+def render_sections(sections, *args):
+    sections = [instrument.instrumented(section) for section in sections]
+    # tracemalloc's peak is process-wide, so sections measured concurrently
+    # would reset each other's; memory instrumentation runs them one at a time
+    threaded = not (config.INSTRUMENT and config.INSTRUMENT_MEMORY)
+    if threaded and config.SECTION_EXECUTION == 'threads' and config.SECTION_WORKERS > 1 and len(sections) > 1:
+        # Every section is computed on the pool; the page receives them in
+        # order, each as soon as it and the ones above it are done. Recorded
+        # output is static, so fragments would have nothing to rerun.
+        futures = [
+            # The copied context carries the page's open measurement along
+            _section_pool().submit(contextvars.copy_context().run, record, section, *args)
+            for section in sections
+        ]
+        for future in futures:
+            future.result().replay()
+        return
+    for section in sections:
+        if config.FRAGMENTS:
+            # A fragment reruns only its own body when a widget inside it changes
+            st.fragment(section)(*args)
+        else:
+            section(*args)
+
+
+class Recorder:
+    """Stand-in for `st` that records the calls made on it.
+
+    Columns are recorded as nested recorders. The calls can be replayed on a
+    real Streamlit container or walked by report.py; everything recorded must
+    be picklable so a recorder can come back from a worker process.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def columns(self, spec, **kwargs):
+        count = spec if isinstance(spec, int) else len(spec)
+        children = [Recorder() for _ in range(count)]
+        self.calls.append(('columns', (spec,), kwargs, children))
+        return children
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def record(*args, **kwargs):
+            self.calls.append((name, args, kwargs, None))
+        return record
+
+    def replay(self, target=st):
+        for name, args, kwargs, children in self.calls:
+            result = getattr(target, name)(*args, **kwargs)
+            if children is not None:
+                for child, container in zip(children, result):
+                    child.replay(container)
@@ -0,0 +1,190 @@
+# Mergeable HyperLogLog sketches for distinct-user counts
+import math
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+import config
+import cube
+import timekeys
+
+SKETCH_DIMENSIONS = cube.CUBE_DIMENSIONS
+
+# Bias-correction constant for m >= 128 registers
+_ALPHA_INF = 0.7213
+
+
+def precision_for_error(relative_error):
+    """Register-index bits giving roughly the requested standard error (1.04 / sqrt(m))."""
+    precision = math.ceil(math.log2((1.04 / relative_error) ** 2))
+    return min(max(precision, 7), 18)
+
+
+def hash_users(user_ids):
+    """64-bit splitmix64 hash of integer user ids."""
+    with np.errstate(over='ignore'):
+        h = np.asarray(user_ids).astype(np.int64).view(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+        h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return h ^ (h >> np.uint64(31))
+
+
+def estimate(registers):
+    """Cardinality estimate for each row of a (sketches x m) register array."""
+    registers = np.atleast_2d(registers)
+    m = registers.shape[1]
+    alpha = _ALPHA_INF / (1 + 1.079 / m)
+    raw = alpha * m * m / np.exp2(-registers.astype(np.float64)).sum(axis=1)
+    zeros = (registers == 0).sum(axis=1)
+    # Linear counting is more accurate while many registers are still empty
+    small = (raw <= 2.5 * m) & (zeros > 0)
+    linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where(small, linear, raw)
+
+
+class UserSketches:
+    """One HyperLogLog register array per cube bucket.
+
+    Registers merge with an element-wise max, so distinct users over any set
+    of days, regions, platforms, experiences or events come from the stored
+    sketches without revisiting the events.
+
+    Most buckets see far fewer users than there are registers, so, as in
+    HyperLogLog++'s sparse mode, a bucket keeps only its set registers as
+    (slot, rank) pairs while that is smaller than the dense array; `dense_rows`
+    points the other buckets at their row of `dense` (-1 for sparse ones).
+    """
+
+    def __init__(self, keys, precision, offsets, slots, ranks, dense_rows, dense):
+        self.keys = keys
+        self.precision = precision
+        # Bucket i's sparse registers are slots/ranks[offsets[i]:offsets[i + 1]]
+        self.offsets = offsets
+        self.slots = slots
+        self.ranks = ranks
+        self.dense_rows = dense_rows
+        self.dense = dense
+
+    @property
+    def relative_error(self):
+        return 1.04 / math.sqrt(1 << self.precision)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.offsets, self.slots, self.ranks, self.dense_rows, self.dense))
+
+    @classmethod
+    def build(cls, df, user_ids, precision):
+        m = 1 << precision
+        grouper = df.groupby(['day', 'region', 'platform', 'experience', 'event_name'], observed=True, sort=True)
+        bucket = grouper.ngroup().to_numpy(dtype=np.int64)
+        keys = grouper.size().index.to_frame(index=False)
+        keys['day'] = timekeys.to_dates(keys['day'])
+        keys = cube.add_period_keys(keys)
+
+        # Hash the original ids (once per distinct user) so sketches built from
+        # different loads of the same users stay mergeable
+        h = hash_users(user_ids)[df['user'].to_numpy()]
+        index = (h >> np.uint64(64 - precision)).astype(np.int64)
+        # Rank of the first set bit in the next 32 hash bits (33 when all are zero)
+        rest = ((h << np.uint64(precision)) >> np.uint64(32)).astype(np.float64)
+        rank = (33 - np.frexp(rest)[1]).astype(np.uint8)
+
+        # The highest rank of every set register, ordered by bucket and slot
+        cell = bucket * m + index
+        order = np.lexsort((rank, cell))
+        last = np.r_[cell[order][1:] != cell[order][:-1], True]
+        cell, rank = cell[order][last], rank[order][last]
+        bucket, slot = cell // m, cell % m
+
+        slot_type = np.uint16 if precision <= 16 else np.uint32
+        counts = np.bincount(bucket, minlength=len(keys))
+        is_dense = counts * (np.dtype(slot_type).itemsize + 1) >= m
+        dense_rows = np.where(is_dense, np.cumsum(is_dense) - 1, -1)
+        dense = np.zeros((int(is_dense.sum()), m), dtype=np.uint8)
+        in_dense = is_dense[bucket]
+        dense[dense_rows[bucket[in_dense]], slot[in_dense]] = rank[in_dense]
+        offsets = np.r_[0, np.cumsum(np.where(is_dense, 0, counts))]
+        return cls(keys, precision, offsets, slot[~in_dense].astype(slot_type), rank[~in_dense], dense_rows, dense)
+
+    @classmethod
+    def concat(cls, parts):
+        """Sketches of disjoint buckets (e.g. one set per day) side by side."""
+        parts = [part for part in parts if len(part.keys)] or parts[:1]
+        if len(parts) == 1:
+            return parts[0]
+        keys = {}
+        for column in parts[0].keys.columns:
+            values = [part.keys[column] for part in parts]
+            if isinstance(values[0].dtype, pd.CategoricalDtype):
+                keys[column] = union_categoricals(values, sort_categories=True)
+            else:
+                keys[column] = pd.concat(values, ignore_index=True)
+        entries = np.cumsum([0] + [len(part.slots) for part in parts])
+        rows = np.cumsum([0] + [len(part.dense) for part in parts])
+        return cls(
+            pd.DataFrame(keys),
+            parts[0].precision,
+            np.r_[0, np.concatenate([part.offsets[1:] + start for part, start in zip(parts, entries)])],
+            np.concatenate([part.slots for part in parts]),
+            np.concatenate([part.ranks for part in parts]),
+            np.concatenate([np.where(part.dense_rows >= 0, part.dense_rows + start, -1) for part, start in zip(parts, rows)]),
+            np.concatenate([part.dense for part in parts]),
+        )
+
+    def _entries(self, buckets):
+        """Positions of the sparse registers of `buckets`, and how many each has."""
+        lengths = self.offsets[buckets + 1] - self.offsets[buckets]
+        ends = np.cumsum(lengths)
+        positions = np.arange(ends[-1] if len(ends) else 0) + np.repeat(self.offsets[buckets] - (ends - lengths), lengths)
+        return positions, lengths
+
+    def select(self, mask):
+        """Sketches of only the buckets where `mask` holds."""
+        buckets = np.flatnonzero(mask)
+        positions, lengths = self._entries(buckets)
+        dense_rows = self.dense_rows[buckets]
+        is_dense = dense_rows >= 0
+        return UserSketches(
+            self.keys[mask].reset_index(drop=True),
+            self.precision,
+            np.r_[0, np.cumsum(lengths)],
+            self.slots[positions],
+            self.ranks[positions],
+            np.where(is_dense, np.cumsum(is_dense) - 1, -1),
+            self.dense[dense_rows[is_dense]],
+        )
+
+    def _merge(self, buckets, groups, n_groups):
+        """Merged registers, one row per group, of `buckets` labelled with `groups`."""
+        merged = np.zeros((n_groups, 1 << self.precision), dtype=np.uint8)
+        dense_rows = self.dense_rows[buckets]
+        is_dense = dense_rows >= 0
+        if is_dense.any():
+            order = np.argsort(groups[is_dense], kind='stable')
+            dense_groups = groups[is_dense][order]
+            starts = np.flatnonzero(np.r_[True, np.diff(dense_groups) != 0])
+            merged[dense_groups[starts]] = np.maximum.reduceat(self.dense[dense_rows[is_dense][order]], starts, axis=0)
+        positions, lengths = self._entries(buckets)
+        np.maximum.at(merged, (np.repeat(groups, lengths), self.slots[positions]), self.ranks[positions])
+        return merged
+
+    def merge(self, **where):
+        """Single merged register array for every bucket matching `where`."""
+        buckets = cube.select(self.keys, **where).index.to_numpy()
+        return self._merge(buckets, np.zeros(len(buckets), dtype=np.int64), 1)[0]
+
+    def unique_users(self, by, **where):
+        """Estimated distinct users grouped by `by`, optionally filtered by `where`."""
+        selected = cube.select(self.keys, **where)
+        groups = selected.groupby(by, observed=True, sort=True)
+        merged = self._merge(selected.index.to_numpy(), groups.ngroup().to_numpy(), groups.ngroups)
+        return pd.Series(np.round(estimate(merged)), index=groups.size().index, name='user_id')
+
+
+def unique_users(data, by, **where):
+    """Distinct users grouped by `by`: exact from the dataset, or from the sketches."""
+    if config.UNIQUE_USERS == 'sketch':
+        return data.sketches.unique_users(by, **where)
+    return data.unique_users(by, **where)
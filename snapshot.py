@@ -0,0 +1,135 @@
+# Immutable memory-mapped snapshots of the typed event table
+#
+# A loaded dataset is published once as a directory of .npy columns (codes for
+# the categorical ones) plus its cube, and every Streamlit process attaches to
+# it with np.load(mmap_mode='r'). The frames they build wrap the mapped arrays
+# without copying, so all processes and sessions share one copy of the events
+# through the OS page cache. Each source has a `<name>.current` pointer file
+# naming its live snapshot; a new build is written to its own directory and
+# the pointer is swapped with an atomic rename. Processes still mapping an
+# older snapshot keep reading it until they reload: its files are only
+# unlinked, and stay valid while mapped.
+#
+#   python snapshot.py                           # publish the default route and report memory
+import argparse
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+
+import config
+import cube
+
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', '.cache', 'snapshots')
+
+# Snapshots kept per source besides the current one, for processes still on them
+KEEP_PREVIOUS = 1
+
+
+def _pointer_path(name, snapshot_dir):
+    return os.path.join(snapshot_dir, f'{name}.current')
+
+
+def current(name, snapshot_dir=SNAPSHOT_DIR):
+    """Metadata of the source's live snapshot, or None."""
+    try:
+        with open(_pointer_path(name, snapshot_dir)) as f:
+            directory = os.path.join(snapshot_dir, f.read().strip())
+        with open(os.path.join(directory, 'meta.json')) as f:
+            return dict(json.load(f), directory=directory)
+    except (OSError, ValueError):
+        return None
+
+
+def publish(name, key, events, user_ids, cells, snapshot_dir=SNAPSHOT_DIR):
+    """Write a snapshot of a dataset's events and make it the source's current one.
+
+    `key` identifies the source version (e.g. the file fingerprint);
+    attach() only serves a snapshot whose key matches.
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+    directory = os.path.join(snapshot_dir, f'{name}-{uuid.uuid4().hex[:12]}')
+    tmp_dir = directory + '.tmp'
+    os.makedirs(tmp_dir)
+    columns = []
+    for column in events.columns:
+        values = events[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            np.save(os.path.join(tmp_dir, f'{column}.npy'), values.cat.codes.to_numpy())
+            columns.append({'name': column, 'categories': [str(value) for value in values.cat.categories]})
+        else:
+            np.save(os.path.join(tmp_dir, f'{column}.npy'), values.to_numpy())
+            columns.append({'name': column})
+    np.save(os.path.join(tmp_dir, 'user_ids.npy'), np.asarray(user_ids))
+    cells[cube.CUBE_DIMENSIONS + ['count']].to_parquet(os.path.join(tmp_dir, 'cube.parquet'), index=False)
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump({'name': name, 'key': key, 'rows': len(events), 'columns': columns}, f)
+    os.rename(tmp_dir, directory)
+
+    pointer = _pointer_path(name, snapshot_dir)
+    with open(pointer + '.tmp', 'w') as f:
+        f.write(os.path.basename(directory))
+    os.replace(pointer + '.tmp', pointer)
+    _prune(name, os.path.basename(directory), snapshot_dir)
+    return directory
+
+
+def _prune(name, live, snapshot_dir):
+    """Remove the source's snapshots older than the KEEP_PREVIOUS most recent ones."""
+    older = [
+        entry for entry in os.scandir(snapshot_dir)
+        if entry.is_dir() and entry.name.startswith(f'{name}-') and entry.name != live and not entry.name.endswith('.tmp')
+    ]
+    older.sort(key=lambda entry: entry.stat().st_mtime_ns, reverse=True)
+    for entry in older[KEEP_PREVIOUS:]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def attach(name, key, snapshot_dir=SNAPSHOT_DIR):
+    """(events, user_ids, cube) mapped from the current snapshot, or None if it is missing or stale.
+
+    The event columns and user ids are read-only views of the mapped files.
+    """
+    meta = current(name, snapshot_dir)
+    if meta is None or meta['key'] != key:
+        return None
+    directory = meta['directory']
+    columns = {}
+    for column in meta['columns']:
+        values = np.load(os.path.join(directory, f"{column['name']}.npy"), mmap_mode='r')
+        if 'categories' in column:
+            values = pd.Categorical.from_codes(values, pd.Index(column['categories']))
+        columns[column['name']] = values
+    events = pd.DataFrame(columns, copy=False)
+    user_ids = np.load(os.path.join(directory, 'user_ids.npy'), mmap_mode='r')
+    cells = pd.read_parquet(os.path.join(directory, 'cube.parquet'))
+    for column in cube.CUBE_DIMENSIONS[1:]:
+        cells[column] = cells[column].astype('category')
+    return events, user_ids, cube.add_period_keys(cells)
+
+
+def proportional_memory():
+    """This process's proportional set size in bytes (shared pages split between their users)."""
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            if line.startswith('Pss:'):
+                return int(line.split()[1]) * 1024
+    return None
+
+
+def main():
+    import data_store
+    parser = argparse.ArgumentParser(description="Publish a route's snapshot (if stale) and report this process's memory.")
+    parser.add_argument('--route', default=config.DEFAULT_ROUTE)
+    args = parser.parse_args()
+    before = proportional_memory()
+    dataset = data_store.load_dataset(args.route)
+    print(f"{len(dataset.events):,} events, memory-mapped: {not dataset.events['user'].to_numpy().flags.writeable}")
+    print(f"proportional memory: {before / 2 ** 20:.1f} MiB before loading, {proportional_memory() / 2 ** 20:.1f} MiB after")
+
+
+if __name__ == '__main__':
+    main()
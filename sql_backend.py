@@ -0,0 +1,267 @@
+# Optional DuckDB query backend over the columnar files
+#
+# With ROUTE_APP_BACKEND=duckdb (and the duckdb package installed) the events
+# are never loaded into pandas. The cube, the ordered funnels and the
+# distinct-user counts run as SQL straight over the store's parquet parts (or
+# the workbook's columnar cache): DuckDB reads only the columns a query uses,
+# skips row groups and date partitions its filters exclude, and spreads each
+# query over all cores. Results are the same as the pandas path's.
+import threading
+from collections import OrderedDict
+from functools import cached_property
+
+import pandas as pd
+
+import cohorts
+import config
+import cube
+import funnel
+import latency
+import timekeys
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# Columns a `where` filter may refer to
+FILTER_COLUMNS = ['event_name', 'region', 'platform', 'experience', 'day']
+
+# Filtered datasets kept per dataset, each with its own connection
+_CACHED_VIEWS = 8
+
+
+def _literal(text):
+    return "'" + text.replace("'", "''") + "'"
+
+
+class SqlDataset:
+    """Dataset answering the section queries with SQL over parquet files.
+
+    `hive_partitioned` sources expose their `date=YYYY-MM-DD` directories as a
+    `date` column, which day filters use so whole partitions are skipped.
+    """
+
+    route = None
+
+    def __init__(self, paths, hive_partitioned=False, selection=None):
+        if duckdb is None:
+            raise ImportError('ROUTE_APP_BACKEND=duckdb needs the duckdb package (pip install duckdb)')
+        self.paths = list(paths)
+        self.hive_partitioned = hive_partitioned
+        self.selection = selection
+        self._connection = duckdb.connect()
+        files = '[' + ', '.join(_literal(path) for path in self.paths) + ']'
+        condition = f' WHERE {selection.sql(hive_partitioned)}' if selection else ''
+        self._connection.execute(
+            f'CREATE VIEW events AS SELECT * FROM read_parquet({files}, hive_partitioning = {str(hive_partitioned).lower()}, '
+            f'filename = true, file_row_number = true){condition}'
+        )
+        self._results = {}
+        self._views = OrderedDict()
+        self._unfiltered = None
+        self._lock = threading.Lock()
+
+    def query(self, sql, params=()):
+        # A cursor per query: one DuckDB connection must not be shared between threads
+        return self._connection.cursor().execute(sql, list(params)).df()
+
+    def _where(self, where):
+        clauses, params = [], []
+        for column, value in where.items():
+            if column not in FILTER_COLUMNS:
+                raise ValueError(f'Cannot filter on {column!r}')
+            values = list(value) if isinstance(value, (list, tuple, set, pd.Index)) else [value]
+            if column == 'day':
+                values = [str(pd.Timestamp(day).date()) for day in values]
+                column = 'date' if self.hive_partitioned else 'CAST(CAST(dt AS DATE) AS VARCHAR)'
+            clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params += values
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    def _cached(self, key, compute):
+        with self._lock:
+            if key in self._results:
+                return self._results[key]
+        result = compute()
+        with self._lock:
+            self._results[key] = result
+        return result
+
+    def filtered(self, selection):
+        """The same files seen through `selection` (a filters.Filters) as a WHERE clause."""
+        if not selection:
+            return self
+        with self._lock:
+            view = self._views.get(selection)
+            if view is not None:
+                self._views.move_to_end(selection)
+                return view
+        view = SqlDataset(self.paths, self.hive_partitioned, selection)
+        view._unfiltered = self
+        with self._lock:
+            self._views[selection] = view
+            while len(self._views) > _CACHED_VIEWS:
+                self._views.popitem(last=False)
+        return view
+
+    @cached_property
+    def cube(self):
+        cells = self.query(
+            'SELECT CAST(dt AS DATE) AS day, region, platform, experience, event_name, count(*) AS count '
+            'FROM events GROUP BY ALL ORDER BY day, region, platform, experience, event_name'
+        )
+        cells['day'] = timekeys.to_dates(timekeys.day_keys(cells['day']))
+        for column in cube.CUBE_DIMENSIONS[1:]:
+            cells[column] = cells[column].astype('category')
+        return cube.add_period_keys(cells)
+
+    @cached_property
+    def funnel(self):
+        return SqlFunnel(self)
+
+    @cached_property
+    def latency(self):
+        """latency.LatencyHistograms from forward ASOF joins between consecutive stages."""
+        if self.selection:
+            # Buckets belong to the earlier event, so the later one may lie
+            # outside the filters, as in the pandas backend
+            unfiltered = self._unfiltered.latency
+            return unfiltered.select(self.selection.cell_mask(unfiltered.keys))
+        stages = funnel.STAGES
+        names = latency.transitions(stages)
+        matches = ' UNION ALL '.join(
+            f'SELECT CAST(a.dt AS DATE) AS day, a.region, a.platform, a.experience, {stage - 1} AS transition, b.t - a.t AS seconds '
+            'FROM (SELECT user_id AS u, dt, epoch_us(dt) // 1000000 AS t, region, platform, experience FROM events WHERE event_name = ?) AS a '
+            'ASOF JOIN (SELECT user_id AS u, epoch_us(dt) // 1000000 AS t FROM events WHERE event_name = ?) AS b ON a.u = b.u AND b.t >= a.t'
+            for stage in range(1, len(stages))
+        )
+        params = [name for pair in zip(stages, stages[1:]) for name in pair]
+        window = int(config.FUNNEL_WINDOW_DAYS * 86400)
+        edges = ', '.join(str(edge) for edge in latency.EDGES)
+        counts = self.query(
+            f'WITH m AS ({matches}), e AS (SELECT edge, row_number() OVER (ORDER BY edge) - 1 AS bin FROM (SELECT unnest([{edges}]) AS edge)) '
+            f'SELECT day, region, platform, experience, transition, bin, count(*) AS n FROM m ASOF JOIN e ON m.seconds >= e.edge '
+            f'WHERE m.seconds <= {window} GROUP BY ALL',
+            params,
+        ).pivot_table(index=latency.HISTOGRAM_DIMENSIONS, columns='bin', values='n', fill_value=0)
+        counts = counts.reindex(columns=range(len(latency.EDGES)), fill_value=0)
+        keys = counts.index.to_frame(index=False)
+        keys['day'] = timekeys.to_dates(timekeys.day_keys(keys['day']))
+        keys['transition'] = pd.Categorical.from_codes(keys['transition'], names)
+        for column in latency.HISTOGRAM_DIMENSIONS[1:-1]:
+            keys[column] = keys[column].astype('category')
+        return latency.LatencyHistograms(cube.add_period_keys(keys), counts.to_numpy().astype('int32'))
+
+    @cached_property
+    def sketches(self):
+        return SqlSketches(self)
+
+    def unique_users(self, by, approximate=False, **where):
+        """Distinct users grouped by `by`, optionally with DuckDB's HyperLogLog."""
+        by = [by] if isinstance(by, str) else list(by)
+        key = ('unique_users', tuple(by), approximate, tuple(sorted((k, repr(v)) for k, v in where.items())))
+
+        def compute():
+            condition, params = self._where(where)
+            count = 'approx_count_distinct(user_id)' if approximate else 'count(DISTINCT user_id)'
+            columns = ', '.join(by)
+            result = self.query(f'SELECT {columns}, {count} AS users FROM events{condition} GROUP BY ALL ORDER BY {columns}', params)
+            series = result.set_index(by)['users']
+            return series.rename('user_id' if approximate else 'user')
+        return self._cached(key, compute)
+
+    def weekly_cohorts(self, by=None):
+        """cohorts.weekly_cohorts with the cohort and split values of each user's first event."""
+        split = [] if by is None else [by] if isinstance(by, str) else list(by)
+        for column in split:
+            if column not in cohorts.COHORT_DIMENSIONS:
+                raise ValueError(f'Cannot split cohorts by {column!r}')
+        return self._cached(('weekly_cohorts', tuple(split)), lambda: self._weekly_cohorts(split))
+
+    def _weekly_cohorts(self, split):
+        week = '(epoch_us(dt) // 86400000000 + 10) // 7'
+        # Same order as FunnelIndex: time in seconds, funnel stage, then file order
+        stage = 'CASE event_name ' + ' '.join(f'WHEN {_literal(name)} THEN {code}' for code, name in enumerate(funnel.STAGES)) + ' ELSE -1 END'
+        first_values = ''.join(
+            f', arg_min({column}, (epoch_us(dt) // 1000000, {stage}, filename, file_row_number)) AS {column}' for column in split
+        )
+        columns = ''.join(f'{column}, ' for column in split)
+        sql = (
+            f'WITH e AS (SELECT user_id AS u, {week} AS week, event_name FROM events), '
+            f'c AS (SELECT user_id AS u, min({week}) AS cohort{first_values} FROM events GROUP BY user_id) '
+            f'SELECT {columns}cohort, week - cohort AS weeks_since, count(DISTINCT u) AS users, '
+            'count(*) FILTER (WHERE event_name = ?) AS volume '
+            f'FROM e JOIN c USING (u) GROUP BY ALL ORDER BY ALL'
+        )
+        result = self.query(sql, [cohorts.VOLUME_EVENT])
+        for column in split:
+            result[column] = result[column].astype('category')
+        result['cohort'] = timekeys.to_periods(result['cohort'], 'W')
+        return result.set_index(split + ['cohort', 'weeks_since'])[['users', 'volume']].astype('int64')
+
+
+class SqlSketches:
+    """Sketch-mode distinct users, computed by DuckDB's approx_count_distinct."""
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def unique_users(self, by, **where):
+        return self.dataset.unique_users(by, approximate=True, **where)
+
+
+class SqlFunnel:
+    """FunnelIndex.conversion as one SQL query.
+
+    Entry is a user's first stage-one event; every later stage is the first
+    matching event no earlier than the previous stage and within the window
+    of entry, exactly as in funnel.FunnelIndex. Events are grouped by user in
+    a single pass, with the times of each later stage collected as a list
+    that the following steps filter.
+    """
+
+    def __init__(self, dataset, stage_names=funnel.STAGES):
+        self.dataset = dataset
+        self.stage_names = list(stage_names)
+
+    def conversion(self, by=None, window_days=None):
+        if window_days is None:
+            window_days = config.FUNNEL_WINDOW_DAYS
+        split = [] if by is None else [by] if isinstance(by, str) else list(by)
+        for column in split:
+            if column not in funnel.FUNNEL_DIMENSIONS:
+                raise ValueError(f'Cannot split a funnel by {column!r}')
+        key = ('funnel', tuple(split), window_days)
+        return self.dataset._cached(key, lambda: self._conversion(split, int(window_days * 86400)))
+
+    def _conversion(self, split, window):
+        stages = self.stage_names
+        time = 'epoch_us(dt) // 1000000'
+        # Ties between a user's simultaneous entry events go to the first one in
+        # file order, as in FunnelIndex's stable sort
+        aggregates = [f'min({time}) FILTER (WHERE event_name = ?) AS t0']
+        aggregates += [f'arg_min({column}, ({time}, filename, file_row_number)) FILTER (WHERE event_name = ?) AS {column}' for column in split]
+        aggregates += [f'list({time}) FILTER (WHERE event_name = ?) AS l{stage}' for stage in range(1, len(stages))]
+        params = [stages[0]] * (1 + len(split)) + stages[1:]
+        ctes = [
+            f"x0 AS (SELECT {', '.join(aggregates)} FROM events "
+            f"WHERE event_name IN ({', '.join('?' * len(stages))}) GROUP BY user_id HAVING t0 IS NOT NULL)"
+        ]
+        params += stages
+        for stage in range(1, len(stages)):
+            ctes.append(
+                f'x{stage} AS (SELECT *, list_min(list_filter(l{stage}, x -> x >= t{stage - 1} AND x <= t0 + {window})) '
+                f'AS t{stage} FROM x{stage - 1})'
+            )
+        counts = ', '.join(f'count(t{stage})' for stage in range(len(stages)))
+        sql = f"WITH {', '.join(ctes)} SELECT {''.join(f'{column}, ' for column in split)}{counts} FROM x{len(stages) - 1}"
+        if split:
+            sql += f" GROUP BY {', '.join(split)} ORDER BY {', '.join(split)}"
+        result = self.dataset.query(sql, params)
+        result.columns = split + stages
+        if not split:
+            return pd.Series({name: int(result[name].iloc[0]) for name in stages})
+        for column in split:
+            result[column] = result[column].astype('category')
+        return result.set_index(split)[stages].astype('int64')
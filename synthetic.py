@@ -0,0 +1,102 @@
+# Synthetic event generator with the workbook's schema, for benchmarks
+#
+# Users get a region, platform and experience from the marginal shares of the
+# real data, create one or more transfers, and drop out of the funnel at the
+# per-region rates observed there (Europe funds far less often than NorthAm).
+# Events are produced in chunks of users so any size can be written to
+# parquet in bounded memory.
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import data_store
+import funnel
+
+REGIONS = ['Europe', 'NorthAm', 'Other']
+REGION_SHARES = [0.38, 0.23, 0.39]
+PLATFORMS = ['Android', 'Web', 'iOS']
+PLATFORM_SHARES = [0.39, 0.29, 0.32]
+EXPERIENCES = ['Existing', 'New']
+EXPERIENCE_SHARES = [0.38, 0.62]
+
+# Share of creating users who fund, and of funding users who complete, per region
+FUNDED_RATE = np.array([0.25, 0.48, 0.41])
+TRANSFERRED_RATE = np.array([0.95, 0.68, 0.55])
+
+# Extra transfers created per user (Poisson mean)
+EXTRA_CREATED = 0.07
+# Events per user in the workbook, used to size chunks
+EVENTS_PER_USER = 1.73
+
+START = pd.Timestamp('2024-01-01')
+DAYS = 61
+
+
+def _day_weights(days):
+    # Activity grows over the period, as it does from January to February
+    weights = np.linspace(0.75, 1.25, days)
+    return weights / weights.sum()
+
+
+def generate_chunk(users, first_user, rng, days=DAYS):
+    """Events of `users` consecutive users starting at id `first_user`."""
+    region = rng.choice(len(REGIONS), users, p=REGION_SHARES)
+    platform = rng.choice(len(PLATFORMS), users, p=PLATFORM_SHARES)
+    experience = rng.choice(len(EXPERIENCES), users, p=EXPERIENCE_SHARES)
+    first_day = rng.choice(days, users, p=_day_weights(days))
+
+    created = np.repeat(np.arange(users), 1 + rng.poisson(EXTRA_CREATED, users))
+    repeat = np.r_[False, created[1:] == created[:-1]]
+    created_day = first_day[created] + np.where(repeat, rng.integers(0, 14, len(created)), 0)
+    funded = np.flatnonzero(rng.random(users) < FUNDED_RATE[region])
+    funded_day = first_day[funded] + rng.geometric(0.6, len(funded)) - 1
+    completed = rng.random(len(funded)) < TRANSFERRED_RATE[region[funded]]
+    transferred = funded[completed]
+    transferred_day = funded_day[completed] + rng.geometric(0.7, len(transferred)) - 1
+
+    user = np.concatenate([created, funded, transferred])
+    stage = np.repeat(np.arange(3, dtype=np.int8), [len(created), len(funded), len(transferred)])
+    day = np.minimum(np.concatenate([created_day, funded_day, transferred_day]), days - 1)
+    # Grouped by user, so trimming a chunk only cuts its last user short
+    order = np.argsort(user, kind='stable')
+    user, stage, day = user[order], stage[order], day[order]
+    return pd.DataFrame({
+        'dt': START + pd.to_timedelta(day, unit='D'),
+        'event_name': pd.Categorical.from_codes(stage, funnel.STAGES),
+        'user_id': (first_user + user).astype(np.float64),
+        'region': pd.Categorical.from_codes(region[user], REGIONS),
+        'platform': pd.Categorical.from_codes(platform[user], PLATFORMS),
+        'experience': pd.Categorical.from_codes(experience[user], EXPERIENCES),
+    })
+
+
+def generate_chunks(rows, seed=0, chunk_rows=1_000_000):
+    """Yield event frames totalling exactly `rows` rows."""
+    rng = np.random.default_rng(seed)
+    users_per_chunk = max(1, int(min(rows, chunk_rows) / EVENTS_PER_USER))
+    remaining, first_user = rows, 1
+    while remaining > 0:
+        chunk = generate_chunk(users_per_chunk, first_user, rng)
+        first_user += users_per_chunk
+        chunk = chunk.iloc[:remaining]
+        remaining -= len(chunk)
+        yield chunk
+
+
+def generate(rows, seed=0):
+    return pd.concat(generate_chunks(rows, seed), ignore_index=True)
+
+
+def write_parquet(path, rows, seed=0):
+    """Write `rows` synthetic events to parquet, one row group per chunk."""
+    schema = data_store.event_schema()
+    tmp_path = path + '.tmp'
+    with pq.ParquetWriter(tmp_path, schema) as writer:
+        for chunk in generate_chunks(rows, seed):
+            chunk = chunk[data_store.EVENT_COLUMNS].astype({'dt': 'datetime64[us]'})
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+    os.replace(tmp_path, path)
+    return path
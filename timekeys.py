@@ -0,0 +1,37 @@
+# Integer day, week and month keys derived arithmetically from timestamps
+#
+# Keys match pandas Period ordinals, so day keys convert back to dates and
+# week/month keys to Period labels only for the few values a chart shows.
+import numpy as np
+import pandas as pd
+
+
+def day_keys(dt):
+    """Days since 1970-01-01 as int32."""
+    return np.asarray(dt).astype('datetime64[D]').astype(np.int64).astype(np.int32)
+
+
+def week_keys(days):
+    """Ordinal of the Monday-to-Sunday week (pandas 'W-SUN') containing each day."""
+    return ((np.asarray(days, dtype=np.int64) + 10) // 7).astype(np.int32)
+
+
+def month_keys(days):
+    """Months since 1970-01 (pandas 'M' ordinal), via the civil-from-days algorithm."""
+    z = np.asarray(days, dtype=np.int64) + 719468
+    era = z // 146097
+    doe = z - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    month = np.where(mp < 10, mp + 3, mp - 9)
+    year = yoe + era * 400 + (month <= 2)
+    return ((year - 1970) * 12 + month - 1).astype(np.int32)
+
+
+def to_dates(days):
+    return pd.to_datetime(np.asarray(days, dtype=np.int64).astype('datetime64[D]'))
+
+
+def to_periods(keys, freq):
+    return pd.arrays.PeriodArray(np.asarray(keys, dtype=np.int64), dtype=pd.PeriodDtype(freq))
@@ -0,0 +1,164 @@
+# Cold-start warmup and startup-time report
+#
+#   python warmup.py && streamlit run app.py     # prebuild the on-disk caches, then serve
+#   python warmup.py --report                    # time imports and first renders in a fresh process
+#
+# The warmup loads every route once: workbooks are converted into their
+# columnar cache and each route's events are published as a snapshot (see
+# snapshot.py), so a new server process only attaches to them. With
+# ROUTE_APP_WARMUP=1 the app also builds every route's in-memory aggregates
+# (funnel index, sketches, latency histograms, filter bitmaps, forecasts and
+# alerts) and imports the plotting libraries once per process, at its first
+# script run, instead of on the first request of each page.
+import argparse
+import importlib
+import json
+import subprocess
+import sys
+import threading
+import time
+
+# Nothing heavier at module level: the startup report times those imports
+import config
+
+# Aggregates a dataset builds on first use, warmed in this order
+AGGREGATES = ['cube', 'funnel', 'sketches', 'latency', 'filter_index']
+
+# Modules timed by the startup report, in the order the app imports them
+IMPORT_GROUPS = [
+    ('numpy, pandas, pyarrow', ['numpy', 'pandas', 'pyarrow', 'pyarrow.parquet']),
+    ('streamlit', ['streamlit']),
+    ('data layer', ['config', 'data_store', 'filters', 'instrument', 'anomalies', 'forecast', 'refresh']),
+    ('analysis pages', [
+        'home', 'individual_analysis', 'comparative_analysis', 'demand_analysis', 'relative_analysis',
+        'detailed_analysis', 'cohort_analysis', 'timing_analysis',
+    ]),
+]
+
+# Libraries that load on the first chart needing them
+LAZY_LIBRARIES = ['matplotlib', 'seaborn', 'plotly.express']
+
+
+def warm(routes=None, aggregates=True):
+    """Load every route (or `routes`) and, with `aggregates`, build what its pages use.
+
+    Returns the seconds spent per step.
+    """
+    import charts
+    import data_store
+    import filters
+    timings = {}
+    for route in routes or data_store.available_routes():
+        start = time.perf_counter()
+        data = data_store.load_dataset(route, selection=filters.Filters())
+        timings[f'{route}: dataset'] = time.perf_counter() - start
+        if aggregates:
+            timings.update(build_aggregates(route, data))
+    if aggregates:
+        start = time.perf_counter()
+        charts.apply_theme()
+        importlib.import_module('plotly.express')
+        timings['plotting libraries'] = time.perf_counter() - start
+    return timings
+
+
+def build_aggregates(route, data):
+    """Build the aggregates, forecasts and alerts of a route's dataset; seconds per step."""
+    import anomalies
+    import forecast
+    timings = {}
+    for name in AGGREGATES:
+        if hasattr(type(data), name):
+            start = time.perf_counter()
+            getattr(data, name)
+            timings[f'{route}: {name}'] = time.perf_counter() - start
+    start = time.perf_counter()
+    forecast.demand_model(data)
+    anomalies.route_alerts(route, data)
+    timings[f'{route}: forecasts and alerts'] = time.perf_counter() - start
+    return timings
+
+
+_process_timings = None
+_process_lock = threading.Lock()
+
+
+def warm_process():
+    """warm() once per server process (ROUTE_APP_WARMUP=1); later calls return at once."""
+    global _process_timings
+    with _process_lock:
+        if _process_timings is None:
+            _process_timings = warm()
+        return _process_timings
+
+
+def measure_startup(route=None):
+    """Seconds spent on imports, loading the route and rendering each page twice.
+
+    Meant for a fresh interpreter (see startup_report): imports are only cold
+    the first time. The first render includes aggregation, drawing and any
+    plotting library it loads; the second is served from the render cache.
+    """
+    timings = {}
+    for label, modules in IMPORT_GROUPS:
+        start = time.perf_counter()
+        for module in modules:
+            importlib.import_module(module)
+        timings[f'import {label}'] = time.perf_counter() - start
+
+    import data_store
+    import filters
+    import report
+    import sections
+    route = route or config.DEFAULT_ROUTE
+    start = time.perf_counter()
+    data = data_store.load_dataset(route, selection=filters.Filters())
+    timings[f'load {route}'] = time.perf_counter() - start
+    for attempt in ('first', 'second'):
+        for title, module in report.PAGES:
+            loaded = [name for name in LAZY_LIBRARIES if name in sys.modules]
+            start = time.perf_counter()
+            for section in getattr(module, 'SECTIONS', []):
+                sections.record(section, data)
+            label = f'{attempt} render {title}'
+            imported = [name for name in LAZY_LIBRARIES if name in sys.modules and name not in loaded]
+            timings[label + (f" (imports {', '.join(imported)})" if imported else '')] = time.perf_counter() - start
+    return timings
+
+
+def startup_report(route=None):
+    """measure_startup() in a fresh interpreter, as it runs on a new server process."""
+    command = [sys.executable, __file__, '--measure']
+    if route:
+        command += ['--route', route]
+    output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prebuild the caches the app starts from, or report where startup time goes.')
+    parser.add_argument('--route', action='append', help='route to warm (default: every route); with --report, the route to load')
+    parser.add_argument('--aggregates', action='store_true', help='also build the in-memory aggregates (timing only; they do not outlive this process)')
+    parser.add_argument('--report', action='store_true', help='time imports, loading and first renders in a fresh process')
+    parser.add_argument('--output', help='write the timings as JSON')
+    parser.add_argument('--measure', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    route = args.route[0] if args.route else None
+    if args.measure:
+        print(json.dumps(measure_startup(route)))
+        return
+    # st.cache_resource warns about the missing script context outside a server
+    from streamlit import logger as st_logger
+    st_logger.set_log_level('error')
+    timings = startup_report(route) if args.report else warm(args.route, args.aggregates)
+    for step, seconds in timings.items():
+        print(f'{step:<60} {seconds:8.3f}s')
+    print(f"{'total':<60} {sum(timings.values()):8.3f}s")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(timings, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()